@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks for Pynunzen. The benchmarks return plain dictionaries
+which can be written as JSON, so the results of different releases can
+be compared with each other."""
+
+import time
+import types
+import platform
+import statistics
+import tracemalloc
+import multiprocessing
+from pynunzen import __version__
+from pynunzen.ledger.pow import search_range, find_nonce, difficulty_to_target
+from pynunzen.ledger.block import generate_block_header
+from pynunzen.ledger.transaction import Data, Output, LockScript
+
+BENCHMARK_VALUE = "Hello World!"
+"""Static value which is hashed in the benchmarks."""
+BENCHMARK_ROOT = "00" * 32
+"""Merkle root of the block headers which are hashed in the
+benchmarks."""
+
+
+def _measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _search_chunk(args):
+    value, start, stop = args
+    # A target of 0 is never met, so the full range is searched.
+    return search_range(value, None, start, stop, 0)[1]
+
+
+def _benchmark_header(sample=0):
+    # Headers of different samples differ in their timestamp.
+    return generate_block_header(None, BENCHMARK_ROOT, sample, None)
+
+
+def _distribution(values):
+    values = sorted(values)
+    return {
+        "min": values[0],
+        "max": values[-1],
+        "mean": statistics.mean(values),
+        "median": statistics.median(values),
+        "stdev": statistics.stdev(values) if len(values) > 1 else 0.0
+    }
+
+
+def _dict_class(cls):
+    """Will return a copy of the given class which keeps the attributes
+    of its instances in a __dict__ instead of slots. Only works for
+    classes which do not call methods of their base classes."""
+    skipped = ("__slots__", "__dict__", "__weakref__")
+    namespace = dict((name, value) for name, value in vars(cls).items()
+                     if name not in skipped and not isinstance(value, types.MemberDescriptorType))
+    return type(cls.__name__, (object,), namespace)
+
+
+def _traced_size(func, count):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [func(n) for n in range(count)]
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del objects
+    return size
+
+
+def environment():
+    """Will return information about the environment the benchmarks
+    are running in.
+
+    :returns: Dictionary
+    """
+    return {
+        "pynunzen": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": multiprocessing.cpu_count()
+    }
+
+
+def benchmark_hashrate(hashes=200000, value=BENCHMARK_VALUE):
+    """Will measure how many hashes per second a single process
+    generates while searching a nonce.
+
+    :hashes: Number of hashes to generate.
+    :value: Static value which is hashed together with the nonce.
+    :returns: Dictionary
+    """
+    count, elapsed = _measure(_search_chunk, (value, 0, hashes))
+    return {
+        "hashes": count,
+        "seconds": elapsed,
+        "hashes_per_second": count / elapsed
+    }
+
+
+def benchmark_solution_time(difficulty, samples=10, value=BENCHMARK_VALUE):
+    """Will measure the time needed to find a nonce for the given
+    difficulty. Each sample searches a nonce for a different value.
+
+    :difficulty: Number of trailing zero bits of the hash.
+    :samples: Number of nonces to search.
+    :value: Static value which is hashed together with the nonce.
+    :returns: Dictionary with the distribution of the times.
+    """
+    times = []
+    for sample in range(samples):
+        _, elapsed = _measure(find_nonce, "{}{}".format(value, sample), difficulty)
+        times.append(elapsed)
+    result = _distribution(times)
+    result["samples"] = samples
+    return result
+
+
+def benchmark_header_hashrate(hashes=200000):
+    """Will measure how many hashes per second a single process
+    generates while searching a nonce for a binary block header against
+    a target. This is the search used to mine blocks.
+
+    :hashes: Number of hashes to generate.
+    :returns: Dictionary
+    """
+    count, elapsed = _measure(_search_chunk, (_benchmark_header(), 0, hashes))
+    return {
+        "hashes": count,
+        "seconds": elapsed,
+        "hashes_per_second": count / elapsed
+    }
+
+
+def benchmark_header_solution_time(difficulty, samples=10):
+    """Will measure the time needed to find a nonce for a binary block
+    header which meets the target of the given difficulty. Each sample
+    searches a nonce for a different header.
+
+    :difficulty: Number of leading zero bits of the target. See
+    :func:`pynunzen.ledger.pow.difficulty_to_target`.
+    :samples: Number of nonces to search.
+    :returns: Dictionary with the distribution of the times.
+    """
+    target = difficulty_to_target(difficulty)
+    times = []
+    for sample in range(samples):
+        _, elapsed = _measure(lambda header: find_nonce(header, target=target),
+                              _benchmark_header(sample))
+        times.append(elapsed)
+    result = _distribution(times)
+    result["samples"] = samples
+    return result
+
+
+def benchmark_scaling(workers, hashes=200000, chunks_per_worker=4, value=BENCHMARK_VALUE):
+    """Will measure how many hashes per second are generated when
+    searching a fixed part of the nonce space with a pool of `workers`
+    processes.
+
+    :workers: Number of processes.
+    :hashes: Number of hashes to generate.
+    :chunks_per_worker: Number of chunks the nonce space is split into
+    per worker.
+    :value: Static value which is hashed together with the nonce.
+    :returns: Dictionary
+    """
+    nchunks = workers * chunks_per_worker
+    size = hashes // nchunks
+    chunks = [(value, n * size, (n + 1) * size) for n in range(nchunks)]
+    with multiprocessing.Pool(workers) as pool:
+        counts, elapsed = _measure(pool.map, _search_chunk, chunks)
+    count = sum(counts)
+    return {
+        "workers": workers,
+        "hashes": count,
+        "seconds": elapsed,
+        "hashes_per_second": count / elapsed
+    }
+
+
+def benchmark_header(difficulties=(8, 12, 16), samples=10, hashes=200000):
+    """Will run the benchmarks of the nonce search for binary block
+    headers and targets.
+
+    Example::
+
+        {
+            'hashrate': {'hashes': 200000, 'hashes_per_second': 512000.3, ...},
+            'solution_time': {'8': {'mean': 0.0004, 'median': 0.0003, ...}, ...}
+        }
+
+    :difficulties: Difficulties for which the time to find a nonce is
+    measured.
+    :samples: Number of nonces searched per difficulty.
+    :hashes: Number of hashes generated for the hash rate.
+    :returns: Dictionary
+    """
+    return {
+        "hashrate": benchmark_header_hashrate(hashes),
+        "solution_time": dict((str(difficulty), benchmark_header_solution_time(difficulty, samples))
+                              for difficulty in difficulties)
+    }
+
+
+def benchmark_memory(count=100000):
+    """Will measure the memory needed to hold `count` transaction
+    outputs. The outputs are built once from the slotted ledger classes
+    and once from copies of the classes which keep their attributes in
+    a __dict__.
+
+    :count: Number of outputs.
+    :returns: Dictionary
+    """
+    address = "1NcDeJ1JiXBrKrhk8wSbpkc1gFfSiPXY7a"
+    DictData, DictOutput, DictLockScript = [_dict_class(cls) for cls in (Data, Output, LockScript)]
+    slots = _traced_size(lambda n: Output(Data(n), LockScript(address)), count)
+    dicts = _traced_size(lambda n: DictOutput(DictData(n), DictLockScript(address)), count)
+    return {
+        "outputs": count,
+        "slots_bytes_per_output": slots / count,
+        "dict_bytes_per_output": dicts / count,
+        "ratio": slots / dicts
+    }
+
+
+def benchmark_pow(difficulties=(8, 12, 16), samples=10, workers=(1, 2, 4), hashes=200000):
+    """Will run all proof of work benchmarks.
+
+    Example::
+
+        {
+            'hashrate': {'hashes': 200000, 'hashes_per_second': 463000.1, ...},
+            'solution_time': {'8': {'mean': 0.0005, 'median': 0.0004, ...}, ...},
+            'scaling': [{'workers': 1, 'hashes_per_second': 451000.7, ...}, ...]
+        }
+
+    :difficulties: Difficulties for which the time to find a nonce is
+    measured.
+    :samples: Number of nonces searched per difficulty.
+    :workers: Numbers of processes for which the scaling is measured.
+    :hashes: Number of hashes generated for the hash rate and scaling.
+    :returns: Dictionary
+    """
+    return {
+        "hashrate": benchmark_hashrate(hashes),
+        "solution_time": dict((str(difficulty), benchmark_solution_time(difficulty, samples))
+                              for difficulty in difficulties),
+        "scaling": [benchmark_scaling(n, hashes) for n in workers]
+    }
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import json
 import click
 import logging
+from pynunzen.benchmark import environment, benchmark_pow, benchmark_header, benchmark_memory
 from pynunzen.node.node import Node
 from pynunzen.config import DEFAULT_CONFIG_PATH, get_config, get_node_server_address
 
@@ -44,4 +46,35 @@ def serve(ctx):
     Node(address)
 
 
+@click.command()
+@click.option("--suite", "suites", multiple=True, type=click.Choice(["pow", "header", "memory"]),
+              default=("pow", "header", "memory"),
+              help="Benchmark suite to run. Defaults to all suites.")
+@click.option("--difficulty", "difficulties", multiple=True, type=int,
+              default=(8, 12, 16),
+              help="Difficulty for which the time to find a nonce is measured.")
+@click.option("--samples", default=10,
+              help="Number of nonces searched per difficulty.")
+@click.option("--workers", multiple=True, type=int, default=(1, 2, 4),
+              help="Number of processes for which the scaling is measured.")
+@click.option("--hashes", default=200000,
+              help="Number of hashes generated to measure the hash rate.")
+@click.option("--outputs", default=100000,
+              help="Number of transaction outputs built to measure the memory usage.")
+@click.option("--output", type=click.File("w"), default="-",
+              help="Write the results as JSON into this file.")
+def benchmark(suites, difficulties, samples, workers, hashes, outputs, output):
+    """Will run the benchmarks."""
+    results = {"environment": environment()}
+    if "pow" in suites:
+        results["pow"] = benchmark_pow(difficulties, samples, workers, hashes)
+    if "header" in suites:
+        results["header"] = benchmark_header(difficulties, samples, hashes)
+    if "memory" in suites:
+        results["memory"] = benchmark_memory(outputs)
+    json.dump(results, output, indent=2, sort_keys=True)
+    output.write("\n")
+
+
 main.add_command(serve)
+main.add_command(benchmark)
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+from pynunzen.ledger.blockchain import BLOCK_CONNECTED, BLOCK_DISCONNECTED
 from pynunzen.ledger.transaction import (
     Transaction, Data, Coin,
-    Input, Output, UnlockScript, LockScript
+    Input, Output, UnlockScript, LockScript,
+    from_base_units
 )
+from pynunzen.ledger.utxo import UTXOSet, write_snapshot
 
 
 class Core(object):
@@ -11,7 +14,7 @@ class Core(object):
     """Pynunzen Core. The core connects the different components and
     provides an interface to the client and server."""
 
-    def __init__(self, blockchain, wallet):
+    def __init__(self, blockchain, wallet, utxo=None):
         """
         The core takes two arguments. The is instantiated with a
         preloaded version of the `blockchain`.  As second argument the
@@ -19,6 +22,8 @@ class Core(object):
 
         :blockchain: :class:Blockchain instance
         :wallet: :class:Wallet instance
+        :utxo: Optional :class:UTXOSet, e.g. a persistent
+        :class:SQLiteUTXOSet. Defaults to a set in memory.
         :returns: :class:Core instance
         """
 
@@ -26,46 +31,133 @@ class Core(object):
         """The distributed ledger called blockchain"""
         self.wallet = wallet
         """The wallet holds the private and public key and addresses."""
-        self.global_utxo = {}
-        """A Dictionary with a list of *all* Unspent Transaction Outputs
-        (UTXO) in the blockchain. An UTXO can be spent as an input in a
-        new transaction. A UTXO is referenced by the hash value of the
+        self.global_utxo = utxo if utxo is not None else UTXOSet()
+        """:class:UTXOSet with *all* Unspent Transaction Outputs (UTXO)
+        in the blockchain. An UTXO can be spent as an input in a new
+        transaction. A UTXO is referenced by the hash value of the
         :class:Transaction and the index of the output within the
-        referenced transaction. The key of the dictionary is a string
-        contatinated by the hash and index of the transaction
-        'hash.idx'"""
+        referenced transaction. The reference is a string contatinated
+        by the hash and index of the transaction 'hash.idx'"""
         self.utxo = {}
         """Dictionary with a list of Unspent Transaction Outputs (UTXO)
         in the blockchain which are emcumbered with one of one of the keys in
         the wallet. An UTXO can be spent as an input in a new
         transaction."""
+        self._utxo_addresses = {}
+        """Address of every UTXO of the wallet by its reference."""
+        self._balance_units = 0
+        """Balance of the wallet in base units. It is updated together
+        with the UTXO, so the balance is known without walking them."""
+        self._address_balances = {}
+        """Balance of every address of the wallet in base units."""
         self.build_utxo()
+        # Keep the UTXO up to date with the blockchain.
+        self.blockchain.subscribe(self._on_change)
 
     @property
     def balance(self):
         """Will return the balance of coins which are associated with
         this wallet."""
-        total = 0
-        for address in self.utxo:
-            output = self.utxo[address]
-            if isinstance(output, Coin):
-                total += output.value
-        return total
+        return from_base_units(self.balance_units)
+
+    @property
+    def balance_units(self):
+        """Will return the balance of coins which are associated with
+        this wallet as integer number of base units."""
+        return self._balance_units
+
+    def get_address_balance(self, address):
+        """Will return the balance of coins which are associated with
+        the given address of this wallet.
+
+        :address: Address of the wallet
+        :returns: Balance as Decimal
+        """
+        return from_base_units(self.get_address_balance_units(address))
+
+    def get_address_balance_units(self, address):
+        """Will return the balance of coins which are associated with
+        the given address of this wallet as integer number of base
+        units.
+
+        :address: Address of the wallet
+        :returns: Balance in base units
+        """
+        return self._address_balances.get(address, 0)
 
     def build_utxo(self):
-        """Will build the list of UTXO. This is done by checking all
-        transactions in the blockchain if the transaction contains
-        data/value"""
-        for block in self.blockchain.blocks:
-            for transaction in block.data:
-                for idx, output in enumerate(transaction.outputs):
-                    if isinstance(output.data, Data):
-                        #  TODO: Unclear how already spent outputs are
-                        #  identified. (ti) <2017-05-16 22:02>
-                        for address in self.wallet.addresses:
-                            if output.script.unlock(address):
-                                utxo_reference = "{}.{}".format(transaction.hash, idx)
-                                self.utxo[utxo_reference] = output.data
+        """Will build the list of UTXO. If the UTXO set already contains
+        the outputs up to a block of the blockchain, only the blocks
+        after this block are connected to the set. Otherwise all blocks
+        are connected to an empty set. Afterwards the UTXO are updated
+        block by block when the blockchain changes."""
+        start = 0
+        best_block = self.global_utxo.best_block
+        if best_block is not None:
+            block = self.blockchain.get_block(best_block)
+            if block is not None:
+                start = block.index + 1
+        if not start:
+            self.global_utxo.clear()
+        for block in self.blockchain.iter_blocks(start):
+            self.global_utxo.connect(block)
+        self.utxo = {}
+        self._utxo_addresses = {}
+        self._balance_units = 0
+        self._address_balances = {}
+        self._update_utxo([], self.global_utxo.items())
+
+    def write_utxo_snapshot(self, path):
+        """Will write a snapshot of the UTXO set at the end of the
+        blockchain. A new core can be started from the snapshot, so only
+        the blocks after the snapshot need to be connected. See
+        :func:`pynunzen.ledger.utxo.load_snapshot`.
+
+        :path: Path of the snapshot file
+        :returns: Hash of the snapshot
+        """
+        return write_snapshot(self.global_utxo, path, self.blockchain.end)
+
+    def _on_change(self, event, block):
+        if event == BLOCK_CONNECTED:
+            self._update_utxo(*self.global_utxo.connect(block))
+        elif event == BLOCK_DISCONNECTED:
+            restored, removed = self.global_utxo.disconnect(block)
+            self._update_utxo(removed, restored)
+
+    def _update_utxo(self, removed, added):
+        """Will update the UTXO of the wallet.
+
+        :removed: List of (reference, output) tuples which are not
+        unspent anymore.
+        :added: List of new unspent (reference, output) tuples.
+        """
+        for reference, _ in removed:
+            data = self.utxo.pop(reference, None)
+            if data is not None:
+                self._count_balance(self._utxo_addresses.pop(reference), data, -1)
+        # The lock script of an output is the address of the receiver
+        # (see LockScript.unlock), so outputs are matched by a set lookup.
+        addresses = self.wallet.address_set
+        for reference, output in added:
+            address = output.script._script
+            if isinstance(output.data, Data) and address in addresses:
+                if reference in self.utxo:
+                    continue
+                self.utxo[reference] = output.data
+                self._utxo_addresses[reference] = address
+                self._count_balance(address, output.data, 1)
+
+    def _count_balance(self, address, data, sign):
+        if not isinstance(data, Coin):
+            return
+        amount = sign * data.amount
+        self._balance_units += amount
+        total = self._address_balances.get(address, 0) + amount
+        if total:
+            self._address_balances[address] = total
+        else:
+            self._address_balances.pop(address, None)
 
     def get_transaction(self, data, address):
         """Will return a new :class:Transaction instance which will
@@ -78,8 +170,9 @@ class Core(object):
         """
         if isinstance(data, Coin):
             # Check if we have enough coins
-            if data.value > self.balance:
-                raise ValueError("Not enough coins! You only have {} coins!".format(self.balance))
+            balance = self.balance_units
+            if data.amount > balance:
+                raise ValueError("Not enough coins! You only have {} coins!".format(from_base_units(balance)))
             else:
                 # Although UTXO can be any arbitrary value, once created
                 # it is indivisible just like a coin that cannot be cut
@@ -96,27 +189,33 @@ class Core(object):
                 inputs = []
                 total = 0
                 for tx_ref in self.utxo:
+                    coin = self.utxo[tx_ref]
+                    if not isinstance(coin, Coin):
+                        continue
                     tx_hash, idx = tx_ref.split(".")
                     idx = int(idx)
-                    tx = self.blockchain.get_transaction(tx_hash)
-                    address = tx.outputs[idx].script._script
-                    total += tx.outputs[idx].data.value
+                    # The address of the UTXO is known, so the
+                    # transaction needs not to be loaded from the
+                    # blockchain.
+                    address = self._utxo_addresses[tx_ref]
+                    amount = coin.amount
+                    total += amount
 
                     #  TODO: Build correct transactions with a working
                     #  Unlockscript. #  (ti) <2017-05-18 20:33>
-                    inputs.append(Input(Coin(tx.outputs[idx].data.value), UnlockScript(address), tx_hash, idx))
+                    inputs.append(Input(Coin.from_units(amount), UnlockScript(address), tx_hash, idx))
                     change_address = address
-                    if total >= data.value:
+                    if total >= data.amount:
                         break
 
-                # Calculate difference between total and data.value to
+                # Calculate difference between total and data.amount to
                 # create a new output for the change we will receive.
-                change = total - data.value
+                change = total - data.amount
 
                 # Now create the outputs
                 outputs = []
                 if change:
-                    outputs.append(Output(Coin(change), LockScript(change_address)))
+                    outputs.append(Output(Coin.from_units(change), LockScript(change_address)))
                 outputs.append(Output(data, LockScript(address)))
 
                 transaction = Transaction(inputs, outputs)
@@ -12,7 +12,9 @@ def utcts(dt):
 
 
 def double_sha256(value):
-    """Return a doubled sha256 hash of the given value.
+    """Return a doubled sha256 hash of the given value. The second round
+    is build over the hex digest of the first round. Bytes are hashed as
+    they are, any other value is hashed as its UTF-8 encoded string.
 
     :returns: sha256 hash.
 
@@ -20,11 +22,25 @@ def double_sha256(value):
     # Ensure value value is a string
     if value is None:
         value = ""
-    elif not isinstance(value, str):
+    elif not isinstance(value, (str, bytes)):
         value = str(value)
+    if isinstance(value, str):
+        value = value.encode("utf-8")
 
     h1 = hashlib.sha256()
     h2 = hashlib.sha256()
-    h1.update(value.encode("utf-8"))
+    h1.update(value)
     h2.update(h1.hexdigest().encode("utf-8"))
     return h2.hexdigest()
+
+
+def double_sha256_digest(value):
+    """Return the raw doubled sha256 digest of the given bytes. Unlike
+    :func:`double_sha256` the second round is build over the raw digest
+    of the first round, like in Bitcoin.
+
+    :value: bytes
+    :returns: 32 bytes digest
+
+    """
+    return hashlib.sha256(hashlib.sha256(value).digest()).digest()
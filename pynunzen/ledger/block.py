@@ -1,28 +1,145 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from pynunzen.helpers import double_sha256
-from pynunzen.ledger.transaction import Transaction, CoinbaseInput
+import struct
+from pynunzen.helpers import double_sha256_digest
+from pynunzen.ledger.pow import bits_to_target, target_to_work, find_nonce, encode_nonce
+from pynunzen.ledger.merkle import MerkleTree, verify_proof
+from pynunzen.ledger.serialization import (
+    encode_varint, encode_string, encode_value,
+    decode_varint, decode_string, decode_value
+)
+from pynunzen.ledger.transaction import Transaction, CoinbaseInput, write_transaction, decode_transaction
 
-__block_version__ = "1.0"
-"""Version of the block. Used to versionize the block."""
+__block_version__ = "2.0"
+"""Version of the block. Used to versionize the block. The major
+version is part of the block header."""
 __block_max_size__ = 256
 """Max length of the `data` attribute within a block. This is not a
 limitation in bytes but in general length."""
 
+HEADER = struct.Struct("<I32s32sqI")
+"""Layout of the static part of the binary block header: version,
+parent, merkle root, timestamp and target in compact representation.
+The nonce is appended as unsigned 64 bit integer, see
+:func:`pynunzen.ledger.pow.encode_nonce`."""
+HEADER_SIZE = HEADER.size + 8
+"""Size of the complete block header in bytes."""
 
-def generate_block_address(index, timestamp, parent, data):
-    """Will calculate a doubled SHA256 hash which will be used as the
-    address of a new created block in the blockchain.
 
-    :index: index of the block
+def generate_block_header(parent, merkle_root, timestamp, difficulty, version=__block_version__):
+    """Will return the static part of the binary header of a block. This
+    is the value which is hashed together with the nonce when mining
+    the block. The data of the block is only covered by its merkle root,
+    so the header has a fixed size for any number of transactions.
+
+    :parent: address of the previous block, None for the genesis block
+    :merkle_root: merkle root of the data within the block
     :timestamp: timestamp of the block
-    :parent: address of the previous block
-    :data: data within the the block
+    :difficulty: target of the block in compact representation
+    :version: version of the block
+    :returns: bytes
+
+    """
+    parent = bytes.fromhex(parent) if parent is not None else bytes(32)
+    return HEADER.pack(int(version.split(".")[0]), parent, bytes.fromhex(merkle_root),
+                       timestamp, difficulty or 0)
+
+
+def generate_block_address(parent, merkle_root, timestamp, difficulty, nonce=None, version=__block_version__):
+    """Will calculate a doubled SHA256 hash of the block header which
+    will be used as the address of a new created block in the
+    blockchain.
+
+    :parent: address of the previous block, None for the genesis block
+    :merkle_root: merkle root of the data within the block
+    :timestamp: timestamp of the block
+    :difficulty: target of the block in compact representation
+    :nonce: nonce found while mining the block. A block without a nonce
+    is not mined yet and has no address.
+    :version: version of the block
     :returns: SHA256 hash
 
     """
-    hash_source = str(index) + str(timestamp) + str(parent) + str(data)
-    return double_sha256(hash_source)
+    if nonce is None:
+        raise ValueError("Block without a nonce has no address")
+    header = generate_block_header(parent, merkle_root, timestamp, difficulty, version)
+    return double_sha256_digest(header + encode_nonce(nonce)).hex()
+
+
+def set_nonce(block, nonce):
+    """Will set the nonce of the given block and update the address of
+    the block accordingly.
+
+    :block: :class:`Block` instance
+    :nonce: nonce found for the block
+    :returns: :class:`Block` instance
+    """
+    block.nonce = nonce
+    block.address = generate_block_address(block.parent, block.merkle_root, block.timestamp,
+                                           block.difficulty, nonce, block.version)
+    return block
+
+
+def mine_block(block, workers=1):
+    """Will search a nonce for the given block so that the address of
+    the block meets the target of the block.
+
+    :block: :class:`Block` instance
+    :workers: Number of processes used to search the nonce.
+    :returns: :class:`Block` instance
+    """
+    nonce = find_nonce(block.header, target=block.target, workers=workers)
+    return set_nonce(block, nonce)
+
+
+def encode_block(block):
+    """Will return the binary encoding of the given block. The header
+    fields are followed by the number of transactions and the
+    transactions. See :func:`pynunzen.ledger.transaction.encode_transaction`.
+
+    :block: :class:`Block` instance
+    :returns: bytes
+    """
+    buf = bytearray()
+    buf.extend(encode_string(block.version))
+    buf.extend(encode_varint(block.index))
+    buf.extend(struct.pack("<q", block.timestamp))
+    buf.extend(encode_string(block.parent))
+    buf.extend(encode_value(block.difficulty))
+    buf.extend(encode_value(block.nonce))
+    buf.extend(encode_string(block.address))
+    buf.extend(encode_varint(len(block.data)))
+    for transaction in block.data:
+        write_transaction(buf.extend, transaction)
+    return bytes(buf)
+
+
+def decode_block(buf, offset):
+    """Will decode a block from the buffer at the given offset. See
+    :func:`encode_block`.
+
+    :buf: bytes or :class:`memoryview`
+    :offset: Position in the buffer
+    :returns: Tuple of the :class:`Block` and the offset after the block
+    """
+    try:
+        version, offset = decode_string(buf, offset)
+        index, offset = decode_varint(buf, offset)
+        timestamp = struct.unpack_from("<q", buf, offset)[0]
+        parent, offset = decode_string(buf, offset + 8)
+        difficulty, offset = decode_value(buf, offset)
+        nonce, offset = decode_value(buf, offset)
+        address, offset = decode_string(buf, offset)
+        count, offset = decode_varint(buf, offset)
+    except (IndexError, struct.error):
+        raise ValueError("Unexpected end of data at offset {}".format(offset))
+    if version != __block_version__:
+        raise ValueError("Unsupported block version {}".format(version))
+    data = []
+    for _ in range(count):
+        transaction, offset = decode_transaction(buf, offset)
+        data.append(transaction)
+    return Block(index, timestamp, parent, data, address, difficulty, nonce), offset
 
 
 class Block(object):
@@ -39,7 +156,10 @@ class Block(object):
 
     The header is followed by a long list of transactions/data."""
 
-    def __init__(self, index, timestamp, parent, data, address=None):
+    __slots__ = ("data", "version", "timestamp", "difficulty", "nonce",
+                 "parent", "merkle_tree", "merkle_root", "index", "address")
+
+    def __init__(self, index, timestamp, parent, data, address=None, difficulty=None, nonce=None):
 
         #
         # Block data/transactions
@@ -71,15 +191,19 @@ class Block(object):
         # Mining related fields
         self.timestamp = timestamp
         """UTC timestamp when was this block created."""
-        self.difficulty = None
-        self.nonce = None
+        self.difficulty = difficulty
+        """Target the block hash must not exceed in its compact
+        representation. See :func:`pynunzen.ledger.pow.bits_to_target`."""
+        self.nonce = nonce
+        """Nonce which makes the address of the block meet the target."""
 
         self.parent = parent
         """References the address of the previous Block in the
         blockchain."""
-        #  TODO: Implement merkle tree. (ti) <2017-04-07 16:01>
-        self.merkle_tree = None
+        self.merkle_tree = MerkleTree([transaction.hash for transaction in data])
         """Merkle tree to summarize all data in the block"""
+        self.merkle_root = self.merkle_tree.root
+        """Root of the merkle tree. Part of the header of the block."""
 
         # Block identification. Please note that in reality the index
         # and address of the block is usually not stored in the block or
@@ -88,8 +212,75 @@ class Block(object):
         # have them available.
         self.index = index
         """A simple index of the block also know as the `Block Height`"""
-        if address is None:
-            address = generate_block_address(index, self.timestamp, self.parent, data)
+        if address is None and nonce is not None:
+            address = generate_block_address(self.parent, self.merkle_root, self.timestamp,
+                                             self.difficulty, self.nonce, self.version)
         self.address = address
         """Block header hash. A double hashed SHA256 build over fields
-        of the header in the block"""
+        of the header in the block. None as long as the block is not
+        mined."""
+
+    @property
+    def header(self):
+        """Static part of the binary header of the block which is hashed
+        together with the nonce. See :func:`generate_block_header`."""
+        return generate_block_header(self.parent, self.merkle_root, self.timestamp,
+                                     self.difficulty, self.version)
+
+    @property
+    def target(self):
+        """Target the address of the block must not exceed."""
+        return bits_to_target(self.difficulty)
+
+    @property
+    def work(self):
+        """Expected number of hashes needed to mine the block. See
+        :func:`pynunzen.ledger.pow.target_to_work`."""
+        return target_to_work(self.target)
+
+    def get_proof(self, tx_hash):
+        """Will return the inclusion proof for the transaction with the
+        given hash. See :func:`pynunzen.ledger.merkle.verify_proof`.
+
+        :tx_hash: Hash of the transaction
+        :returns: Tuple of the position of the transaction in the block
+        and the proof, or None if the transaction is not in the block.
+        """
+        index = self.merkle_tree.index(tx_hash)
+        if index is None:
+            return None
+        return index, self.merkle_tree.proof(index)
+
+    def verify_proof(self, tx_hash, index, proof):
+        """Will check if the transaction with the given hash is included
+        in the block using only the merkle root of the block.
+
+        :tx_hash: Hash of the transaction
+        :index: Position of the transaction in the block
+        :proof: Proof as returned by :meth:`get_proof`
+        :returns: True or False
+        """
+        return verify_proof(tx_hash, index, proof, self.merkle_root, len(self.data))
+
+    def to_bytes(self):
+        """Will return the binary encoding of the block. See
+        :func:`encode_block`.
+
+        :returns: bytes
+        """
+        return encode_block(self)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Will return the block encoded in the given bytes. The data is
+        parsed through a :class:`memoryview`, so no intermediate copies
+        are made.
+
+        :data: bytes-like object
+        :returns: :class:`Block` instance
+        """
+        buf = memoryview(data)
+        block, offset = decode_block(buf, 0)
+        if offset != len(buf):
+            raise ValueError("Unexpected data after block at offset {}".format(offset))
+        return block
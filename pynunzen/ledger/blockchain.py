@@ -1,16 +1,58 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import bisect
+import logging
+import itertools
 import datetime
+import functools
+import threading
+import collections
 from pynunzen.helpers import utcts
-from pynunzen.ledger.block import Block, generate_block_address
+from pynunzen.ledger.block import Block, generate_block_address, mine_block
+from pynunzen.ledger.merkle import merkle_root
+from pynunzen.ledger.store import BlockSequence, CACHE_SIZE
+from pynunzen.ledger.pow import MAX_BITS, retarget, verify_target, verify_batch, bits_to_target, target_to_work
 from pynunzen.ledger.transaction import Transaction, CoinbaseInput, Output, Data, LockScript, UnlockScript
 
 __blockchain_version__ = "1.0"
 """Version of the blockchain. Used to versionize the blockchain."""
+log = logging.getLogger(__name__)
 
-GENESIS_BLOCK_ADDRESS = "f4a3ea59c413e6b470ed12757f3758ad70a4e9bff2954263f22be091871cb499"
+GENESIS_BLOCK_ADDRESS = "2f38c65f2ccdd7307206b4170b8b57217cec39c61d5e262efbd6f9a837bfeccf"
+GENESIS_BLOCK_NONCE = 0
+"""Nonce of the genesis block. The address of the genesis block is the
+hash of its header with this nonce."""
 GENESIS_BLOCK_INPUT = "NY-Times on 7.04.2017: U.S. Strikes Syria Over Chemical Attack"
 
+BLOCK_INTERVAL = 60
+"""Time in seconds which should pass between two blocks."""
+RETARGET_INTERVAL = 60
+"""Number of blocks after which the difficulty is adjusted."""
+MEDIAN_TIME_SPAN = 11
+"""Number of blocks used to calculate the median time past. The
+timestamp of a new block must be later than the median time past."""
+MAX_FUTURE_BLOCK_TIME = 2 * 60 * 60
+"""Time in seconds the timestamp of a block may be ahead of the local
+time."""
+MAX_REORG_DEPTH = 100
+"""Maximum number of blocks which are removed from the end of the
+blockchain when switching to a side branch. Side branches which fork
+off deeper are not followed and dropped."""
+
+BLOCK_CONNECTED = "connected"
+"""Event sent to the subscribers of a blockchain when a block was added
+to the end of the blockchain. If a subscriber fails, the block is
+removed again."""
+BLOCK_DISCONNECTED = "disconnected"
+"""Event sent to the subscribers of a blockchain when a block is
+removed from the end of the blockchain. The event is sent before the
+block is removed, so a failing subscriber keeps the block in the
+blockchain."""
+
+BlockNode = collections.namedtuple("BlockNode", ["block", "height", "work"])
+"""Block on a side branch of the blockchain together with its height and
+the cumulative work of the branch up to and including the block."""
+
 
 def generate_genesis_block():
     """Will return a block instance for the very first block in the blockchain.
@@ -23,17 +65,34 @@ def generate_genesis_block():
     tx_in = CoinbaseInput(Data("NY-Times on 7.04.2017: U.S. Strikes Syria Over Chemical Attack"),
                           UnlockScript(None), UnlockScript(None))
     tx_out = Output(Data(""), LockScript(None))
-    transaction = Transaction([tx_in], [tx_out])
+    # The time of the transaction is fixed, so the genesis block and its
+    # address are the same on every node.
+    created = datetime.datetime(2017, 4, 7, 16, 3, 0)
+    transaction = Transaction([tx_in], [tx_out], time=str(created))
     data = [transaction]
 
-    timestamp = utcts(datetime.datetime(2017, 4, 7, 16, 3, 0))
+    timestamp = utcts(created)
     address = GENESIS_BLOCK_ADDRESS
-    return Block(index, timestamp, None, data, address)
+    return Block(index, timestamp, None, data, address, MAX_BITS, GENESIS_BLOCK_NONCE)
+
+
+def generate_new_block(blockchain, data, workers=1):
+    """Will return a new mined block for the given blockchain. The block
+    can than be added to the blockchain.
+
+    :blockchain: :class:`Blockchain` instance
+    :data: Payload of the Block
+    :workers: Number of processes used for mining.
+    :returns: class:`Block` instance
+
+    """
+    return mine_block(generate_block_template(blockchain, data), workers)
 
 
-def generate_new_block(blockchain, data):
-    """Will return a new block for the given blockchain. The block can
-    than be added to the blockchain.
+def generate_block_template(blockchain, data):
+    """Will return a new block for the given blockchain which is not
+    mined yet. The difficulty of the block is set, but a nonce still
+    needs to be found. See :func:`pynunzen.ledger.block.mine_block`.
 
     :blockchain: :class:`Blockchain` instance
     :data: Payload of the Block
@@ -42,15 +101,26 @@ def generate_new_block(blockchain, data):
     """
     block = blockchain.end
     index = block.index + 1
-    timestamp = utcts(datetime.datetime.utcnow())
+    # The timestamp must be later than the median time past, even if
+    # the clock of this node is behind.
+    timestamp = max(utcts(datetime.datetime.utcnow()),
+                    blockchain.median_time_past + 1)
     parent = block.address
-    return Block(index, timestamp, parent, data)
+    return Block(index, timestamp, parent, data, difficulty=blockchain.next_difficulty)
 
 
-def validate_block(blockchain, block):
+def validate_block(blockchain, block, check_pow=True):
     """Will check if the given block is a valid block to be added to the
     block chain. Check is always done against the last block in the
-    blockchain."""
+    blockchain.
+
+    :blockchain: :class:`Blockchain` instance
+    :block: :class:`Block` instance
+    :check_pow: If False, the address and proof of work of the block are
+    not checked. Use this only if the proof of work has already been
+    verified, e.g. by :func:`pynunzen.ledger.pow.verify_batch`.
+    :returns: True
+    """
     last_block = blockchain.end
 
     # Check if the given block links to the last block
@@ -65,21 +135,121 @@ def validate_block(blockchain, block):
     if blockchain.blocks[0].address != GENESIS_BLOCK_ADDRESS:
         raise ValueError("Blockchain does not start with know genesis block")
 
+    # Check if the timestamp of the block is within the allowed range.
+    if block.timestamp <= blockchain.median_time_past:
+        raise ValueError("Timestamp of block is not after the median time past")
+    if block.timestamp > utcts(datetime.datetime.utcnow()) + MAX_FUTURE_BLOCK_TIME:
+        raise ValueError("Timestamp of block is too far in the future")
+
+    # Check if the block uses the expected difficulty
+    if block.difficulty != blockchain.next_difficulty:
+        raise ValueError("Difficulty of block does not match the expected difficulty")
+
+    return validate_block_header(block, check_pow)
+
+
+def validate_block_header(block, check_pow=True):
+    """Will check the given block on its own without the context of a
+    blockchain. The transactions of the block must be unique, the merkle
+    root must cover them and the address must be the hash of the header
+    and meet the target.
+
+    :block: :class:`Block` instance
+    :check_pow: If False, the address and proof of work of the block are
+    not checked.
+    :returns: True
+    """
+    # An odd level of the merkle tree pairs its last node with itself,
+    # so a block with a duplicated transaction has the same merkle root
+    # as the block without it. Such blocks must not be accepted.
+    hashes = [transaction.hash for transaction in block.data]
+    if len(set(hashes)) != len(hashes):
+        raise ValueError("Block contains duplicate transactions")
+
+    # Check if the merkle root in the header covers the data
+    if merkle_root(hashes) != block.merkle_root:
+        raise ValueError("Merkle root of block does not match its data")
+
+    if not check_pow:
+        return True
+
     # Check if the address of the block is correct
-    address = generate_block_address(block.index, block.timestamp, block.parent, block.data)
+    address = generate_block_address(block.parent, block.merkle_root, block.timestamp,
+                                     block.difficulty, block.nonce, block.version)
     if address != block.address:
         raise ValueError("Hash of block does not match calculated value.")
 
+    # Check the proof of work
+    if not verify_target(block.address, block.target):
+        raise ValueError("Hash of block does not meet the target.")
+
     return True
 
 
+def _synchronized(method):
+    """Decorator for the methods of :class:`Blockchain` which change the
+    blockchain. The changes are serialized by the lock of the
+    blockchain, as blocks are appended by the miner in a background
+    thread."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Blockchain(object):
 
     """Blockchain. Will hold a list of Blocks"""
 
-    def __init__(self):
-        self.blocks = [generate_genesis_block()]
+    def __init__(self, store=None, cache_size=CACHE_SIZE):
+        """
+        :store: Optional :class:`pynunzen.ledger.store.BlockStore`. If
+        given, the blocks are kept in the store and the blockchain
+        continues with the blocks already in the store. Otherwise the
+        blocks are kept in memory.
+        :cache_size: Number of blocks read from the store which are kept
+        in memory.
+        """
+        if store is None:
+            blocks = []
+        else:
+            blocks = BlockSequence(store, cache_size)
+        if not len(blocks):
+            blocks.append(generate_genesis_block())
+        self.blocks = blocks
+        """Blocks of the blockchain ordered by their height. Either a
+        list or a :class:`pynunzen.ledger.store.BlockSequence` which
+        loads the blocks from the store on demand."""
         self.version = __blockchain_version__
+        self._end = self.blocks[-1]
+        self._timestamps = collections.deque(
+            maxlen=max(RETARGET_INTERVAL + 1, MEDIAN_TIME_SPAN))
+        """Timestamps of the last blocks in the blockchain. Used to
+        calculate the difficulty and median time past without walking
+        the blockchain."""
+        self._fill_timestamps()
+        self._tx_index = None
+        """Index of all transactions in the blockchain. Maps the hash of
+        a transaction to the height of the block and the position of the
+        transaction within the block. Build on first use."""
+        self._address_index = None
+        """Index of the blocks by their address. Maps the address to the
+        height of the block. Build on first use."""
+        self._time_index = None
+        """Sorted list of (timestamp, height) tuples of all blocks. The
+        timestamps of the blocks are not strictly increasing, so the
+        index is kept sorted on its own. Build on first use."""
+        self._work = None
+        """Cumulative work of the blockchain per height. Build on first
+        use."""
+        self._side = {}
+        """Blocks on side branches of the blockchain. Maps the address of
+        the block to a :class:`BlockNode`."""
+        self._subscribers = []
+        """Callbacks which are called on changes of the blockchain."""
+        self.lock = threading.RLock()
+        """Lock which is held while the blockchain is changed."""
 
     @property
     def end(self):
@@ -88,20 +258,441 @@ class Blockchain(object):
         :returns: :class:`Block` instance
 
         """
-        return self.blocks[-1]
+        return self._end
 
     @property
     def length(self):
         """Will return the number of block which are contained in the blockchain"""
         return len(self.blocks)
 
-    def append(self, block):
-        """Will append the given block to the blockchain
+    @property
+    def median_time_past(self):
+        """Will return the median of the timestamps of the last
+        :data:`MEDIAN_TIME_SPAN` blocks.
+
+        :returns: UTC timestamp
+
+        """
+        timestamps = sorted(list(self._timestamps)[-MEDIAN_TIME_SPAN:])
+        return timestamps[len(timestamps) // 2]
+
+    @property
+    def next_difficulty(self):
+        """Will return the difficulty for the next block in the
+        blockchain. The difficulty is adjusted every
+        :data:`RETARGET_INTERVAL` blocks so that a new block is
+        generated every :data:`BLOCK_INTERVAL` seconds on average.
+
+        :returns: Target in compact representation
+
+        """
+        bits = self.end.difficulty
+        if self.length % RETARGET_INTERVAL:
+            return bits
+        # Number of block intervals within the window. This is less
+        # than the retarget interval only at the start of the chain.
+        intervals = min(RETARGET_INTERVAL, len(self._timestamps) - 1)
+        timespan = self._timestamps[-1] - self._timestamps[-1 - intervals]
+        return retarget(bits, timespan, intervals * BLOCK_INTERVAL)
+
+    @_synchronized
+    def append(self, block, check_pow=True):
+        """Will append the given block to the blockchain. The subscribers
+        are notified after the block is appended. If a subscriber fails,
+        the block is removed again.
 
         :block: :class:`Block` instance
+        :check_pow: If False, the proof of work of the block is not
+        checked. See :func:`validate_block`.
         """
-        validate_block(self, block)
+        validate_block(self, block, check_pow)
         self.blocks.append(block)
+        self._end = block
+        self._timestamps.append(block.timestamp)
+        self._index_block(block, len(self.blocks) - 1)
+        if self._work is not None:
+            self._work.append(self._work[-1] + block.work)
+        try:
+            self._notify(BLOCK_CONNECTED, block)
+        except Exception:
+            self._remove()
+            raise
+        self._side.pop(block.address, None)
+        self._prune_side()
+
+    @_synchronized
+    def pop(self):
+        """Will remove the last block from the blockchain. The genesis
+        block can not be removed. The subscribers are notified before the
+        block is removed. If a subscriber fails, the blockchain is left
+        unchanged.
+
+        :returns: The removed :class:`Block` instance
+        """
+        if len(self.blocks) == 1:
+            raise ValueError("Genesis block can not be removed")
+        self._notify(BLOCK_DISCONNECTED, self._end)
+        return self._remove()
+
+    def _remove(self):
+        """Will remove the last block from the blockchain without
+        notifying the subscribers."""
+        height = len(self.blocks) - 1
+        block = self.blocks.pop()
+        self._end = self.blocks[-1]
+        self._unindex_block(block, height)
+        if self._work is not None:
+            self._work.pop()
+        # The oldest timestamps dropped out of the window, so the window
+        # is filled again from the remaining blocks.
+        self._fill_timestamps()
+        return block
+
+    @property
+    def work(self):
+        """Will return the cumulative work of all blocks in the
+        blockchain. See :attr:`pynunzen.ledger.block.Block.work`.
+
+        :returns: Work as integer
+
+        """
+        return self._chain_work()[-1]
+
+    @_synchronized
+    def add_block(self, block):
+        """Will add the given block to the block tree. Unlike
+        :meth:`append` the block does not need to link to the end of the
+        blockchain. A block which links to any other known block starts
+        or extends a side branch. If a side branch gets more cumulative
+        work than the blockchain, the blockchain switches to the side
+        branch. See :meth:`reorganize`.
+
+        :block: :class:`Block` instance
+        :returns: True if the block is new, False if it is already known.
+        """
+        if block.parent == self.end.address:
+            self.append(block)
+            return True
+        if block.address in self._side or self.get_block(block.address) is not None:
+            return False
+
+        parent = self._side.get(block.parent)
+        if parent is None:
+            height = self._block_index()[0].get(block.parent)
+            if height is None:
+                raise ValueError("Parent of block {} is unknown".format(block.address))
+            if len(self.blocks) - 1 - height > MAX_REORG_DEPTH:
+                raise ValueError("Block {} forks off more than {} blocks below the end of the blockchain".format(
+                    block.address, MAX_REORG_DEPTH))
+            parent = BlockNode(self.blocks[height], height, self._chain_work()[height])
+        if block.index != parent.height + 1:
+            raise ValueError("Index of block does not match the index of the previos block")
+        # Cheap blocks must not fill the side branches, so the difficulty
+        # is checked before the block is kept.
+        if block.difficulty != self._expected_difficulty(parent):
+            raise ValueError("Difficulty of block does not match the expected difficulty")
+        validate_block_header(block)
+
+        node = BlockNode(block, parent.height + 1, parent.work + block.work)
+        self._side[block.address] = node
+        if node.work > self.work:
+            self.reorganize(block.address)
+        return True
+
+    @_synchronized
+    def reorganize(self, address):
+        """Will switch the blockchain to the side branch ending with the
+        block with the given address. Only the blocks after the fork
+        point are removed and appended, at most :data:`MAX_REORG_DEPTH`
+        blocks are removed. The removed blocks are kept as side branch.
+        If a block of the side branch is invalid or a subscriber fails,
+        the blockchain is restored. An invalid block and its descendants
+        are dropped.
+
+        :address: Address of the last block of a side branch
+        """
+        branch = []
+        node = self._side[address]
+        while node is not None:
+            branch.append(node.block)
+            fork = node.block.parent
+            node = self._side.get(fork)
+        branch.reverse()
+        fork_height = self._block_index()[0][fork]
+        if len(self.blocks) - 1 - fork_height > MAX_REORG_DEPTH:
+            raise ValueError("Side branch forks off more than {} blocks below the end of the blockchain".format(
+                MAX_REORG_DEPTH))
+
+        disconnected = []
+        connected = None
+        try:
+            while len(self.blocks) - 1 > fork_height:
+                disconnected.append(self._disconnect())
+            for connected, block in enumerate(branch):
+                self.append(block)
+        except Exception as e:
+            # Either some blocks of the blockchain are disconnected or all
+            # of them and some blocks of the branch are connected.
+            if connected is not None:
+                while len(self.blocks) - 1 > fork_height:
+                    self._disconnect()
+                if isinstance(e, ValueError):
+                    self._drop_branch(branch[connected].address)
+            for block in reversed(disconnected):
+                self.append(block, check_pow=False)
+            raise
+        log.info("Reorganized blockchain at height {}: {} blocks removed, {} blocks added".format(
+            fork_height, len(disconnected), len(branch)))
+
+    def _expected_difficulty(self, parent):
+        """Will return the difficulty for a block following the given
+        :class:`BlockNode`. This is :attr:`next_difficulty` for a block
+        which may be on a side branch.
+
+        :parent: :class:`BlockNode` of the parent block
+        :returns: Target in compact representation
+        """
+        bits = parent.block.difficulty
+        if (parent.height + 1) % RETARGET_INTERVAL:
+            return bits
+        # Timestamps of the window, walking back along the side branch
+        # until the branch joins the blockchain.
+        timestamps = []
+        node = parent
+        while node is not None and len(timestamps) <= RETARGET_INTERVAL:
+            timestamps.append(node.block.timestamp)
+            node = self._side.get(node.block.parent)
+        if len(timestamps) <= RETARGET_INTERVAL:
+            height = parent.height - len(timestamps)
+            start = max(0, height + len(timestamps) - RETARGET_INTERVAL)
+            headers = itertools.islice(self._headers(start), height - start + 1)
+            timestamps.extend(reversed([timestamp for _, timestamp in headers]))
+        intervals = len(timestamps) - 1
+        timespan = timestamps[0] - timestamps[-1]
+        return retarget(bits, timespan, intervals * BLOCK_INTERVAL)
+
+    def _disconnect(self):
+        """Will remove the last block from the blockchain and keep it as
+        side branch."""
+        height = len(self.blocks) - 1
+        block = self.pop()
+        self._side[block.address] = BlockNode(block, height, self.work + block.work)
+        return block
+
+    def _drop_branch(self, address):
+        """Will remove the side block with the given address and all its
+        descendants."""
+        dropped = set([address])
+        self._side.pop(address, None)
+        for node in sorted(self._side.values(), key=lambda node: node.height):
+            if node.block.parent in dropped:
+                dropped.add(node.block.address)
+                del self._side[node.block.address]
+
+    def _prune_side(self):
+        """Will drop the blocks on side branches which are more than
+        :data:`MAX_REORG_DEPTH` blocks below the end of the blockchain.
+        The blockchain never switches to them."""
+        limit = len(self.blocks) - 1 - MAX_REORG_DEPTH
+        for address in [address for address, node in self._side.items() if node.height <= limit]:
+            del self._side[address]
+
+    def _chain_work(self):
+        if self._work is None:
+            # The work only depends on the target of the blocks, which a
+            # store provides without reading the blocks.
+            self._work = []
+            total = 0
+            for bits in self._difficulties():
+                total += target_to_work(bits_to_target(bits))
+                self._work.append(total)
+        return self._work
+
+    def reindex(self):
+        """Will drop the indexes of the blocks and transactions. They
+        are rebuild from the blocks in the blockchain on next use."""
+        self._tx_index = None
+        self._address_index = None
+        self._time_index = None
+
+    def _headers(self, start=0):
+        """Will yield the address and timestamp of the blocks beginning
+        at the given height. A store provides them without reading the
+        blocks."""
+        headers = getattr(self.blocks, "headers", None)
+        if headers is not None:
+            return headers(start)
+        return ((block.address, block.timestamp) for block in self.blocks[start:])
+
+    def iter_blocks(self, start=0):
+        """Will yield the blocks of the blockchain beginning at the given
+        height. Blocks in a store are streamed without evicting the
+        cached blocks at the end of the blockchain.
+
+        :start: Height of the first block
+        :returns: Generator of :class:`Block` instances
+        """
+        iter_from = getattr(self.blocks, "iter_from", None)
+        if iter_from is not None:
+            return iter_from(start)
+        return itertools.islice(self.blocks, start, None)
+
+    def _difficulties(self, start=0):
+        """Will yield the target of the blocks in compact representation
+        beginning at the given height. See :meth:`_headers`."""
+        difficulties = getattr(self.blocks, "difficulties", None)
+        if difficulties is not None:
+            return difficulties(start)
+        return (block.difficulty for block in self.blocks[start:])
+
+    def _fill_timestamps(self):
+        self._timestamps.clear()
+        start = max(0, len(self.blocks) - self._timestamps.maxlen)
+        self._timestamps.extend(timestamp for _, timestamp in self._headers(start))
+
+    def _block_index(self):
+        if self._address_index is None:
+            self._address_index = {}
+            self._time_index = []
+            for height, (address, timestamp) in enumerate(self._headers()):
+                self._address_index[address] = height
+                self._time_index.append((timestamp, height))
+            self._time_index.sort()
+        return self._address_index, self._time_index
+
+    def _transaction_index(self):
+        if self._tx_index is None:
+            self._tx_index = {}
+            for height, block in enumerate(self.blocks):
+                self._index_transactions(block, height)
+        return self._tx_index
+
+    def _index_transactions(self, block, height):
+        for position, transaction in enumerate(block.data):
+            # Like a scan of the blockchain the index refers to the
+            # first occurrence of a transaction.
+            self._tx_index.setdefault(transaction.hash, (height, position))
+
+    def _index_block(self, block, height):
+        if self._address_index is not None:
+            self._address_index[block.address] = height
+            bisect.insort(self._time_index, (block.timestamp, height))
+        if self._tx_index is not None:
+            self._index_transactions(block, height)
+
+    def _unindex_block(self, block, height):
+        if self._address_index is not None:
+            if self._address_index.get(block.address) == height:
+                del self._address_index[block.address]
+            idx = bisect.bisect_left(self._time_index, (block.timestamp, height))
+            del self._time_index[idx]
+        if self._tx_index is not None:
+            for transaction in block.data:
+                location = self._tx_index.get(transaction.hash)
+                if location is not None and location[0] == height:
+                    del self._tx_index[transaction.hash]
+
+    @_synchronized
+    def extend(self, blocks, workers=None):
+        """Will append the given blocks to the blockchain. The proof of
+        work of all blocks is verified in bulk before the blocks are
+        appended one after another.
+
+        :blocks: Sequence of :class:`Block` instances
+        :workers: Number of processes used to verify the proof of work.
+        """
+        blocks = list(blocks)
+        headers = [(block.header, block.nonce, block.address, block.difficulty)
+                   for block in blocks]
+        failed = verify_batch(headers, workers)
+        if failed is not None:
+            raise ValueError("Proof of work of block {} is invalid".format(blocks[failed].index))
+        for block in blocks:
+            self.append(block, check_pow=False)
+
+    def subscribe(self, callback):
+        """Will register a callback which is called on every change of
+        the end of the blockchain. The callback is called with the
+        event, e.g. :data:`BLOCK_CONNECTED`, and the affected block.
+
+        The event is :data:`BLOCK_CONNECTED` or :data:`BLOCK_DISCONNECTED`.
+
+        :callback: Callable taking the event and a :class:`Block`
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Will remove a callback registered by :meth:`subscribe`.
+
+        :callback: The registered callable
+        """
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _notify(self, event, block):
+        """Will call the subscribers with the given event. If a
+        subscriber fails, the subscribers called before get the opposite
+        event, so all of them keep the same state as the blockchain."""
+        notified = []
+        for callback in list(self._subscribers):
+            try:
+                callback(event, block)
+            except Exception:
+                undo = BLOCK_DISCONNECTED if event == BLOCK_CONNECTED else BLOCK_CONNECTED
+                for callback in reversed(notified):
+                    callback(undo, block)
+                raise
+            notified.append(callback)
+
+    def get_block(self, address):
+        """Will return the block with the given address. If no block can
+        be found None is returned.
+
+        :address: Address of the block
+        :returns: :class:`Block` instance
+
+        """
+        height = self._block_index()[0].get(address)
+        if height is None:
+            return None
+        return self.blocks[height]
+
+    def get_block_by_height(self, height):
+        """Will return the block at the given height. If the blockchain
+        is not that long None is returned.
+
+        :height: Height of the block. The genesis block has height 0.
+        :returns: :class:`Block` instance
+
+        """
+        if not 0 <= height < len(self.blocks):
+            return None
+        return self.blocks[height]
+
+    def get_blocks_by_time(self, start, end):
+        """Will return all blocks with a timestamp within the given
+        range, ordered by their height.
+
+        :start: First UTC timestamp of the range
+        :end: UTC timestamp where the range ends (excluding)
+        :returns: List of :class:`Block` instances
+
+        """
+        time_index = self._block_index()[1]
+        lower = bisect.bisect_left(time_index, (start, -1))
+        upper = bisect.bisect_left(time_index, (end, -1))
+        heights = sorted(height for _, height in time_index[lower:upper])
+        return [self.blocks[height] for height in heights]
+
+    def get_transaction_location(self, tx_hash):
+        """Will return where the transaction with the given hash is
+        stored in the blockchain.
+
+        :returns: Tuple of the height of the block and the position of
+        the transaction within the block, or None
+
+        """
+        return self._transaction_index().get(tx_hash)
 
     def get_transaction(self, tx_hash):
         """Will return the transaction from the blockchain. If no transaction can be found with the given hash None ist returned.
@@ -109,9 +700,8 @@ class Blockchain(object):
         :returns: :class:Transaction instance
 
         """
-        for block in self.blocks:
-            #  TODO: Use Merkletree to find the transaction. (ti) <2017-05-18 22:29>
-            for transaction in block.data:
-                if transaction.hash == tx_hash:
-                    return transaction
-        return None
+        location = self._transaction_index().get(tx_hash)
+        if location is None:
+            return None
+        height, position = location
+        return self.blocks[height].data[position]
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Merkle tree over the transactions of a block. Like in Bitcoin the
+leaves of the tree are the hashes of the transactions. Two neighbouring
+nodes are hashed together to build their parent node. If a level has an
+odd number of nodes the last node is paired with itself. The root of the
+tree summarizes all transactions of the block, so the header of a block
+only needs to contain the root.
+
+A inclusion proof for a transaction is the list of the sibling nodes on
+the path from the leaf of the transaction up to the root. Together with
+the position of the transaction in the block it is enough to rebuild the
+root without knowing the other transactions."""
+
+from pynunzen.helpers import double_sha256_digest
+
+
+def hash_pair(left, right):
+    """Will return the parent node of the given two nodes.
+
+    :left: Left node as 32 bytes digest
+    :right: Right node as 32 bytes digest
+    :returns: 32 bytes digest
+    """
+    return double_sha256_digest(left + right)
+
+
+def build_level(nodes):
+    """Will return the next level of the tree for the given nodes.
+
+    :nodes: List of nodes as 32 bytes digests
+    :returns: List of nodes as 32 bytes digests
+    """
+    if len(nodes) % 2:
+        nodes = nodes + nodes[-1:]
+    return [hash_pair(nodes[idx], nodes[idx + 1]) for idx in range(0, len(nodes), 2)]
+
+
+def merkle_root(hashes):
+    """Will return the merkle root of the given transaction hashes
+    without keeping the tree.
+
+    :hashes: List of transaction hashes as hex strings
+    :returns: Merkle root as hex string
+    """
+    return MerkleTree(hashes).root
+
+
+def tree_depth(count):
+    """Will return the number of levels below the root of a tree with
+    the given number of leaves. This is the length of every proof of the
+    tree.
+
+    :count: Number of leaves
+    :returns: Integer
+    """
+    depth = 0
+    while count > 1:
+        count = (count + 1) // 2
+        depth += 1
+    return depth
+
+
+def verify_proof(tx_hash, index, proof, root, count):
+    """Will check if the transaction with the given hash is included
+    at position `index` in the tree with the given root. See
+    :meth:`MerkleTree.proof`. The proof must lead from a leaf to the
+    root, so the number of leaves of the tree is needed.
+
+    :tx_hash: Hash of the transaction as hex string
+    :index: Position of the transaction in the block
+    :proof: List of sibling nodes as hex strings
+    :root: Merkle root as hex string
+    :count: Number of transactions in the block
+    :returns: True or False
+    """
+    if not 0 <= index < count or len(proof) != tree_depth(count):
+        return False
+    node = bytes.fromhex(tx_hash)
+    for sibling in proof:
+        sibling = bytes.fromhex(sibling)
+        if index % 2:
+            node = hash_pair(sibling, node)
+        else:
+            node = hash_pair(node, sibling)
+        index //= 2
+    return index == 0 and node.hex() == root
+
+
+class MerkleTree(object):
+
+    """Merkle tree build from a list of transaction hashes. All levels
+    of the tree are kept, so proofs can be generated without hashing
+    again."""
+
+    __slots__ = ("levels",)
+
+    def __init__(self, hashes):
+        """
+        :hashes: List of transaction hashes as hex strings
+        """
+        if not hashes:
+            raise ValueError("Merkle tree needs at least one hash")
+        level = [bytes.fromhex(tx_hash) for tx_hash in hashes]
+        self.levels = [level]
+        """Levels of the tree beginning with the leaves. The last level
+        holds only the root."""
+        while len(level) > 1:
+            level = build_level(level)
+            self.levels.append(level)
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    @property
+    def root(self):
+        """Root of the tree as hex string"""
+        return self.levels[-1][0].hex()
+
+    def index(self, tx_hash):
+        """Will return the position of the transaction with the given
+        hash in the leaves of the tree.
+
+        :tx_hash: Hash of the transaction as hex string
+        :returns: Position or None if the hash is not in the tree
+        """
+        try:
+            return self.levels[0].index(bytes.fromhex(tx_hash))
+        except ValueError:
+            return None
+
+    def proof(self, index):
+        """Will return the inclusion proof for the transaction at the
+        given position. See :func:`verify_proof`.
+
+        :index: Position of the transaction in the block
+        :returns: List of sibling nodes as hex strings
+        """
+        if not 0 <= index < len(self):
+            raise IndexError("No transaction at position {}".format(index))
+        proof = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            # The last node of a odd level is paired with itself.
+            proof.append(level[min(sibling, len(level) - 1)].hex())
+            index //= 2
+        return proof
@@ -4,15 +4,16 @@
 """Proof of work This modul contains helper method used to to the proof
 of work when generating blocks."""
 
-import random
+import math
+import hashlib
 import logging
-import time
-from pynunzen.helpers import double_sha256
+import queue
+import struct
+import warnings
+import multiprocessing
+from pynunzen.helpers import double_sha256, double_sha256_digest
 
 
-DIFFICULTY = 10
-"""Number of trailing zero values in the generated hash"""
-
 NONCE = ""
 """All the blocks in the Bitcoin block chain have a short string of
 meaningless data—called a nonce attached to them. The mining computers
@@ -22,74 +23,411 @@ it is required that the SHA-256 hash of the block have a certain number
 of trailing zeros
 """
 
-POOL = "0123456789ABCDEF"
+MAX_BITS = 0x207fffff
+"""Compact encoding of the easiest target a hash can be checked
+against. About every second hash will match this target."""
+
+CHUNK_SIZE = 50000
+"""Number of nonces a single worker checks before it reports back when
+searching in parallel."""
+
+VERIFY_CHUNK_SIZE = 1000
+"""Number of headers a single worker checks in one go when verifying
+headers in parallel."""
 
 log = logging.getLogger(__name__)
 
 
-def generate_nonce(pool, length=None):
-    """Will return a random string build from the chars contained in the
-    pool. The length of the string is the length of the pool on default.
-    This string is used as nonce.
+def format_nonce(counter):
+    """Will return the nonce string for the given position in the nonce
+    space. The nonce is the hexadecimal representation of the counter
+    with 16 digits.
 
-    :pool: Pool of chars which is used to build the nonce.
-    :length: Length of the generated string.
-    :returns: yield permutations
+    :counter: Position in the nonce space.
+    :returns: nonce
 
     """
-    while 1:
-        yield ''.join(random.choice(pool) for _ in range(len(pool)))
+    return "{:016X}".format(counter)
+
+
+def encode_nonce(nonce):
+    """Will return the binary encoding of a nonce which is appended to
+    a binary header. The nonce is a unsigned 64 bit integer in little
+    endian order.
+
+    :nonce: Position in the nonce space.
+    :returns: 8 bytes
+
+    """
+    return struct.pack("<Q", nonce)
+
+
+def _check_requirement(difficulty, target):
+    if difficulty is None and target is None:
+        raise ValueError("Either difficulty or target must be given")
+
+
+def _search_header(header, difficulty, start, stop, target):
+    """Like :func:`search_range` but for a binary header. The nonce is
+    appended as :func:`encode_nonce` and both rounds are build over the
+    raw digest."""
+    midstate = hashlib.sha256(header)
+    if target is not None:
+        target_digest = target_to_digest(target)
+    else:
+        mask = (1 << difficulty) - 1
+    sha256 = hashlib.sha256
+    pack = struct.Struct("<Q").pack
+    from_bytes = int.from_bytes
+    for counter in range(start, stop):
+        h1 = midstate.copy()
+        h1.update(pack(counter))
+        digest = sha256(h1.digest()).digest()
+        if target is not None:
+            if digest <= target_digest:
+                return counter, counter - start + 1
+        elif not from_bytes(digest, "big") & mask:
+            return counter, counter - start + 1
+    return None, stop - start
+
+
+def search_range(value, difficulty, start, stop, target=None):
+    """Will check all nonces in the nonce space from `start` up to
+    (excluding) `stop` and return the first nonce for which the
+    generated hash matches the given difficulty. As the nonce space is
+    walked in order, a search can be split up or resumed at any
+    position.
+
+    The hash state of the static value is computed only once and copied
+    for every nonce. The difficulty is checked on the raw digest of the
+    second round, so no hash string is built per nonce.
+
+    If the value is a binary header, the nonce is the integer position
+    in the nonce space. See :func:`generate_hash`.
+
+    :value: Static string or binary header, which is modified over and
+    over again with the nonce.
+    :difficulty: Number of trailing zeros the generated hash must have.
+    :start: First position in the nonce space to check.
+    :stop: Position in the nonce space where the search stops.
+    :target: Optional target. If given, the hash must be lower or equal
+    than the target instead of matching the difficulty.
+    :returns: Tuple of the found nonce (or None) and the number of
+    generated hashes.
+
+    """
+    _check_requirement(difficulty, target)
+    if isinstance(value, bytes):
+        return _search_header(value, difficulty, start, stop, target)
+    midstate = hashlib.sha256(value.encode("utf-8"))
+    if target is not None:
+        target_digest = target_to_digest(target)
+    else:
+        mask = (1 << difficulty) - 1
+    sha256 = hashlib.sha256
+    from_bytes = int.from_bytes
+    for counter in range(start, stop):
+        h1 = midstate.copy()
+        h1.update(b"%016X" % counter)
+        # Like in double_sha256 the second round is build over the hex
+        # digest of the first round.
+        digest = sha256(h1.hexdigest().encode("ascii")).digest()
+        if target is not None:
+            if digest <= target_digest:
+                return format_nonce(counter), counter - start + 1
+        elif not from_bytes(digest, "big") & mask:
+            return format_nonce(counter), counter - start + 1
+    return None, stop - start
 
 
-def find_nonce(value, difficulty, pool=POOL):
-    """Will return a random nonce which matches the requirement that the
+def find_nonce_parallel(value, difficulty=None, workers=None, chunk_size=CHUNK_SIZE, start=0, target=None):
+    """Will search a nonce for the given value using a pool of
+    `workers` processes. The nonce space is split into chunks of
+    `chunk_size` nonces which are handed out to the workers. Once a
+    worker has found a nonce all other workers are stopped.
+
+    :value: Static string, which is modified over and over again with the nonce.
+    :difficulty: Number of trailing zeros the generated hash must have.
+    :workers: Number of processes. Defaults to the number of CPUs.
+    :chunk_size: Number of nonces a worker checks per task.
+    :start: Position in the nonce space where the search begins.
+    :target: Optional target the hash must not exceed. See
+    :func:`search_range`.
+    :returns: Tuple of the found nonce and the total number of
+    generated hashes.
+
+    """
+    _check_requirement(difficulty, target)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    results = queue.Queue()
+    pool = multiprocessing.Pool(workers)
+    try:
+        def submit(start):
+            pool.apply_async(search_range, (value, difficulty, start, start + chunk_size, target),
+                             callback=results.put, error_callback=results.put)
+
+        # Keep every worker busy with one task in the queue while it is
+        # working on the current one.
+        for _ in range(workers * 2):
+            submit(start)
+            start += chunk_size
+
+        hashes = 0
+        while 1:
+            result = results.get()
+            if isinstance(result, BaseException):
+                raise result
+            nonce, count = result
+            hashes += count
+            if nonce is not None:
+                log.info("Found nonce after {} hashes".format(hashes))
+                return nonce, hashes
+            submit(start)
+            start += chunk_size
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def find_nonce(value, difficulty=None, pool=None, workers=1, start=0, chunk_size=CHUNK_SIZE, target=None):
+    """Will return a nonce which matches the requirement that the
     generated hash of the concatenated value and nonce have a minimum
-    number of leading zeros.
+    number of trailing zeros or, if a `target` is given, is not above
+    the target. The nonce space is walked in order beginning at
+    `start`.
+
+    If more than one worker is requested, the search is done in
+    parallel by :func:`find_nonce_parallel`.
 
     :value: Static string, which is modified over and over again with generated nonce.
+    :difficulty: Number of trailing zeros the generated hash must have.
+    :pool: Deprecated. Nonces are not build from a pool of chars
+    anymore, the argument is ignored.
+    :workers: Number of processes used for the search. None means one
+    process per CPU.
+    :start: Position in the nonce space where the search begins.
+    :chunk_size: Number of nonces checked in one go.
+    :target: Optional target the hash must not exceed.
     :returns: nonce
 
     """
-    cycle = 1
-    for nonce in generate_nonce(pool):
-        hashvalue = generate_hash(value, nonce)
-        if verify_hash(hashvalue, difficulty):
-            log.info("Found nonce with cycle {}".format(cycle))
+    _check_requirement(difficulty, target)
+    if pool is not None:
+        warnings.warn("The pool argument of find_nonce is ignored and will be removed",
+                      DeprecationWarning, stacklevel=2)
+    if workers != 1:
+        return find_nonce_parallel(value, difficulty, workers, chunk_size, start, target)[0]
+    hashes = 0
+    while 1:
+        nonce, count = search_range(value, difficulty, start, start + chunk_size, target)
+        hashes += count
+        if nonce is not None:
+            log.info("Found nonce after {} hashes".format(hashes))
             return nonce
-        cycle += 1
+        start += chunk_size
 
 
 def generate_hash(value, nonce):
     """Will generate a hash value form the concatenated value and nonce.
+    A binary header is hashed together with the binary encoding of the
+    nonce over the raw digests. See :func:`encode_nonce`.
 
-    :value: Static string, which is modified over and over again with the nonce.
-    :nonce: Random data added to the value.
+    :value: Static string or binary header, which is modified over and
+    over again with the nonce.
+    :nonce: Random data added to the value. Integer for binary headers.
     :returns: A hash build from the given value and nonce
 
     """
+    if isinstance(value, bytes):
+        return double_sha256_digest(value + encode_nonce(nonce)).hex()
     return double_sha256(value + nonce)
 
 
 def verify_hash(hashvalue, difficulty):
-    """Returns True if the given hash value has enough leading zeros in
+    """Returns True if the given hash value has enough trailing zeros in
     the binary representation of the given hash value. The number of
     required trailing zeros is defined by the given difficulty.
 
     :hashvalue: generated hash
-    :difficulty: Number of leading zeros the generated has must have.
+    :difficulty: Number of trailing zeros the generated has must have.
+    :returns: True or False
+
+    """
+    return not int(hashvalue, 16) & ((1 << difficulty) - 1)
+
+
+def verify_target(hashvalue, target):
+    """Returns True if the given hash value is lower or equal than the
+    given target. The hash value is read as a big endian 256 bit number.
+
+    :hashvalue: generated hash, either as hex string or as raw digest.
+    :target: Target as integer. See :func:`bits_to_target`.
     :returns: True or False
 
     """
-    pattern = "0" * difficulty
-    binvalue = bin(int(hashvalue, 16))[2::]
-    if binvalue.endswith(pattern):
-        return True
-    return False
+    if isinstance(hashvalue, bytes):
+        return hashvalue <= target_to_digest(target)
+    return int(hashvalue, 16) <= target
+
 
+def bits_to_target(bits):
+    """Will return the target encoded in the given compact
+    representation. Like in Bitcoin the highest byte of the 32 bit
+    `bits` is the size of the target in bytes and the lower three bytes
+    are the most significant bytes of the target.
 
-if __name__ == "__main__":
-    for difficulty in range(DIFFICULTY, 25):
-        a = time.time()
-        nonce = find_nonce("Hello World!", difficulty)
-        b = time.time()
-        print("Found after {} with difficulty {}".format((b - a), difficulty))
+    :bits: Compact representation of the target.
+    :returns: Target as integer
+
+    """
+    size = bits >> 24
+    mantissa = bits & 0x007fffff
+    if bits & 0x00800000:
+        raise ValueError("Bits {:#x} encode a negative target".format(bits))
+    if size <= 3:
+        return mantissa >> (8 * (3 - size))
+    return mantissa << (8 * (size - 3))
+
+
+def target_to_bits(target):
+    """Will return the compact representation of the given target. As
+    only the three most significant bytes are kept the representation
+    may be slightly lower than the target.
+
+    :target: Target as integer.
+    :returns: Compact representation of the target
+
+    """
+    if target < 0:
+        raise ValueError("Target must not be negative")
+    size = (target.bit_length() + 7) // 8
+    if size <= 3:
+        mantissa = target << (8 * (3 - size))
+    else:
+        mantissa = target >> (8 * (size - 3))
+    # The highest bit of the mantissa is the sign.
+    if mantissa & 0x00800000:
+        mantissa >>= 8
+        size += 1
+    return (size << 24) | mantissa
+
+
+def target_to_digest(target):
+    """Will return the given target as 32 bytes in big endian order, so
+    it can be compared with a raw sha256 digest directly.
+
+    :target: Target as integer.
+    :returns: bytes
+
+    """
+    return target.to_bytes(32, "big")
+
+
+def difficulty_to_target(difficulty):
+    """Will return the target which a hash meets with the same chance
+    as it has `difficulty` trailing zero bits, see :func:`verify_hash`.
+    Both need 2 ** `difficulty` hashes on average. A hash meets the
+    target if it is read as big endian number and has at least
+    `difficulty` leading zero bits, while :func:`verify_hash` counts the
+    trailing zero bits. So the same hash does not meet both in general.
+    The difficulty can be a fraction to get targets between two full
+    bits.
+
+    :difficulty: Number of leading zero bits of the target.
+    :returns: Target as integer
+
+    """
+    if isinstance(difficulty, int):
+        return (1 << (256 - difficulty)) - 1
+    return int(2 ** (256 - difficulty)) - 1
+
+
+def target_to_difficulty(target):
+    """Will return the number of leading zero bits of the given target.
+    This is the number of trailing zero bits which :func:`verify_hash`
+    requires to need the same number of hashes on average. This is the
+    inverse of :func:`difficulty_to_target`.
+
+    :target: Target as integer.
+    :returns: Difficulty as float
+
+    """
+    return 256 - math.log(target + 1, 2)
+
+
+def target_to_work(target):
+    """Will return the expected number of hashes needed to find a hash
+    which meets the given target. The work of the blocks in a chain is
+    summed up to compare chains with each other.
+
+    :target: Target as integer.
+    :returns: Work as integer
+
+    """
+    return (1 << 256) // (target + 1)
+
+
+def retarget(bits, timespan, expected_timespan):
+    """Will return the adjusted target for the given target based on the
+    time it took to generate the last blocks. If the blocks were
+    generated faster than expected the target gets lower (harder) and
+    vice versa. The adjustment is limited to a factor of four in both
+    directions and never exceeds :data:`MAX_TARGET`.
+
+    :bits: Current target in compact representation.
+    :timespan: Seconds it took to generate the last blocks.
+    :expected_timespan: Seconds it should have taken.
+    :returns: New target in compact representation
+
+    """
+    timespan = max(expected_timespan // 4, min(timespan, expected_timespan * 4))
+    target = bits_to_target(bits) * timespan // expected_timespan
+    return target_to_bits(min(target, MAX_TARGET))
+
+
+MAX_TARGET = bits_to_target(MAX_BITS)
+"""Easiest target a hash can be checked against."""
+
+
+def _verify_chunk(args):
+    headers, offset = args
+    for idx, (value, nonce, hashvalue, bits) in enumerate(headers):
+        if nonce is None or bits is None:
+            return offset + idx
+        if generate_hash(value, nonce) != hashvalue:
+            return offset + idx
+        if not verify_target(hashvalue, bits_to_target(bits)):
+            return offset + idx
+    return None
+
+
+def verify_batch(headers, workers=None, chunk_size=VERIFY_CHUNK_SIZE):
+    """Will verify the proof of work for the given headers. Each header
+    is a tuple of the static value, the nonce, the claimed hash and the
+    target in compact representation. A header is valid if the hash of
+    the value and nonce is the claimed hash and meets the target.
+
+    Headers are checked in chunks of `chunk_size` headers. If there is
+    more than one chunk, the chunks are checked in a pool of `workers`
+    processes.
+
+    :headers: Sequence of (value, nonce, hash, bits) tuples
+    :workers: Number of processes. Defaults to the number of CPUs.
+    :chunk_size: Number of headers checked in one go.
+    :returns: Index of the first invalid header or None if all headers
+    are valid.
+
+    """
+    headers = list(headers)
+    if workers == 1 or len(headers) <= chunk_size:
+        return _verify_chunk((headers, 0))
+    chunks = [(headers[offset:offset + chunk_size], offset)
+              for offset in range(0, len(headers), chunk_size)]
+    with multiprocessing.Pool(workers) as pool:
+        # Results come in the order of the chunks, so the first failure
+        # is the first invalid header.
+        for result in pool.imap(_verify_chunk, chunks):
+            if result is not None:
+                return result
+    return None
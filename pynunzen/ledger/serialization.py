@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Canonical binary encoding of ledger objects. The encoding is compact
+and unambiguous, so it can be hashed directly without building strings
+first. Variable length fields are prefixed with their length encoded as
+a Bitcoin like compact size integer."""
+
+import struct
+
+# Tags for the type of a value in a data container.
+VALUE_NONE = 0
+VALUE_STR = 1
+VALUE_BYTES = 2
+VALUE_INT = 3
+
+
+def encode_varint(value):
+    """Will return the given unsigned integer as compact size integer.
+    Values below 253 take a single byte.
+
+    :value: Integer between 0 and 2**64 - 1
+    :returns: bytes
+    """
+    if value < 0:
+        raise ValueError("Value must not be negative")
+    if value < 0xfd:
+        return struct.pack("<B", value)
+    if value <= 0xffff:
+        return b"\xfd" + struct.pack("<H", value)
+    if value <= 0xffffffff:
+        return b"\xfe" + struct.pack("<I", value)
+    return b"\xff" + struct.pack("<Q", value)
+
+
+def encode_bytes(value):
+    """Will return the given bytes prefixed with their length.
+
+    :value: bytes
+    :returns: bytes
+    """
+    return encode_varint(len(value)) + value
+
+
+def encode_string(value):
+    """Will return the given string UTF-8 encoded and prefixed with its
+    length. None is encoded as a single zero byte, any string is
+    prefixed with a one byte, so None and the empty string can be
+    distinguished.
+
+    :value: string or None
+    :returns: bytes
+    """
+    if value is None:
+        return b"\x00"
+    return b"\x01" + encode_bytes(value.encode("utf-8"))
+
+
+def encode_value(value):
+    """Will return the given value of a :class:Data container prefixed
+    with a tag for its type.
+
+    :value: None, string, bytes or integer
+    :returns: bytes
+    """
+    if value is None:
+        return struct.pack("<B", VALUE_NONE)
+    if isinstance(value, str):
+        return struct.pack("<B", VALUE_STR) + encode_bytes(value.encode("utf-8"))
+    if isinstance(value, bytes):
+        return struct.pack("<B", VALUE_BYTES) + encode_bytes(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return struct.pack("<Bq", VALUE_INT, value)
+    raise ValueError("Value {!r} can not be encoded".format(value))
+
+
+def _check_size(buf, offset, size):
+    if offset + size > len(buf):
+        raise ValueError("Unexpected end of data at offset {}".format(offset))
+
+
+def decode_varint(buf, offset):
+    """Will decode a compact size integer from the buffer at the given
+    offset. See :func:`encode_varint`.
+
+    :buf: bytes or :class:`memoryview`
+    :offset: Position in the buffer
+    :returns: Tuple of the integer and the offset after the integer
+    """
+    _check_size(buf, offset, 1)
+    prefix = buf[offset]
+    if prefix < 0xfd:
+        return prefix, offset + 1
+    fmt = {0xfd: "<H", 0xfe: "<I", 0xff: "<Q"}[prefix]
+    size = struct.calcsize(fmt)
+    _check_size(buf, offset + 1, size)
+    return struct.unpack_from(fmt, buf, offset + 1)[0], offset + 1 + size
+
+
+def decode_bytes(buf, offset):
+    """Will decode length prefixed bytes from the buffer at the given
+    offset. See :func:`encode_bytes`. The bytes are not copied, if the
+    buffer is a :class:`memoryview`.
+
+    :buf: bytes or :class:`memoryview`
+    :offset: Position in the buffer
+    :returns: Tuple of the bytes and the offset after the bytes
+    """
+    size, offset = decode_varint(buf, offset)
+    _check_size(buf, offset, size)
+    return buf[offset:offset + size], offset + size
+
+
+def decode_string(buf, offset):
+    """Will decode a string from the buffer at the given offset. See
+    :func:`encode_string`. The string is decoded directly from the
+    buffer.
+
+    :buf: bytes or :class:`memoryview`
+    :offset: Position in the buffer
+    :returns: Tuple of the string (or None) and the offset after the
+    string
+    """
+    _check_size(buf, offset, 1)
+    if not buf[offset]:
+        return None, offset + 1
+    value, offset = decode_bytes(buf, offset + 1)
+    return str(value, "utf-8"), offset
+
+
+def decode_value(buf, offset):
+    """Will decode the value of a :class:Data container from the buffer
+    at the given offset. See :func:`encode_value`.
+
+    :buf: bytes or :class:`memoryview`
+    :offset: Position in the buffer
+    :returns: Tuple of the value and the offset after the value
+    """
+    _check_size(buf, offset, 1)
+    tag = buf[offset]
+    offset += 1
+    if tag == VALUE_NONE:
+        return None, offset
+    if tag == VALUE_STR:
+        value, offset = decode_bytes(buf, offset)
+        return str(value, "utf-8"), offset
+    if tag == VALUE_BYTES:
+        value, offset = decode_bytes(buf, offset)
+        return bytes(value), offset
+    if tag == VALUE_INT:
+        _check_size(buf, offset, 8)
+        return struct.unpack_from("<q", buf, offset)[0], offset + 8
+    raise ValueError("Unknown value type {}".format(tag))
@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Persistent storage of blocks. Blocks are written in their binary
+encoding to append-only segment files. A separate index file holds a
+fixed size record per block with the position of the block in the
+segment files, its address, its timestamp and its target. The records
+follow a header with a magic number and the version of the index, so an
+index with another layout is not misread. The index file is memory
+mapped, so a block can be read by its height without reading any other
+block and opening a store does not depend on the number of blocks.
+Writes which were torn by a crash are dropped when the store is
+opened."""
+
+import os
+import mmap
+import struct
+import logging
+import collections
+from pynunzen.ledger.block import Block
+
+log = logging.getLogger(__name__)
+
+SEGMENT_SIZE = 128 * 1024 * 1024
+"""Size in bytes after which a new segment file is started."""
+
+SEGMENT_NAME = "blk{:05d}.dat"
+"""Name of the segment files."""
+
+INDEX_NAME = "index.dat"
+"""Name of the index file."""
+
+CACHE_SIZE = 1000
+"""Default number of blocks kept in the cache of a :class:`BlockSequence`."""
+
+INDEX_HEADER = struct.Struct("<4sI")
+"""Layout of the header of the index file: magic number and version of
+the index."""
+
+INDEX_MAGIC = b"PNZI"
+"""Magic number at the start of the index file."""
+
+INDEX_VERSION = 1
+"""Version of the layout of the index file. An index of another
+version is not opened."""
+
+INDEX_RECORD = struct.Struct("<IQIqI32s")
+"""Layout of a record in the index file: number of the segment, offset
+and size of the block within the segment, timestamp, target in compact
+representation and address of the block. The records follow the
+header of the index file."""
+
+
+def _index_size(length):
+    """Will return the size of a index file holding the given number of
+    records. This is also the position of the record following them."""
+    return INDEX_HEADER.size + length * INDEX_RECORD.size
+
+
+class BlockStore(object):
+
+    """Append-only store for the blocks of a blockchain. The store
+    behaves like a list of blocks ordered by their height. Blocks can
+    only be added to or removed from the end of the store."""
+
+    def __init__(self, path, segment_size=SEGMENT_SIZE):
+        """
+        :path: Directory holding the segment and index files. The
+        directory is created if it does not exist.
+        :segment_size: Size in bytes after which a new segment file is
+        started.
+        """
+        self.path = path
+        self.segment_size = segment_size
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self._index_file = open(os.path.join(path, INDEX_NAME), "a+b")
+        self._map = None
+        self._segments = {}
+        self._check_header()
+        self._length = self._recover()
+
+    def _check_header(self):
+        """Will write the header of a new index file and check the
+        header of an existing one.
+
+        :raises: ValueError if the index has another layout
+        """
+        expected = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION)
+        self._index_file.seek(0)
+        header = self._index_file.read(INDEX_HEADER.size)
+        if header == expected:
+            return
+        if len(header) == INDEX_HEADER.size or not expected.startswith(header):
+            raise ValueError("Index of block store {} is not a index of version {}".format(
+                self.path, INDEX_VERSION))
+        # The index is new or writing its header was torn.
+        self._index_file.truncate(0)
+        self._index_file.write(expected)
+        self._index_file.flush()
+
+    def _recover(self):
+        """Will bring the files of the store into a consistent state
+        after the process crashed while writing and return the number of
+        blocks in the store.
+
+        A block is written to its segment before its index record, and
+        removed from its segment before its index record. So a crash may
+        leave a partial index record, index records of blocks which are
+        not completely in their segment, or bytes in the segments which
+        are not covered by the index. All of them are dropped.
+
+        :returns: Number of blocks
+        """
+        self._index_file.seek(0, os.SEEK_END)
+        size = self._index_file.tell()
+        length = (size - INDEX_HEADER.size) // INDEX_RECORD.size
+        number, end = 0, 0
+        while length:
+            self._index_file.seek(_index_size(length - 1))
+            number, offset, block_size = INDEX_RECORD.unpack(self._index_file.read(INDEX_RECORD.size))[:3]
+            end = offset + block_size
+            segment = self._segment_path(number)
+            if os.path.exists(segment) and os.path.getsize(segment) >= end:
+                break
+            number, end = 0, 0
+            length -= 1
+        if size != _index_size(length):
+            log.warning("Dropping {} bytes of the index of block store {}".format(
+                size - _index_size(length), self.path))
+            self._index_file.truncate(_index_size(length))
+            self._index_file.flush()
+        # Drop everything behind the last block from the segments.
+        segment = self._segment_path(number)
+        while os.path.exists(segment):
+            if end or not number:
+                if os.path.getsize(segment) > end:
+                    log.warning("Truncating segment {} of block store {} to {} bytes".format(
+                        number, self.path, end))
+                    with open(segment, "r+b") as handle:
+                        handle.truncate(end)
+            else:
+                log.warning("Removing segment {} of block store {}".format(number, self.path))
+                os.remove(segment)
+            number, end = number + 1, 0
+            segment = self._segment_path(number)
+        return length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, height):
+        return Block.from_bytes(self.read(height))
+
+    def __iter__(self):
+        for height in range(self._length):
+            yield self[height]
+
+    def _height(self, height):
+        if height < 0:
+            height += self._length
+        if not 0 <= height < self._length:
+            raise IndexError("No block at height {}".format(height))
+        return height
+
+    def _record(self, height):
+        height = self._height(height)
+        if self._map is None:
+            self._map = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return INDEX_RECORD.unpack_from(self._map, _index_size(height))
+
+    def _segment_path(self, number):
+        return os.path.join(self.path, SEGMENT_NAME.format(number))
+
+    def _segment(self, number):
+        segment = self._segments.get(number)
+        if segment is None:
+            segment = open(self._segment_path(number), "a+b")
+            self._segments[number] = segment
+        return segment
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def read(self, height):
+        """Will return the binary encoding of the block at the given
+        height.
+
+        :height: Height of the block. Negative heights count from the
+        end of the store.
+        :returns: bytes
+        """
+        number, offset, size = self._record(height)[:3]
+        segment = self._segment(number)
+        segment.seek(offset)
+        data = segment.read(size)
+        if len(data) != size:
+            raise ValueError("Segment {} of block store is truncated".format(number))
+        return data
+
+    def address(self, height):
+        """Will return the address of the block at the given height
+        without reading the block.
+
+        :height: Height of the block
+        :returns: Address of the block
+        """
+        return self._record(height)[5].hex()
+
+    def timestamp(self, height):
+        """Will return the timestamp of the block at the given height
+        without reading the block.
+
+        :height: Height of the block
+        :returns: UTC timestamp
+        """
+        return self._record(height)[3]
+
+    def difficulties(self, start=0):
+        """Will yield the target in compact representation of all blocks
+        beginning at the given height. Only the index is read.
+
+        :start: Height of the first block
+        :returns: Generator of targets in compact representation
+        """
+        for height in range(start, self._length):
+            yield self._record(height)[4]
+
+    def headers(self, start=0):
+        """Will yield the address and timestamp of all blocks beginning
+        at the given height. Only the index is read.
+
+        :start: Height of the first block
+        :returns: Generator of (address, timestamp) tuples
+        """
+        for height in range(start, self._length):
+            _, _, _, timestamp, _, address = self._record(height)
+            yield address.hex(), timestamp
+
+    def append(self, block):
+        """Will write the given block to the end of the store.
+
+        :block: :class:`Block` instance
+        """
+        data = block.to_bytes()
+        if self._length:
+            number, offset, size = self._record(-1)[:3]
+            offset += size
+            if offset and offset + len(data) > self.segment_size:
+                number, offset = number + 1, 0
+        else:
+            number, offset = 0, 0
+        segment = self._segment(number)
+        segment.seek(0, os.SEEK_END)
+        if segment.tell() != offset:
+            raise ValueError("Segment {} of block store does not match the index".format(number))
+        segment.write(data)
+        segment.flush()
+        self._unmap()
+        self._index_file.write(INDEX_RECORD.pack(number, offset, len(data), block.timestamp,
+                                                 block.difficulty, bytes.fromhex(block.address)))
+        self._index_file.flush()
+        self._length += 1
+
+    def pop(self):
+        """Will remove the last block from the store.
+
+        :returns: The removed :class:`Block` instance
+        """
+        block = self[-1]
+        number, offset = self._record(-1)[:2]
+        self._unmap()
+        segment = self._segment(number)
+        segment.truncate(offset)
+        segment.flush()
+        if not offset and number:
+            segment.close()
+            del self._segments[number]
+            os.remove(self._segment_path(number))
+        self._length -= 1
+        self._index_file.truncate(_index_size(self._length))
+        self._index_file.flush()
+        return block
+
+    def close(self):
+        """Will close all files of the store."""
+        self._unmap()
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
+        self._index_file.close()
+
+
+class BlockSequence(object):
+
+    """Sequence like view on the blocks in a :class:`BlockStore`. Blocks
+    are read and deserialized on demand. The last recently used blocks
+    are kept in a cache of limited size, so the blocks at the end of the
+    blockchain, which are used most, are not read again and again.
+
+    Iterating over the view streams the blocks from the store without
+    filling the cache, so a scan of the whole blockchain does not evict
+    the blocks which are actually in use."""
+
+    def __init__(self, store, cache_size=CACHE_SIZE):
+        """
+        :store: :class:`BlockStore` instance
+        :cache_size: Maximum number of blocks in the cache.
+        """
+        self.store = store
+        self.cache_size = cache_size
+        self.hits = 0
+        """Number of blocks which were found in the cache."""
+        self.misses = 0
+        """Number of blocks which had to be read from the store."""
+        self._cache = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, height):
+        if isinstance(height, slice):
+            return [self[idx] for idx in range(*height.indices(len(self)))]
+        if height < 0:
+            height += len(self)
+        block = self._cache.get(height)
+        if block is not None:
+            self.hits += 1
+            self._cache.move_to_end(height)
+            return block
+        self.misses += 1
+        block = self.store[height]
+        self._put(height, block)
+        return block
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, start):
+        """Will yield the blocks beginning at the given height. Like
+        iterating over the view the blocks are streamed from the store
+        without filling the cache.
+
+        :start: Height of the first block
+        :returns: Generator of :class:`Block` instances
+        """
+        for height in range(start, len(self)):
+            block = self._cache.get(height)
+            if block is None:
+                block = self.store[height]
+            yield block
+
+    def _put(self, height, block):
+        self._cache[height] = block
+        self._cache.move_to_end(height)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def headers(self, start=0):
+        """See :meth:`BlockStore.headers`."""
+        return self.store.headers(start)
+
+    def difficulties(self, start=0):
+        """See :meth:`BlockStore.difficulties`."""
+        return self.store.difficulties(start)
+
+    def append(self, block):
+        """Will write the given block to the end of the store and add it
+        to the cache.
+
+        :block: :class:`Block` instance
+        """
+        self.store.append(block)
+        self._put(len(self.store) - 1, block)
+
+    def pop(self):
+        """Will remove the last block from the store and the cache.
+
+        :returns: The removed :class:`Block` instance
+        """
+        height = len(self.store) - 1
+        block = self._cache.pop(height, None)
+        popped = self.store.pop()
+        return block if block is not None else popped
+
+    def clear_cache(self):
+        """Will remove all blocks from the cache."""
+        self._cache.clear()
+
+    @property
+    def stats(self):
+        """Will return statistics of the cache.
+
+        Example::
+
+            {'size': 1000, 'hits': 52010, 'misses': 1204}
+
+        :returns: Dictionary
+        """
+        return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
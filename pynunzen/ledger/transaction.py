@@ -1,14 +1,222 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import struct
+import hashlib
 import logging
 import datetime
-from decimal import Decimal, getcontext
-from pynunzen.helpers import double_sha256
+from decimal import Decimal, localcontext
+from pynunzen.ledger.serialization import (
+    encode_varint, encode_string, encode_value,
+    decode_varint, decode_string, decode_value
+)
+
+
+__transaction_version__ = "2.0"
+"""Version of new transactions. The hash of a transaction is build
+over its canonical binary encoding."""
+__legacy_transaction_version__ = "1.0"
+"""Version of transactions whose hash is build over the concatenated
+string representation of its fields."""
+log = logging.getLogger(__name__)
 
+BASE_UNITS = 100000000
+"""Number of base units in one coin. Amounts are stored and summed as
+integer number of base units."""
 
-__transaction_version__ = "1.0"
-log = logging.getLogger(__name__)
-getcontext().prec = 8
+# Tags for the type of a data container in the binary encoding.
+CONTAINER_DATA = 0
+CONTAINER_COIN = 1
+
+# Tags for the type of a transaction input in the binary encoding.
+INPUT_DEFAULT = 0
+INPUT_COINBASE = 1
+
+
+def to_base_units(value):
+    """Will return the given amount of coins as integer number of base
+    units. See :data:`BASE_UNITS`. Floats are converted by their
+    shortest string representation.
+
+    :value: Amount of coins as integer, string, float or :class:`Decimal`
+    :returns: Integer
+    :raises: ValueError if the amount is finer than one base unit
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value * BASE_UNITS
+    if isinstance(value, float):
+        value = str(value)
+    with localcontext() as ctx:
+        ctx.prec = 28
+        units = Decimal(value).scaleb(8)
+        if units != units.to_integral_value():
+            raise ValueError("'{}' is finer than one base unit".format(value))
+        return int(units)
+
+
+def from_base_units(units):
+    """Will return the given integer number of base units as amount of
+    coins. This is the inverse of :func:`to_base_units`.
+
+    :units: Integer
+    :returns: :class:`Decimal`
+    """
+    with localcontext() as ctx:
+        ctx.prec = 28
+        return Decimal(units) / BASE_UNITS
+
+
+def encode_data(data):
+    """Will return the binary encoding of the given :class:Data or
+    :class:Coin container. Coins are encoded as 64 bit integer number of
+    base units.
+
+    :data: :class:Data instance
+    :returns: bytes
+    """
+    if isinstance(data, Coin):
+        return struct.pack("<Bq", CONTAINER_COIN, data.amount)
+    return struct.pack("<B", CONTAINER_DATA) + encode_value(data.value)
+
+
+def encode_input(tx_in):
+    """Will return the binary encoding of the given :class:Input or
+    :class:CoinbaseInput.
+
+    :tx_in: :class:Input instance
+    :returns: bytes
+    """
+    coinbase = isinstance(tx_in, CoinbaseInput)
+    parts = [struct.pack("<B", INPUT_COINBASE if coinbase else INPUT_DEFAULT),
+             encode_data(tx_in.data),
+             encode_string(tx_in.script._script),
+             encode_string(tx_in.tx_hash),
+             encode_varint(tx_in.utxo_idx)]
+    if coinbase:
+        parts.append(encode_string(tx_in.coinbase_script._script))
+    return b"".join(parts)
+
+
+def encode_output(tx_out):
+    """Will return the binary encoding of the given :class:Output.
+
+    :tx_out: :class:Output instance
+    :returns: bytes
+    """
+    return encode_data(tx_out.data) + encode_string(tx_out.script._script)
+
+
+def write_transaction(write, transaction):
+    """Will write the canonical binary encoding of the given transaction
+    field by field using the `write` callable. This way the encoding can
+    be fed into a hasher without building the whole encoding in memory.
+
+    :write: Callable taking bytes, e.g. the `update` method of a hasher.
+    :transaction: :class:Transaction instance
+    """
+    write(encode_string(transaction.version))
+    write(encode_string(transaction.time))
+    write(encode_varint(len(transaction.inputs)))
+    for tx_in in transaction.inputs:
+        write(encode_input(tx_in))
+    write(encode_varint(len(transaction.outputs)))
+    for tx_out in transaction.outputs:
+        write(encode_output(tx_out))
+
+
+def encode_transaction(transaction):
+    """Will return the canonical binary encoding of the given
+    transaction. The hash of the transaction is not part of the
+    encoding.
+
+    :transaction: :class:Transaction instance
+    :returns: bytes
+    """
+    buf = bytearray()
+    write_transaction(buf.extend, transaction)
+    return bytes(buf)
+
+
+def decode_data(buf, offset):
+    """Will decode a :class:Data or :class:Coin container from the
+    buffer at the given offset. See :func:`encode_data`.
+
+    :buf: bytes or :class:`memoryview`
+    :offset: Position in the buffer
+    :returns: Tuple of the container and the offset after the container
+    """
+    container = buf[offset]
+    if container == CONTAINER_COIN:
+        units = struct.unpack_from("<q", buf, offset + 1)[0]
+        return Coin.from_units(units), offset + 9
+    if container == CONTAINER_DATA:
+        value, offset = decode_value(buf, offset + 1)
+        return Data(value), offset
+    raise ValueError("Unknown data container {}".format(container))
+
+
+def decode_input(buf, offset):
+    """Will decode a :class:Input or :class:CoinbaseInput from the
+    buffer at the given offset. See :func:`encode_input`.
+
+    :buf: bytes or :class:`memoryview`
+    :offset: Position in the buffer
+    :returns: Tuple of the input and the offset after the input
+    """
+    kind = buf[offset]
+    data, offset = decode_data(buf, offset + 1)
+    script, offset = decode_string(buf, offset)
+    tx_hash, offset = decode_string(buf, offset)
+    utxo_idx, offset = decode_varint(buf, offset)
+    if kind == INPUT_DEFAULT:
+        return Input(data, UnlockScript(script), tx_hash, utxo_idx), offset
+    if kind == INPUT_COINBASE:
+        coinbase_script, offset = decode_string(buf, offset)
+        tx_in = CoinbaseInput(data, UnlockScript(script), UnlockScript(coinbase_script))
+        if tx_in.tx_hash != tx_hash or tx_in.utxo_idx != utxo_idx:
+            raise ValueError("Coinbase input references an output")
+        return tx_in, offset
+    raise ValueError("Unknown input type {}".format(kind))
+
+
+def decode_output(buf, offset):
+    """Will decode a :class:Output from the buffer at the given offset.
+    See :func:`encode_output`.
+
+    :buf: bytes or :class:`memoryview`
+    :offset: Position in the buffer
+    :returns: Tuple of the output and the offset after the output
+    """
+    data, offset = decode_data(buf, offset)
+    script, offset = decode_string(buf, offset)
+    return Output(data, LockScript(script)), offset
+
+
+def decode_transaction(buf, offset):
+    """Will decode a :class:Transaction from the buffer at the given
+    offset. See :func:`encode_transaction`. The hash of the transaction
+    is build from the decoded content.
+
+    :buf: bytes or :class:`memoryview`
+    :offset: Position in the buffer
+    :returns: Tuple of the transaction and the offset after the
+    transaction
+    """
+    try:
+        version, offset = decode_string(buf, offset)
+        time, offset = decode_string(buf, offset)
+        count, offset = decode_varint(buf, offset)
+        inputs = []
+        for _ in range(count):
+            tx_in, offset = decode_input(buf, offset)
+            inputs.append(tx_in)
+        count, offset = decode_varint(buf, offset)
+        outputs = []
+        for _ in range(count):
+            tx_out, offset = decode_output(buf, offset)
+            outputs.append(tx_out)
+    except (IndexError, struct.error):
+        raise ValueError("Unexpected end of data at offset {}".format(offset))
+    return Transaction(inputs, outputs, version, time), offset
 
 
 def generate_transaction_hash(transaction):
@@ -16,21 +224,36 @@ def generate_transaction_hash(transaction):
     the given transaction. The hash is used as a address of the
     transaction within the blockchain.
 
+    Transactions of the legacy version are hashed over the concatenated
+    string representation of their fields. All other transactions are
+    hashed over their canonical binary encoding. In both cases the
+    fields are fed one by one into the hasher.
+
     :transaction: :class:Transaction instance
     :returns: hash
 
     """
-    value = str(transaction.time)
-    value += str(transaction.version)
+    h1 = hashlib.sha256()
+    if transaction.version != __legacy_transaction_version__:
+        write_transaction(h1.update, transaction)
+        return hashlib.sha256(h1.digest()).hexdigest()
+
+    def update(value):
+        h1.update(str(value).encode("utf-8"))
+
+    update(transaction.time)
+    update(transaction.version)
     for tx_in in transaction.inputs:
-        value += str(tx_in.data.value)
-        value += str(tx_in.script._script)
-        value += str(tx_in.tx_hash)
-        value += str(tx_in.utxo_idx)
+        update(tx_in.data.value)
+        update(tx_in.script._script)
+        update(tx_in.tx_hash)
+        update(tx_in.utxo_idx)
     for tx_out in transaction.outputs:
-        value += str(tx_out.data.value)
-        value += str(tx_out.script._script)
-    return double_sha256(value)
+        update(tx_out.data.value)
+        update(tx_out.script._script)
+    # Like in double_sha256 the second round is build over the hex
+    # digest of the first round.
+    return hashlib.sha256(h1.hexdigest().encode("utf-8")).hexdigest()
 
 
 def validate_transaction(transaction, blockchain):
@@ -128,7 +351,7 @@ def _check_hash(transaction):
 
     """
     tx_hash = transaction.hash
-    return tx_hash == generate_transaction_hash(transaction)
+    return tx_hash == transaction.content_hash
 
 
 def _check_syntax(transaction):
@@ -144,7 +367,6 @@ def _check_syntax(transaction):
         assert hasattr(transaction, "inputs")
         assert hasattr(transaction, "outputs")
         assert hasattr(transaction, "hash")
-        assert len(transaction.__dict__) == 5
         return True
     except AssertionError:
         return False
@@ -164,6 +386,8 @@ class Data(object):
 
     """Container for the transfered data/value within a transaction."""
 
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
@@ -178,18 +402,70 @@ class Data(object):
         raise NotImplementedError()
 
 
+# Slot of Data which holds the amount of a Coin.
+_data_value = Data.__dict__["value"]
+
+
 class Coin(Data):
 
+    """Container for an amount of coins. The amount is stored as integer
+    number of base units in the slot of :class:Data, so amounts can be
+    summed up without any rounding. The amount in coins is available as
+    :class:`Decimal` in `value`."""
+
+    __slots__ = ("_exponent",)
+
     def __init__(self, value):
-        value = Decimal(value)
-        super(Coin, self).__init__(value)
+        """
+        :value: Amount of coins. See :func:`to_base_units`.
+        """
+        self.value = value
+
+    @classmethod
+    def from_units(cls, amount):
+        """Will return a new coin container for the given amount of base
+        units without any conversion.
+
+        :amount: Integer number of base units
+        :returns: :class:Coin instance
+        """
+        coin = cls.__new__(cls)
+        coin.amount = amount
+        return coin
+
+    @property
+    def amount(self):
+        """Amount as integer number of base units."""
+        return _data_value.__get__(self, Coin)
+
+    @amount.setter
+    def amount(self, amount):
+        _data_value.__set__(self, amount)
+        self._exponent = None
+
+    @property
+    def value(self):
+        """Amount of coins as :class:`Decimal`. The exponent of the
+        amount the coin was created with is kept, as legacy transactions
+        are hashed over the string representation of the value."""
+        value = from_base_units(self.amount)
+        if self._exponent is not None:
+            value = value.quantize(Decimal(1).scaleb(self._exponent))
+        return value
+
+    @value.setter
+    def value(self, value):
+        self.amount = to_base_units(value)
+        if isinstance(value, float):
+            value = str(value)
+        self._exponent = Decimal(value).as_tuple().exponent
 
     def check(self, value):
         try:
             value = Decimal(value)
         except:
             raise ValueError("'{}' can not be casted to Decimal".format(value))
-        return self.value > 0
+        return self.amount > 0
 
 
 class LockScript(object):
@@ -199,6 +475,8 @@ class LockScript(object):
     future. Most of the time this is the public address of the receiver
     of the transaction."""
 
+    __slots__ = ("_script",)
+
     def __init__(self, script):
         self._script = script
 
@@ -214,6 +492,8 @@ class UnlockScript(object):
     input, and most of the time they contain a digital signature
     produced by the user’s wallet from his or her private key"""
 
+    __slots__ = ("_script",)
+
     def __init__(self, script):
         self._script = script
 
@@ -226,6 +506,8 @@ class Output(object):
     data by specifying the conditions that must be met to spend the
     output"""
 
+    __slots__ = ("data", "script")
+
     def __init__(self, data, script):
         """
 
@@ -247,6 +529,8 @@ class Input(object):
     script is usually a signature proving ownership of the bitcoin
     address that is in the locking script."""
 
+    __slots__ = ("data", "script", "tx_hash", "utxo_idx")
+
     def __init__(self, data, script, tx_hash, utxo_idx):
         """
 
@@ -272,6 +556,8 @@ class CoinbaseInput(Input):
     reference to a origin output it has some special logic to unlock
     the input."""
 
+    __slots__ = ("coinbase_script",)
+
     def __init__(self, data, script, coinbase_script):
         tx_hash = "0" * 32
         utxo_idx = 0
@@ -283,19 +569,76 @@ class Transaction(object):
 
     """A transaction is a data structure that encodes a transfer of
     value from a source of data/value, called an input, to a destination,
-    called an output."""
+    called an output.
+
+    A transaction is considered immutable once it is created. The hash
+    build from its content is cached. Assigning a new version, time,
+    inputs or outputs drops the cached hash, changes within the inputs
+    or outputs are not noticed."""
 
-    def __init__(self, inputs, outputs):
-        """TODO: to be defined1. """
-        self.version = __transaction_version__
+    __slots__ = ("version", "time", "inputs", "outputs", "hash", "_content_hash")
+
+    _content_fields = ("version", "time", "inputs", "outputs")
+
+    def __init__(self, inputs, outputs, version=__transaction_version__, time=None):
+        """
+        :inputs: List of :class:Input instances.
+        :outputs: List of :class:Output instances.
+        :version: Version of the transaction. Defines how the hash of
+        the transaction is build.
+        :time: Time when the transaction was created. Defaults to now.
+        """
+        self.version = version
         """Version of this transaction"""
-        self.time = str(datetime.datetime.utcnow())
+        if time is None:
+            time = str(datetime.datetime.utcnow())
+        self.time = time
         """Time when the the transaction was created"""
         self.inputs = inputs
         """One or more transaction inputs"""
         self.outputs = outputs
         """One or more transaction outputs"""
-        self.hash = generate_transaction_hash(self)
+        self.hash = self.content_hash
         """Hash of this transaction, A hash is some kind of a address of
         the transaction within the blockchain. It is used to link
         outouts from inputs in other transactions."""
+
+    def __repr__(self):
+        return "Transaction('{}')".format(self.hash)
+
+    def __setattr__(self, name, value):
+        if name in self._content_fields:
+            object.__setattr__(self, "_content_hash", None)
+        object.__setattr__(self, name, value)
+
+    @property
+    def content_hash(self):
+        """Hash build from the current content of the transaction. The
+        hash is only calculated once. See
+        :func:`generate_transaction_hash`."""
+        if self._content_hash is None:
+            self._content_hash = generate_transaction_hash(self)
+        return self._content_hash
+
+    def to_bytes(self):
+        """Will return the binary encoding of the transaction. See
+        :func:`encode_transaction`.
+
+        :returns: bytes
+        """
+        return encode_transaction(self)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Will return the transaction encoded in the given bytes. The
+        data is parsed through a :class:`memoryview`, so no intermediate
+        copies are made.
+
+        :data: bytes-like object
+        :returns: :class:Transaction instance
+        """
+        buf = memoryview(data)
+        transaction, offset = decode_transaction(buf, 0)
+        if offset != len(buf):
+            raise ValueError("Unexpected data after transaction at offset {}".format(offset))
+        return transaction
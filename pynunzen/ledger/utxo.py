@@ -0,0 +1,576 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Set of Unspent Transaction Outputs (UTXO). The set is updated block
+by block. When a block is connected the outputs spent by its inputs are
+removed and its new outputs are added. The spent outputs are kept as
+undo data of the block, so the block can be disconnected again without
+scanning the blockchain. Undo data is only kept for the last
+:data:`pynunzen.ledger.blockchain.MAX_REORG_DEPTH` blocks, as the
+blockchain never removes more blocks when it switches to a side branch.
+
+The :class:`UTXOSet` keeps all outputs in memory. The
+:class:`SQLiteUTXOSet` keeps them in a sqlite database and only holds a
+bounded cache in memory."""
+
+import os
+import struct
+import logging
+import sqlite3
+import hashlib
+import collections
+from pynunzen.ledger.serialization import (
+    encode_varint, encode_string,
+    decode_varint, decode_string
+)
+from pynunzen.ledger.blockchain import MAX_REORG_DEPTH
+from pynunzen.ledger.transaction import CoinbaseInput, encode_output, decode_output
+
+log = logging.getLogger(__name__)
+
+CACHE_SIZE = 100000
+"""Default number of outputs a :class:`SQLiteUTXOSet` keeps in memory
+before the changes are written to the database."""
+
+SCHEMA_VERSION = 1
+"""Version of the tables of a :class:`SQLiteUTXOSet`. A database of
+another version is not opened."""
+
+SNAPSHOT_MAGIC = b"PNZU"
+"""First bytes of a UTXO snapshot file."""
+
+SNAPSHOT_CHUNK_SIZE = 1024 * 1024
+"""Number of bytes read from a snapshot file in one go."""
+
+
+def utxo_reference(tx_hash, idx):
+    """Will return the reference of an output which is used as key in
+    the UTXO set.
+
+    :tx_hash: Hash of the transaction
+    :idx: Index of the output within the transaction
+    :returns: Reference as string 'hash.idx'
+    """
+    return "{}.{}".format(tx_hash, idx)
+
+
+def encode_undo(spent):
+    """Will return the binary encoding of the undo data of a block.
+
+    :spent: List of (reference, output) tuples
+    :returns: bytes
+    """
+    parts = [encode_varint(len(spent))]
+    for reference, output in spent:
+        parts.append(encode_string(reference))
+        parts.append(encode_output(output))
+    return b"".join(parts)
+
+
+def decode_undo(data):
+    """Will decode the undo data of a block. See :func:`encode_undo`.
+
+    :data: bytes
+    :returns: List of (reference, output) tuples
+    """
+    return read_undo(memoryview(data), 0)[0]
+
+
+def read_undo(buf, offset):
+    """Will decode the undo data of a block from the buffer at the
+    given offset. See :func:`encode_undo`.
+
+    :buf: bytes or :class:`memoryview`
+    :offset: Position in the buffer
+    :returns: Tuple of the list of (reference, output) tuples and the
+    offset after the undo data
+    """
+    count, offset = decode_varint(buf, offset)
+    spent = []
+    for _ in range(count):
+        reference, offset = decode_string(buf, offset)
+        output, offset = decode_output(buf, offset)
+        spent.append((reference, output))
+    return spent, offset
+
+
+def write_snapshot(utxo, path, block):
+    """Will write all outputs of the given UTXO set to a snapshot file.
+    The snapshot holds the address and height of the block the set was
+    built up to, followed by the outputs ordered by their reference and
+    the undo data of the last blocks, so these blocks can still be
+    disconnected from a set loaded from the snapshot. The snapshot is
+    committed to by the doubled sha256 hash of this content, which is
+    appended to the file.
+
+    :utxo: :class:`UTXOSet` instance
+    :path: Path of the snapshot file
+    :block: :class:`pynunzen.ledger.block.Block` which was connected
+    last to the set.
+    :returns: Hash of the snapshot
+    """
+    if utxo.best_block != block.address:
+        raise ValueError("UTXO set is not at block {}".format(block.address))
+    h1 = hashlib.sha256()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as snapshot:
+        def write(data):
+            h1.update(data)
+            snapshot.write(data)
+
+        snapshot.write(SNAPSHOT_MAGIC)
+        write(encode_string(block.address))
+        write(encode_varint(block.index))
+        write(encode_varint(len(utxo)))
+        for reference, output in utxo.sorted_items():
+            write(encode_string(reference))
+            write(encode_output(output))
+        undo = utxo.undo_items()
+        write(encode_varint(len(undo)))
+        # The undo data belongs to the last blocks up to the block of the
+        # snapshot in the order they were connected.
+        for height, (address, spent) in enumerate(undo, block.index - len(undo) + 1):
+            write(encode_string(address))
+            write(encode_varint(height))
+            write(encode_undo(spent))
+        digest = hashlib.sha256(h1.digest()).digest()
+        snapshot.write(digest)
+        # Make sure the snapshot is on disk before it replaces an
+        # existing one, a crash must not leave a truncated snapshot.
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    # Replace an existing snapshot only once the new one is complete.
+    os.replace(tmp_path, path)
+    return digest.hex()
+
+
+def load_snapshot(path, utxo=None, snapshot_hash=None):
+    """Will load the outputs and undo data of a snapshot file into the
+    given UTXO set. See :func:`write_snapshot`.
+
+    :path: Path of the snapshot file
+    :utxo: :class:`UTXOSet` instance which is cleared before loading.
+    Defaults to a new set in memory.
+    :snapshot_hash: Optional expected hash of the snapshot, e.g. from a
+    trusted source.
+    :returns: Tuple of the :class:`UTXOSet`, the address and the height
+    of the block of the snapshot.
+    """
+    if utxo is None:
+        utxo = UTXOSet()
+    size = os.path.getsize(path)
+    with open(path, "rb") as snapshot:
+        if size < len(SNAPSHOT_MAGIC) + 32 or snapshot.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError("{} is not a UTXO snapshot".format(path))
+        # The commitment is checked before the set is touched. The
+        # snapshot is read in chunks, so it never needs to fit into
+        # memory.
+        end = size - 32
+        h1 = hashlib.sha256()
+        while snapshot.tell() < end:
+            chunk = snapshot.read(min(SNAPSHOT_CHUNK_SIZE, end - snapshot.tell()))
+            if not chunk:
+                raise ValueError("UTXO snapshot {} is truncated".format(path))
+            h1.update(chunk)
+        digest = hashlib.sha256(h1.digest()).digest()
+        if digest != snapshot.read(32):
+            raise ValueError("UTXO snapshot {} is corrupt".format(path))
+        if snapshot_hash is not None and digest.hex() != snapshot_hash:
+            raise ValueError("UTXO snapshot {} does not match hash {}".format(path, snapshot_hash))
+
+        snapshot.seek(len(SNAPSHOT_MAGIC))
+        reader = _SnapshotReader(snapshot, end)
+        utxo.clear()
+        try:
+            address = reader.read(decode_string)
+            height = reader.read(decode_varint)
+            count = reader.read(decode_varint)
+            for _ in range(count):
+                reference = reader.read(decode_string)
+                utxo._add(reference, reader.read(decode_output))
+                utxo._commit()
+            undo_count = reader.read(decode_varint)
+            for _ in range(undo_count):
+                undo_address = reader.read(decode_string)
+                undo_height = reader.read(decode_varint)
+                utxo._put_undo(undo_address, undo_height, reader.read(read_undo))
+            if not reader.done:
+                raise ValueError("Unexpected data in UTXO snapshot {}".format(path))
+        except ValueError:
+            utxo.clear()
+            raise
+    utxo.best_block = address
+    utxo.flush()
+    log.info("Loaded {} outputs from UTXO snapshot at height {}".format(count, height))
+    return utxo, address, height
+
+
+class _SnapshotReader(object):
+
+    """Decodes the records of a snapshot file from a buffer which is
+    refilled in chunks of :data:`SNAPSHOT_CHUNK_SIZE` bytes."""
+
+    def __init__(self, handle, end):
+        """
+        :handle: File object positioned at the first record
+        :end: Position in the file after the last record
+        """
+        self.handle = handle
+        self.end = end
+        self.buf = b""
+        self.offset = 0
+
+    @property
+    def done(self):
+        """True if all records up to the end were read."""
+        return self.handle.tell() >= self.end and self.offset == len(self.buf)
+
+    def read(self, decode):
+        """Will decode the next record from the snapshot.
+
+        :decode: Function decoding a record from a buffer at an offset,
+        e.g. :func:`pynunzen.ledger.serialization.decode_string`.
+        :returns: The decoded record
+        """
+        while 1:
+            try:
+                value, offset = decode(self.buf, self.offset)
+            except (ValueError, IndexError, struct.error):
+                # The record may continue in the next chunk.
+                if self.handle.tell() >= self.end:
+                    raise ValueError("Unexpected end of UTXO snapshot")
+                self._fill()
+                continue
+            self.offset = offset
+            return value
+
+    def _fill(self):
+        chunk = self.handle.read(min(SNAPSHOT_CHUNK_SIZE, self.end - self.handle.tell()))
+        self.buf = self.buf[self.offset:] + chunk
+        self.offset = 0
+
+
+class UTXOSet(object):
+
+    """Set of all unspent transaction outputs of a blockchain. Outputs
+    are referenced by the hash of their transaction and their index
+    within the transaction. See :func:`utxo_reference`."""
+
+    def __init__(self, undo_depth=MAX_REORG_DEPTH):
+        """
+        :undo_depth: Number of blocks at the end of the blockchain which
+        can be disconnected again.
+        """
+        self.undo_depth = undo_depth
+        self.outputs = {}
+        """Unspent outputs. Maps the reference of the output to the
+        :class:`pynunzen.ledger.transaction.Output`."""
+        self.undo = collections.OrderedDict()
+        """Undo data of the last connected blocks in the order they were
+        connected. Maps the address of the block to the list of
+        (reference, output) tuples spent by the block."""
+        self.best_block = None
+        """Address of the last block connected to the set."""
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def __contains__(self, reference):
+        return self.get(reference) is not None
+
+    def get(self, reference):
+        """Will return the unspent output with the given reference.
+
+        :reference: Reference of the output. See :func:`utxo_reference`.
+        :returns: :class:`pynunzen.ledger.transaction.Output` or None
+        """
+        return self.outputs.get(reference)
+
+    def items(self):
+        """Will return all unspent outputs.
+
+        :returns: Iterable of (reference, output) tuples
+        """
+        return self.outputs.items()
+
+    def sorted_items(self):
+        """Will return all unspent outputs ordered by their reference.
+
+        :returns: Iterable of (reference, output) tuples
+        """
+        return sorted(self.outputs.items(), key=lambda item: item[0])
+
+    def undo_items(self):
+        """Will return the undo data of the last connected blocks in the
+        order the blocks were connected.
+
+        :returns: List of (address, spent) tuples
+        """
+        return list(self.undo.items())
+
+    def clear(self):
+        """Will remove all outputs and undo data from the set."""
+        self.outputs.clear()
+        self.undo.clear()
+        self.best_block = None
+
+    def flush(self):
+        """Will write pending changes. A set in memory has nothing to
+        write."""
+        pass
+
+    def _add(self, reference, output):
+        self.outputs[reference] = output
+
+    def _spend(self, reference):
+        return self.outputs.pop(reference, None)
+
+    def _put_undo(self, address, height, spent):
+        self.undo[address] = spent
+        # Blocks are connected and disconnected like a stack, so the undo
+        # data always belongs to the last blocks of the blockchain.
+        while len(self.undo) > self.undo_depth:
+            self.undo.popitem(last=False)
+
+    def _pop_undo(self, address):
+        return self.undo.pop(address, None)
+
+    def _commit(self):
+        """Called after each connected or disconnected block."""
+        pass
+
+    def connect(self, block):
+        """Will update the set with the transactions of the given block.
+        Inputs which reference outputs which are not in the set are
+        ignored. Outputs which are spent within the same block are
+        neither returned as spent nor as created.
+
+        :block: :class:`pynunzen.ledger.block.Block` instance
+        :returns: Tuple of the lists of spent and created (reference,
+        output) tuples.
+        """
+        spent = []
+        created = collections.OrderedDict()
+        for transaction in block.data:
+            for tx_in in transaction.inputs:
+                if isinstance(tx_in, CoinbaseInput):
+                    continue
+                reference = utxo_reference(tx_in.tx_hash, tx_in.utxo_idx)
+                output = self._spend(reference)
+                if output is None:
+                    log.debug("Input references unknown output {}".format(reference))
+                    continue
+                if reference in created:
+                    # The output was created and spent within this
+                    # block. It is neither part of the changes nor of
+                    # the undo data, so disconnecting the block does not
+                    # restore it.
+                    del created[reference]
+                    continue
+                spent.append((reference, output))
+            for idx, output in enumerate(transaction.outputs):
+                reference = utxo_reference(transaction.hash, idx)
+                self._add(reference, output)
+                created[reference] = output
+        self._put_undo(block.address, block.index, spent)
+        self.best_block = block.address
+        self._commit()
+        return spent, list(created.items())
+
+    def disconnect(self, block):
+        """Will revert the changes made by :meth:`connect` for the given
+        block using the undo data of the block.
+
+        :block: :class:`pynunzen.ledger.block.Block` instance
+        :returns: Tuple of the lists of restored and removed (reference,
+        output) tuples.
+        """
+        spent = self._pop_undo(block.address)
+        if spent is None:
+            raise ValueError("No undo data for block {}".format(block.address))
+        removed = []
+        for transaction in reversed(block.data):
+            for idx in range(len(transaction.outputs)):
+                reference = utxo_reference(transaction.hash, idx)
+                output = self._spend(reference)
+                if output is not None:
+                    removed.append((reference, output))
+        for reference, output in spent:
+            self._add(reference, output)
+        self.best_block = block.parent
+        self._commit()
+        return spent, removed
+
+
+class SQLiteUTXOSet(UTXOSet):
+
+    """UTXO set which is stored in a sqlite database. Changes are
+    collected in a write-back cache and written to the database in a
+    single transaction once the cache holds more than `cache_size`
+    outputs. The cache is only written at block boundaries and the
+    address of the last connected block is written in the same
+    transaction. After a crash the database is therefore in the state
+    of :attr:`best_block` and the blocks after it need to be connected
+    again. Undo data of blocks more than `undo_depth` blocks below the
+    last connected block is deleted on each write."""
+
+    def __init__(self, path, cache_size=CACHE_SIZE, undo_depth=MAX_REORG_DEPTH):
+        """
+        :path: Path of the database file. The file is created if it
+        does not exist.
+        :cache_size: Number of outputs kept in memory before the changes
+        are written to the database.
+        :undo_depth: Number of blocks at the end of the blockchain which
+        can be disconnected again.
+        """
+        self.path = path
+        self.undo_depth = undo_depth
+        self.cache_size = cache_size
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS utxo (reference TEXT PRIMARY KEY, output BLOB NOT NULL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS undo (block TEXT PRIMARY KEY, height INTEGER NOT NULL, "
+                             "spent BLOB NOT NULL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            version = self._check_schema()
+        if version != str(SCHEMA_VERSION):
+            self._db.close()
+            raise ValueError("Database {} is not a UTXO set of version {}".format(path, SCHEMA_VERSION))
+        self._cache = {}
+        """Cached outputs. Maps the reference to the output or to None
+        if the output was spent."""
+        self._dirty = set()
+        """References of the cached outputs which differ from the
+        database."""
+        self._undo = {}
+        """Undo data which is not written yet. Maps the address of the
+        block to a tuple of the height of the block and the spent
+        outputs or to None if the undo data was removed."""
+        self._undo_limit = None
+        """Height up to which the undo data is dropped on the next
+        flush."""
+        self.flushes = 0
+        """Number of times the cache was written to the database."""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'best_block'").fetchone()
+        self.best_block = row[0] if row else None
+
+    def _check_schema(self):
+        """Will return the schema version of the database. The version
+        of the current schema is written into a new database."""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is not None:
+            return row[0]
+        # A database of an older version has no version, but data.
+        used = self._db.execute("SELECT (SELECT COUNT(*) FROM utxo) + (SELECT COUNT(*) FROM undo) + "
+                                "(SELECT COUNT(*) FROM meta)").fetchone()[0]
+        if used:
+            return None
+        self._db.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+        return str(SCHEMA_VERSION)
+
+    def __len__(self):
+        self.flush()
+        return self._db.execute("SELECT COUNT(*) FROM utxo").fetchone()[0]
+
+    def get(self, reference):
+        if reference in self._cache:
+            return self._cache[reference]
+        row = self._db.execute("SELECT output FROM utxo WHERE reference = ?", (reference,)).fetchone()
+        output = decode_output(memoryview(row[0]), 0)[0] if row else None
+        if output is not None:
+            self._cache[reference] = output
+        return output
+
+    def items(self):
+        self.flush()
+        for reference, data in self._db.execute("SELECT reference, output FROM utxo"):
+            yield reference, decode_output(memoryview(data), 0)[0]
+
+    def sorted_items(self):
+        self.flush()
+        for reference, data in self._db.execute("SELECT reference, output FROM utxo ORDER BY reference"):
+            yield reference, decode_output(memoryview(data), 0)[0]
+
+    def undo_items(self):
+        self.flush()
+        return [(address, decode_undo(spent))
+                for address, spent in self._db.execute("SELECT block, spent FROM undo ORDER BY height")]
+
+    def clear(self):
+        with self._db:
+            self._db.execute("DELETE FROM utxo")
+            self._db.execute("DELETE FROM undo")
+            self._db.execute("DELETE FROM meta WHERE key != 'schema_version'")
+        self._cache.clear()
+        self._dirty.clear()
+        self._undo.clear()
+        self._undo_limit = None
+        self.best_block = None
+
+    def _add(self, reference, output):
+        self._cache[reference] = output
+        self._dirty.add(reference)
+
+    def _spend(self, reference):
+        output = self.get(reference)
+        if output is not None:
+            self._cache[reference] = None
+            self._dirty.add(reference)
+        return output
+
+    def _put_undo(self, address, height, spent):
+        self._undo[address] = (height, spent)
+        self._undo_limit = height - self.undo_depth
+
+    def _pop_undo(self, address):
+        if address in self._undo:
+            spent = self._undo[address]
+            if spent is not None:
+                spent = spent[1]
+        else:
+            row = self._db.execute("SELECT spent FROM undo WHERE block = ?", (address,)).fetchone()
+            spent = decode_undo(row[0]) if row else None
+        if spent is not None:
+            self._undo[address] = None
+        return spent
+
+    def _commit(self):
+        if len(self._cache) + len(self._undo) > self.cache_size:
+            self.flush()
+
+    def flush(self):
+        """Will write all changes in the cache to the database in a
+        single transaction and empty the cache."""
+        puts = []
+        deletes = []
+        for reference in self._dirty:
+            output = self._cache[reference]
+            if output is None:
+                deletes.append((reference,))
+            else:
+                puts.append((reference, encode_output(output)))
+        with self._db:
+            self._db.executemany("DELETE FROM utxo WHERE reference = ?", deletes)
+            self._db.executemany("INSERT OR REPLACE INTO utxo VALUES (?, ?)", puts)
+            self._db.executemany("DELETE FROM undo WHERE block = ?",
+                                 [(address,) for address, undo in self._undo.items() if undo is None])
+            self._db.executemany("INSERT OR REPLACE INTO undo VALUES (?, ?, ?)",
+                                 [(address, undo[0], encode_undo(undo[1]))
+                                  for address, undo in self._undo.items() if undo is not None])
+            if self._undo_limit is not None:
+                self._db.execute("DELETE FROM undo WHERE height <= ?", (self._undo_limit,))
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('best_block', ?)", (self.best_block,))
+        self._cache.clear()
+        self._dirty.clear()
+        self._undo.clear()
+        self._undo_limit = None
+        self.flushes += 1
+        log.debug("Flushed {} changed outputs of UTXO set".format(len(puts) + len(deletes)))
+
+    def close(self):
+        """Will write the cache to the database and close it."""
+        self.flush()
+        self._db.close()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Mining of new blocks. Mining is done in the background by a
+:class:`MiningJob`. The job is tied to the end of the blockchain and
+will start over as soon as the blockchain changes, so no work is spent
+on blocks which would not link to the end of the blockchain anymore."""
+
+import time
+import asyncio
+import logging
+import threading
+import collections
+import concurrent.futures
+from pynunzen.ledger.block import __block_max_size__, set_nonce
+from pynunzen.ledger.blockchain import BLOCK_CONNECTED, BLOCK_DISCONNECTED, generate_block_template
+from pynunzen.ledger.pow import CHUNK_SIZE, search_range
+from pynunzen.ledger.transaction import (
+    Transaction, CoinbaseInput, Output, Coin, Data,
+    LockScript, UnlockScript, validate_transaction
+)
+
+log = logging.getLogger(__name__)
+
+BLOCK_REWARD = 50
+"""Number of coins the miner of a block receives in the coinbase
+transaction."""
+
+POLL_INTERVAL = 0.1
+"""Seconds to wait for a chunk before the job checks if it was
+cancelled or if the blockchain changed."""
+
+MiningResult = collections.namedtuple("MiningResult", ["template", "nonce", "hashes"])
+"""Result of a :class:`MiningJob`. Holds the mined template, the found
+nonce and the number of hashes generated by the job."""
+
+
+class MiningJob(object):
+
+    """A mining job searches a nonce for a template in a background
+    thread. The template is built by a callable which is called with the
+    blockchain. The returned template must provide a `header`, the
+    static value which is hashed together with the nonce, and a
+    `target`. See :mod:`pynunzen.ledger.pow`.
+
+    When a new block is added to the end of the blockchain, the template
+    is rebuilt and the search starts again. The outcome of the job is
+    available as :class:`concurrent.futures.Future` in :attr:`future`.
+    The job itself can be awaited in a asyncio coroutine."""
+
+    def __init__(self, blockchain, build_template, executor=None, workers=1, chunk_size=CHUNK_SIZE):
+        """
+        :blockchain: :class:Blockchain instance
+        :build_template: Callable which returns a template for the
+        given blockchain.
+        :executor: Optional :class:`concurrent.futures.Executor`. If
+        given, the chunks of the nonce space are searched in the
+        executor. Otherwise they are searched in the thread of the job.
+        :workers: Number of chunks which are searched at the same time
+        in the executor.
+        :chunk_size: Number of nonces in a chunk.
+        """
+        self.blockchain = blockchain
+        self.build_template = build_template
+        self.executor = executor
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.future = concurrent.futures.Future()
+        """Future which will hold the :class:`MiningResult`"""
+        self.template = None
+        """Template the job is currently working on."""
+        self.hashes = 0
+        """Number of hashes generated so far."""
+        self.restarts = 0
+        """Number of times the job started over on a new template."""
+        self._started = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stale = threading.Event()
+
+    def __await__(self):
+        return asyncio.wrap_future(self.future).__await__()
+
+    @property
+    def progress(self):
+        """Will return the progress of the job.
+
+        Example::
+
+            {
+                'hashes': 1520000,
+                'restarts': 1,
+                'elapsed': 12.5,
+                'hashrate': 121600.0,
+                'done': False
+            }
+
+        :returns: Dictionary
+        """
+        elapsed = time.time() - self._started if self._started else 0.0
+        return {
+            "hashes": self.hashes,
+            "restarts": self.restarts,
+            "elapsed": elapsed,
+            "hashrate": self.hashes / elapsed if elapsed else 0.0,
+            "done": self.future.done()
+        }
+
+    def start(self):
+        """Will start the job in a background thread.
+
+        :returns: :attr:`future`
+        """
+        if self._thread is not None:
+            raise RuntimeError("Mining job has already been started")
+        self._started = time.time()
+        self.blockchain.subscribe(self._on_change)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self.future
+
+    def cancel(self):
+        """Will stop the job. The job will stop after the currently
+        searched chunks are finished.
+
+        :returns: True if the job was cancelled, False if it was
+        already done.
+        """
+        with self._lock:
+            return self.future.cancel()
+
+    def result(self, timeout=None):
+        """Will wait for the job to be done and return the
+        :class:`MiningResult`.
+
+        :timeout: Seconds to wait. None waits forever.
+        :returns: :class:`MiningResult`
+        """
+        return self.future.result(timeout)
+
+    def _on_change(self, event, block):
+        if event in (BLOCK_CONNECTED, BLOCK_DISCONNECTED):
+            self._stale.set()
+
+    def _interrupted(self):
+        return self.future.cancelled() or self._stale.is_set()
+
+    def _run(self):
+        try:
+            restart = False
+            while not self.future.cancelled():
+                self._stale.clear()
+                self.template = self.build_template(self.blockchain)
+                if restart:
+                    # Only count the restart once the new template is in
+                    # place, so a observer of restarts sees the template.
+                    self.restarts += 1
+                nonce = self._search(self.template)
+                if nonce is not None and not self._stale.is_set():
+                    result = MiningResult(self.template, nonce, self.hashes)
+                    with self._lock:
+                        if not self.future.cancelled():
+                            self.future.set_result(result)
+                    return
+                if self._stale.is_set():
+                    restart = True
+                    log.info("Blockchain has changed. Restarting mining job")
+        except Exception as e:
+            with self._lock:
+                if not self.future.cancelled():
+                    self.future.set_exception(e)
+        finally:
+            self.blockchain.unsubscribe(self._on_change)
+
+    def _search(self, template):
+        """Will search a nonce for the given template until a nonce is
+        found, the job gets cancelled or the template gets stale.
+
+        :template: Template to search a nonce for.
+        :returns: nonce or None
+        """
+        start = 0
+        if self.executor is None:
+            while not self._interrupted():
+                nonce, count = search_range(template.header, None, start,
+                                            start + self.chunk_size, template.target)
+                self.hashes += count
+                if nonce is not None:
+                    return nonce
+                start += self.chunk_size
+            return None
+
+        pending = set()
+        try:
+            while not self._interrupted():
+                while len(pending) < self.workers:
+                    pending.add(self.executor.submit(search_range, template.header, None, start,
+                                                     start + self.chunk_size, template.target))
+                    start += self.chunk_size
+                done, pending = concurrent.futures.wait(
+                    pending, timeout=POLL_INTERVAL,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for chunk in done:
+                    nonce, count = chunk.result()
+                    self.hashes += count
+                    if nonce is not None:
+                        return nonce
+            return None
+        finally:
+            for chunk in pending:
+                chunk.cancel()
+
+
+class Miner(object):
+
+    """The miner collects pending transactions and mines new blocks
+    with them. Each block starts with a coinbase transaction which pays
+    the reward to the address of the miner. Mined blocks are appended
+    to the blockchain."""
+
+    def __init__(self, blockchain, address, executor=None, workers=1, chunk_size=CHUNK_SIZE):
+        """
+        :blockchain: :class:Blockchain instance
+        :address: Address which receives the reward for mined blocks.
+        :executor: Optional executor used by the mining jobs.
+        :workers: Number of chunks searched at the same time in the
+        executor.
+        :chunk_size: Number of nonces in a chunk.
+        """
+        self.blockchain = blockchain
+        self.address = address
+        self.executor = executor
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.pending = collections.OrderedDict()
+        """Transactions which are waiting to be included in a block.
+        The key is the hash of the transaction."""
+        self.job = None
+        """Current :class:`MiningJob`"""
+        self._running = False
+
+    def add_transaction(self, transaction):
+        """Will add the given transaction to the pending transactions
+        if it is valid.
+
+        :transaction: :class:Transaction instance
+        :returns: True or False
+        """
+        if not validate_transaction(transaction, self.blockchain):
+            return False
+        self.pending[transaction.hash] = transaction
+        return True
+
+    def build_template(self, blockchain):
+        """Will build a new block template on the end of the given
+        blockchain. The block holds a new coinbase transaction followed
+        by the pending transactions.
+
+        :blockchain: :class:Blockchain instance
+        :returns: :class:Block instance
+        """
+        index = blockchain.end.index + 1
+        tx_in = CoinbaseInput(Data(str(index)), UnlockScript(None), UnlockScript(None))
+        tx_out = Output(Coin(BLOCK_REWARD), LockScript(self.address))
+        data = [Transaction([tx_in], [tx_out])]
+        data.extend(list(self.pending.values())[:__block_max_size__ - 1])
+        return generate_block_template(blockchain, data)
+
+    def mine_block(self, timeout=None):
+        """Will mine a single block and append it to the blockchain.
+
+        :timeout: Seconds to wait for the block. None waits forever.
+        :returns: :class:Block instance
+        """
+        job = self._new_job()
+        job.start()
+        try:
+            return self._connect(job.result(timeout))
+        finally:
+            job.cancel()
+
+    def start(self):
+        """Will start mining blocks in the background until
+        :meth:`stop` is called."""
+        self._running = True
+        self._next_job()
+
+    def stop(self):
+        """Will stop mining blocks in the background."""
+        self._running = False
+        if self.job is not None:
+            self.job.cancel()
+
+    def _new_job(self):
+        self.job = MiningJob(self.blockchain, self.build_template, self.executor,
+                             self.workers, self.chunk_size)
+        return self.job
+
+    def _next_job(self):
+        job = self._new_job()
+        job.future.add_done_callback(self._on_done)
+        job.start()
+
+    def _on_done(self, future):
+        if future.cancelled() or not self._running:
+            return
+        try:
+            self._connect(future.result())
+        except ValueError as e:
+            log.error("Mined block can not be appended: {}".format(e))
+        except Exception:
+            # Background mining goes on, even if a subscriber of the
+            # blockchain fails.
+            log.exception("Mined block can not be appended")
+        if self._running:
+            self._next_job()
+
+    def _connect(self, result):
+        block = set_nonce(result.template, result.nonce)
+        self.blockchain.append(block)
+        for transaction in block.data[1:]:
+            self.pending.pop(transaction.hash, None)
+        log.info("Mined block {} after {} hashes".format(block.index, result.hashes))
+        return block
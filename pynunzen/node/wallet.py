@@ -82,6 +82,11 @@ class Wallet(object):
 
         self.path = path
         self.keyring = []
+        self._addresses = None
+        """Cached mapping of addresses to key pairs. Deriving an address
+        from a public key is expensive, so the mapping is only build
+        once. It is dropped when a new key pair is generated."""
+        self._address_set = None
         if os.path.exists(path):
             self.keyring = read_keys(path)
         else:
@@ -108,13 +113,36 @@ class Wallet(object):
                 ...
             }
 
+        The mapping is build once and cached. Call
+        :meth:`invalidate_addresses` if the keyring is changed other
+        than by :meth:`get_new_address`.
+
         :returns: Dictionary with address mapping
         """
-        addresses = collections.OrderedDict()
-        for key in self.keyring:
-            address = pubtoaddr(key["public"])
-            addresses[address] = key
-        return addresses
+        if self._addresses is None:
+            addresses = collections.OrderedDict()
+            for key in self.keyring:
+                address = pubtoaddr(key["public"])
+                addresses[address] = key
+            self._addresses = addresses
+        return self._addresses
+
+    @property
+    def address_set(self):
+        """Returns the addresses of the wallet as frozenset, so an
+        address can be looked up without walking all addresses.
+
+        :returns: frozenset of addresses
+        """
+        if self._address_set is None:
+            self._address_set = frozenset(self.addresses)
+        return self._address_set
+
+    def invalidate_addresses(self):
+        """Will drop the cached addresses. They are derived from the
+        keyring again on next access."""
+        self._addresses = None
+        self._address_set = None
 
     def get_new_address(self):
         """Will generate a new Pynunzen address and a key pair. The key
@@ -127,6 +155,7 @@ class Wallet(object):
         address = pubtoaddr(key["public"])
         self.keyring.append(key)
         write_keys(self.path, self.keyring)
+        self.invalidate_addresses()
         return address
 
 
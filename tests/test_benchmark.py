@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_benchmark
+----------------------------------
+
+Tests for `benchmark` module.
+"""
+
+import json
+from click.testing import CliRunner
+
+
+def test_benchmark_hashrate():
+    from pynunzen.benchmark import benchmark_hashrate
+    result = benchmark_hashrate(1000)
+    assert result["hashes"] == 1000
+    assert result["hashes_per_second"] > 0
+
+
+def test_benchmark_solution_time():
+    from pynunzen.benchmark import benchmark_solution_time
+    result = benchmark_solution_time(4, samples=3)
+    assert result["samples"] == 3
+    assert result["min"] <= result["median"] <= result["max"]
+
+
+def test_benchmark_header_hashrate():
+    from pynunzen.benchmark import benchmark_header_hashrate
+    result = benchmark_header_hashrate(1000)
+    assert result["hashes"] == 1000
+    assert result["hashes_per_second"] > 0
+
+
+def test_benchmark_header_solution_time():
+    from pynunzen.benchmark import benchmark_header_solution_time
+    result = benchmark_header_solution_time(4, samples=3)
+    assert result["samples"] == 3
+    assert result["min"] <= result["median"] <= result["max"]
+
+
+def test_benchmark_scaling():
+    from pynunzen.benchmark import benchmark_scaling
+    result = benchmark_scaling(2, hashes=1000)
+    assert result["workers"] == 2
+    assert result["hashes"] == 1000
+
+
+def test_benchmark_memory():
+    from pynunzen.benchmark import benchmark_memory
+    result = benchmark_memory(1000)
+    assert result["outputs"] == 1000
+    assert result["slots_bytes_per_output"] < result["dict_bytes_per_output"]
+
+
+def test_benchmark_command():
+    from pynunzen import cli
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ["benchmark", "--difficulty", "4", "--samples", "2",
+                                      "--workers", "1", "--hashes", "1000", "--outputs", "100"])
+    assert result.exit_code == 0
+    results = json.loads(result.output)
+    assert set(results.keys()) == set(["environment", "pow", "header", "memory"])
+    assert set(results["pow"].keys()) == set(["hashrate", "solution_time", "scaling"])
+    assert list(results["header"]["solution_time"].keys()) == ["4"]
+    assert list(results["pow"]["solution_time"].keys()) == ["4"]
+    assert results["pow"]["scaling"][0]["workers"] == 1
+    assert results["memory"]["outputs"] == 100
+
+
+def test_benchmark_command_suite():
+    from pynunzen import cli
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ["benchmark", "--suite", "memory", "--outputs", "100"])
+    assert result.exit_code == 0
+    results = json.loads(result.output)
+    assert set(results.keys()) == set(["environment", "memory"])
@@ -81,3 +81,26 @@ def test_get_transaction(coreA, coreB):
 
     # Ensure that the change is readded to an address in out own wallet.
     assert change.script._script in list(coreA.wallet.addresses.keys())
+
+
+def test_build_utxo_wallet_addresses(coreA, alice_wallet):
+    # Only outputs locked to one of the addresses of the wallet are
+    # part of the UTXO of the wallet.
+    assert len(coreA.utxo) == 4
+    for reference in coreA.utxo:
+        tx_hash, idx = reference.split(".")
+        tx = coreA.blockchain.get_transaction(tx_hash)
+        assert tx.outputs[int(idx)].script._script in alice_wallet.address_set
+
+
+def test_balance_cached(coreA):
+    coreA.utxo.clear()
+    # The balance is not computed from the UTXO on access.
+    assert coreA.balance == 4000
+
+
+def test_address_balance(coreA, coreB):
+    address = list(coreA.wallet.addresses.keys())[0]
+    assert coreA.get_address_balance(address) == 4000
+    assert coreA.get_address_balance_units(address) == coreA.balance_units
+    assert coreA.get_address_balance(list(coreB.wallet.addresses.keys())[0]) == 0
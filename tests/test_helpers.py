@@ -40,3 +40,14 @@ def test_double_hash256_nonstring():
     value = 21
     hashed = double_sha256(value)
     assert hashed == "053b22ca1fcea7a8de0da76b0f4deaef4aa9fb1100bff13965c3c0da76272862"
+
+
+def test_double_hash256_bytes():
+    from pynunzen.helpers import double_sha256
+    assert double_sha256(b"Foobar") == double_sha256("Foobar")
+
+
+def test_double_sha256_digest():
+    from pynunzen.helpers import double_sha256_digest
+    digest = double_sha256_digest(b"hello")
+    assert digest.hex() == "9595c9df90075148eb06860365df33584b75bff782a510c6cd4883a419833d50"
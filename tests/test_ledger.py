@@ -53,6 +53,13 @@ def transaction():
     tx_output = Output(Data(""), LockScript(None))
     return Transaction([tx_input], [tx_output])
 
+@pytest.fixture
+def other_transaction():
+    """Fixture for a second transaction which differs from `transaction`."""
+    tx_input = Input(Data(""), UnlockScript(None), "dummytxhash", 1)
+    tx_output = Output(Data(""), LockScript(None))
+    return Transaction([tx_input], [tx_output])
+
 @pytest.fixture
 def coinbasetransaction():
     """Fixture for a empty blockchain."""
@@ -71,25 +78,38 @@ def blockchain_modified_genesis(blockchain):
 
 
 @pytest.fixture
-def block_with_modified_genesis(blockchain_modified_genesis, coinbasetransaction, transaction):
+def block_with_modified_genesis(blockchain_modified_genesis, coinbasetransaction, transaction, other_transaction):
     """Fixture for a empty block."""
-    return generate_new_block(blockchain_modified_genesis, [coinbasetransaction, transaction, transaction])
+    return generate_new_block(blockchain_modified_genesis, [coinbasetransaction, transaction, other_transaction])
 
 
 @pytest.fixture
-def block(blockchain, coinbasetransaction, transaction):
+def block(blockchain, coinbasetransaction, transaction, other_transaction):
     """Fixture for a empty block."""
-    return generate_new_block(blockchain, [coinbasetransaction, transaction, transaction])
+    return generate_new_block(blockchain, [coinbasetransaction, transaction, other_transaction])
 
 
 def test_generate_block_address():
     dt = datetime.datetime(2017, 1, 1, 12, 0, 0)
-    index = 1
     timestamp = utcts(dt)
-    parent = "parent"
-    data = ["My data"]
-    address = generate_block_address(index, timestamp, parent, data)
-    assert address == "27edb13573987de43e061a400f89bbb10992b3b88c5356deaad2344ae2e77c6b"
+    parent = "cd" * 32
+    merkle_root = "ab" * 32
+    address = generate_block_address(parent, merkle_root, timestamp, 0x207fffff, 42)
+    assert address == "407bd61a5ebf7bd55bd20eab2ad04adff71cf475a95a5eff41ada1e0ea353693"
+
+
+def test_generate_block_header():
+    from pynunzen.ledger.block import generate_block_header, HEADER_SIZE
+    timestamp = utcts(datetime.datetime(2017, 1, 1, 12, 0, 0))
+    header = generate_block_header("cd" * 32, "ab" * 32, timestamp, 0x207fffff)
+    assert len(header) + 8 == HEADER_SIZE == 88
+    assert header[:4] == b"\x02\x00\x00\x00"
+    assert header[4:36] == b"\xcd" * 32
+    assert header[36:68] == b"\xab" * 32
+    assert header[-4:] == b"\xff\xff\x7f\x20"
+    # The genesis block has no parent
+    header = generate_block_header(None, "ab" * 32, timestamp, 0x207fffff)
+    assert header[4:36] == bytes(32)
 
 
 def test_generate_genesis_block():
@@ -99,10 +119,27 @@ def test_generate_genesis_block():
     assert block.data[0].inputs[0].data.value == GENESIS_BLOCK_INPUT
 
 
-def test_generate_new_block(blockchain, block, coinbasetransaction, transaction):
+def test_genesis_block_valid():
+    from pynunzen.ledger.blockchain import validate_block_header
+    assert validate_block_header(generate_genesis_block()) is True
+
+
+def test_block_template_without_address(blockchain, coinbasetransaction):
+    from pynunzen.ledger.blockchain import generate_block_template, validate_block_header
+    template = generate_block_template(blockchain, [coinbasetransaction])
+    assert template.nonce is None
+    assert template.address is None
+    with pytest.raises(ValueError):
+        generate_block_address(template.parent, template.merkle_root, template.timestamp,
+                               template.difficulty)
+    with pytest.raises(ValueError):
+        validate_block_header(template)
+
+
+def test_generate_new_block(blockchain, block, coinbasetransaction, transaction, other_transaction):
     assert block.index == 11
     assert block.parent == blockchain.end.address
-    assert block.data == [coinbasetransaction, transaction, transaction]
+    assert block.data == [coinbasetransaction, transaction, other_transaction]
 
 
 def test_generate_new_block_non_coinbase_fail(blockchain, transaction):
@@ -151,6 +188,114 @@ def test_block_validation_fails_address(blockchain, block):
         validate_block(blockchain, block)
 
 
+def test_generate_new_block_mined(blockchain, block):
+    from pynunzen.ledger.pow import verify_target, generate_hash
+    assert block.nonce is not None
+    assert block.address == generate_hash(block.header, block.nonce)
+    assert verify_target(block.address, block.target)
+
+
+def test_generate_block_template(blockchain, coinbasetransaction):
+    from pynunzen.ledger.blockchain import generate_block_template
+    block = generate_block_template(blockchain, [coinbasetransaction])
+    assert block.nonce is None
+    assert block.difficulty == blockchain.next_difficulty
+
+
+def test_block_validation_fails_nonce(blockchain, block):
+    from pynunzen.ledger.block import generate_block_address
+    # Find a nonce which does not meet the target
+    for x in range(100):
+        nonce = x
+        address = generate_block_address(block.parent, block.merkle_root, block.timestamp,
+                                         block.difficulty, nonce)
+        if int(address, 16) > block.target:
+            break
+    block.nonce = nonce
+    block.address = address
+    with pytest.raises(ValueError):
+        validate_block(blockchain, block)
+
+
+def test_block_validation_fails_timestamp(blockchain, block):
+    block.timestamp = blockchain.median_time_past
+    with pytest.raises(ValueError):
+        validate_block(blockchain, block)
+
+
+def test_block_validation_fails_future_timestamp(blockchain, block):
+    block.timestamp += 24 * 60 * 60
+    with pytest.raises(ValueError):
+        validate_block(blockchain, block)
+
+
+def test_block_validation_fails_difficulty(blockchain, block):
+    block.difficulty = 0x1d00ffff
+    with pytest.raises(ValueError):
+        validate_block(blockchain, block)
+
+
+def test_median_time_past(blockchain):
+    timestamps = sorted(b.timestamp for b in blockchain.blocks[-11:])
+    assert blockchain.median_time_past == timestamps[5]
+
+
+def test_next_difficulty_retarget(monkeypatch, coinbasetransaction):
+    from pynunzen.ledger import blockchain as module
+    from pynunzen.ledger.block import Block, mine_block
+    from pynunzen.ledger.pow import MAX_BITS, bits_to_target
+    monkeypatch.setattr(module, "RETARGET_INTERVAL", 4)
+    monkeypatch.setattr(module, "BLOCK_INTERVAL", 100)
+    chain = Blockchain()
+    assert chain.next_difficulty == MAX_BITS
+    timestamp = utcts(datetime.datetime(2017, 5, 1, 12, 0, 0))
+    for x in range(3):
+        end = chain.end
+        chain.append(mine_block(Block(end.index + 1, timestamp + x * 100, end.address,
+                                      [coinbasetransaction], difficulty=chain.next_difficulty)))
+    # Blocks came way too slow, the target is capped at the max target.
+    assert chain.next_difficulty == MAX_BITS
+    for x in range(4):
+        end = chain.end
+        chain.append(mine_block(Block(end.index + 1, end.timestamp + 25, end.address,
+                                      [coinbasetransaction], difficulty=chain.next_difficulty)))
+    # The last four blocks came four times faster than expected.
+    assert bits_to_target(chain.next_difficulty) < bits_to_target(MAX_BITS) // 3
+
+
+def test_add_block_side_difficulty(monkeypatch, coinbasetransaction):
+    from pynunzen.ledger import blockchain as module
+    from pynunzen.ledger.block import Block, mine_block
+    from pynunzen.ledger.pow import MAX_BITS
+    monkeypatch.setattr(module, "RETARGET_INTERVAL", 4)
+    monkeypatch.setattr(module, "BLOCK_INTERVAL", 100)
+    timestamp = utcts(datetime.datetime(2017, 5, 1, 12, 0, 0))
+    tx_in = CoinbaseInput(Data("main"), UnlockScript(None), UnlockScript(None))
+    tx = Transaction([tx_in], [Output(Coin(50), LockScript("main"))])
+    main = Blockchain()
+    for x in range(8):
+        end = main.end
+        main.append(mine_block(Block(end.index + 1, timestamp + x * 1000, end.address,
+                                     [tx], difficulty=main.next_difficulty)))
+    chain = Blockchain()
+    for x in range(8):
+        end = chain.end
+        chain.append(mine_block(Block(end.index + 1, timestamp + x * 25, end.address,
+                                      [coinbasetransaction], difficulty=chain.next_difficulty)))
+    assert chain.end.difficulty != MAX_BITS
+    for block in chain.blocks[1:-1]:
+        main.add_block(block)
+    # The difficulty of the side block is retargeted over the side branch.
+    end = chain.blocks[-2]
+    cheap = mine_block(Block(end.index + 1, end.timestamp + 25, end.address,
+                             [coinbasetransaction], difficulty=MAX_BITS))
+    with pytest.raises(ValueError):
+        main.add_block(cheap)
+    assert cheap.address not in main._side
+    main.add_block(chain.end)
+    assert main.end.address == chain.end.address
+
+
 def test_add_block(blockchain, block):
     blockchain.append(block)
     assert blockchain.length == 12
@@ -163,6 +308,22 @@ def test_add_block_fail(blockchain, block, coinbasetransaction, transaction):
         blockchain.append(fail_block)
 
 
+def test_extend(blockchain):
+    chain = Blockchain()
+    chain.extend(blockchain.blocks[1:], workers=2)
+    assert chain.length == blockchain.length
+    assert chain.end is blockchain.end
+
+
+def test_extend_fail_pow(blockchain):
+    blocks = blockchain.blocks[1:]
+    blocks[3].nonce = None
+    chain = Blockchain()
+    with pytest.raises(ValueError):
+        chain.extend(blocks)
+    assert chain.length == 1
+
+
 def test_wrong_block_data_container(blockchain):
     with pytest.raises(ValueError):
         generate_new_block(blockchain, "Foo")
@@ -193,3 +354,277 @@ def test_get_transaction(blockchain):
 def test_get_transaction_fail(blockchain):
     tx = blockchain.get_transaction("xxx")
     assert tx is None
+
+
+def test_block_from_bytes(coinbasetransaction):
+    from pynunzen.ledger.block import Block
+    blockchain = Blockchain()
+    block = generate_new_block(blockchain, [coinbasetransaction])
+    decoded = Block.from_bytes(block.to_bytes())
+    assert decoded.address == block.address
+    assert decoded.header == block.header
+    assert [tx.hash for tx in decoded.data] == [tx.hash for tx in block.data]
+    blockchain.append(decoded)
+    assert blockchain.end is decoded
+
+
+def test_genesis_block_from_bytes():
+    from pynunzen.ledger.block import Block
+    from pynunzen.ledger.blockchain import generate_genesis_block
+    block = generate_genesis_block()
+    decoded = Block.from_bytes(block.to_bytes())
+    assert decoded.parent is None
+    assert decoded.address == block.address
+
+
+def test_block_from_bytes_fail(blockchain):
+    from pynunzen.ledger.block import Block
+    data = blockchain.blocks[1].to_bytes()
+    with pytest.raises(ValueError):
+        Block.from_bytes(data[:-1])
+    with pytest.raises(ValueError):
+        Block.from_bytes(data + b"\x00")
+
+
+def test_block_merkle_proof(block):
+    tx = block.data[1]
+    index, proof = block.get_proof(tx.hash)
+    assert index == 1
+    assert block.verify_proof(tx.hash, index, proof) is True
+    assert block.verify_proof(tx.hash, len(block.data), proof) is False
+    assert block.get_proof("00" * 32) is None
+
+
+def test_block_validation_fails_merkle_root(blockchain, block):
+    block.data.pop()
+    with pytest.raises(ValueError):
+        validate_block(blockchain, block)
+
+
+def test_block_validation_fails_duplicate_transaction(blockchain, block, other_transaction):
+    from pynunzen.ledger.blockchain import validate_block_header
+    from pynunzen.ledger.merkle import merkle_root
+    # A duplicated last transaction does not change the merkle root.
+    hashes = [tx.hash for tx in block.data]
+    assert merkle_root(hashes + hashes[-1:]) == block.merkle_root
+    block.data.append(other_transaction)
+    with pytest.raises(ValueError):
+        validate_block_header(block)
+    with pytest.raises(ValueError):
+        validate_block(blockchain, block)
+
+
+def test_get_transaction_location(blockchain):
+    tx = blockchain.blocks[3].data[0]
+    assert blockchain.get_transaction_location(tx.hash) == (3, 0)
+    assert blockchain.get_transaction_location("1234") is None
+
+
+def test_get_transaction_appended(blockchain, block):
+    blockchain.append(block)
+    assert blockchain.get_transaction(block.data[1].hash) is block.data[1]
+    assert blockchain.get_transaction_location(block.data[1].hash) == (blockchain.length - 1, 1)
+
+
+def test_pop(blockchain, block):
+    median_time_past = blockchain.median_time_past
+    blockchain.append(block)
+    events = []
+    blockchain.subscribe(lambda event, block: events.append((event, block)))
+    assert blockchain.pop() is block
+    assert events == [("disconnected", block)]
+    assert blockchain.get_transaction(block.data[0].hash) is None
+    assert blockchain.median_time_past == median_time_past
+    # The block can be appended again
+    blockchain.append(block)
+    assert blockchain.end is block
+
+
+def test_pop_genesis():
+    blockchain = Blockchain()
+    with pytest.raises(ValueError):
+        blockchain.pop()
+
+
+def test_reindex(blockchain):
+    tx = blockchain.blocks[5].data[0]
+    assert blockchain.get_transaction(tx.hash) is tx
+    blockchain._tx_index.clear()
+    assert blockchain.get_transaction(tx.hash) is None
+    blockchain.reindex()
+    assert blockchain.get_transaction(tx.hash) is tx
+
+
+def test_get_block(blockchain):
+    block = blockchain.blocks[4]
+    assert blockchain.get_block(block.address) is block
+    assert blockchain.get_block("1234") is None
+    assert blockchain.get_block(GENESIS_BLOCK_ADDRESS) is blockchain.blocks[0]
+
+
+def test_get_block_by_height(blockchain):
+    assert blockchain.get_block_by_height(0) is blockchain.blocks[0]
+    assert blockchain.get_block_by_height(blockchain.length - 1) is blockchain.end
+    assert blockchain.get_block_by_height(blockchain.length) is None
+    assert blockchain.get_block_by_height(-1) is None
+
+
+def test_get_blocks_by_time(blockchain, block):
+    genesis = blockchain.blocks[0]
+    assert blockchain.get_blocks_by_time(genesis.timestamp, genesis.timestamp + 1) == [genesis]
+    assert blockchain.get_blocks_by_time(0, genesis.timestamp) == []
+    assert blockchain.get_blocks_by_time(0, block.timestamp + 1) == blockchain.blocks
+    blockchain.append(block)
+    assert blockchain.get_blocks_by_time(block.timestamp, block.timestamp + 1)[-1] is block
+    blockchain.pop()
+    assert block not in blockchain.get_blocks_by_time(block.timestamp, block.timestamp + 1)
+    assert blockchain.get_block(block.address) is None
+
+
+def _fork(length, tag):
+    """Will return a new blockchain with `length` mined blocks after
+    the genesis block."""
+    chain = Blockchain()
+    for x in range(length):
+        tx_in = CoinbaseInput(Data("{}{}".format(tag, x)), UnlockScript(None), UnlockScript(None))
+        tx_out = Output(Coin(50), LockScript(tag))
+        chain.append(generate_new_block(chain, [Transaction([tx_in], [tx_out])]))
+    return chain
+
+
+def test_block_work():
+    from pynunzen.ledger.pow import MAX_BITS, bits_to_target
+    chain = Blockchain()
+    assert chain.end.work == 2 ** 256 // (bits_to_target(MAX_BITS) + 1)
+    assert chain.work == chain.end.work
+
+
+def test_add_block_side_branch():
+    chain = _fork(2, "a")
+    other = _fork(2, "b")
+    events = []
+    chain.subscribe(lambda event, block: events.append(event))
+    assert chain.add_block(other.blocks[1]) is True
+    assert chain.add_block(other.blocks[1]) is False
+    # Equal work keeps the blockchain seen first
+    assert chain.add_block(other.blocks[2]) is True
+    assert chain.end.address != other.end.address
+    assert events == []
+
+
+def test_add_block_reorganize():
+    chain = _fork(2, "a")
+    main = list(chain.blocks)
+    other = _fork(3, "b")
+    events = []
+    chain.subscribe(lambda event, block: events.append((event, block.address)))
+    for block in other.blocks[1:]:
+        chain.add_block(block)
+    assert [block.address for block in chain.blocks] == [block.address for block in other.blocks]
+    assert chain.work == other.work
+    assert events == [("disconnected", main[2].address),
+                      ("disconnected", main[1].address),
+                      ("connected", other.blocks[1].address),
+                      ("connected", other.blocks[2].address),
+                      ("connected", other.blocks[3].address)]
+    assert chain.get_transaction(main[1].data[0].hash) is None
+    assert chain.get_transaction(other.blocks[2].data[0].hash) is other.blocks[2].data[0]
+    # The old blocks are kept as side branch
+    assert chain.add_block(main[1]) is False
+
+
+def test_add_block_unknown_parent():
+    chain = _fork(1, "a")
+    other = _fork(2, "b")
+    with pytest.raises(ValueError):
+        chain.add_block(other.blocks[2])
+
+
+def test_add_block_reorganize_invalid():
+    from pynunzen.ledger.block import Block, mine_block
+    chain = _fork(1, "a")
+    main = list(chain.blocks)
+    genesis = chain.blocks[0]
+    tx_in = CoinbaseInput(Data("b"), UnlockScript(None), UnlockScript(None))
+    tx = Transaction([tx_in], [Output(Coin(50), LockScript("b"))])
+    # A block with a harder target than expected has more work, but is
+    # not valid.
+    block = mine_block(Block(1, chain.end.timestamp, genesis.address, [tx], difficulty=0x1f7fffff))
+    with pytest.raises(ValueError):
+        chain.add_block(block)
+    assert [b.address for b in chain.blocks] == [b.address for b in main]
+    assert block.address not in chain._side
+
+
+def test_side_branch_pruned(monkeypatch):
+    import pynunzen.ledger.blockchain
+    monkeypatch.setattr(pynunzen.ledger.blockchain, "MAX_REORG_DEPTH", 2)
+    chain = _fork(1, "a")
+    other = _fork(1, "b")
+    chain.add_block(other.blocks[1])
+    assert other.blocks[1].address in chain._side
+    for x in range(3):
+        tx_in = CoinbaseInput(Data("c{}".format(x)), UnlockScript(None), UnlockScript(None))
+        tx = Transaction([tx_in], [Output(Coin(50), LockScript("c"))])
+        chain.add_block(generate_new_block(chain, [tx]))
+    # The side block is more than two blocks below the end.
+    assert chain._side == {}
+    # Blocks forking off too deep are not followed anymore.
+    with pytest.raises(ValueError):
+        chain.add_block(other.blocks[1])
+
+
+def test_add_block_reorganize_subscriber_fails():
+    chain = _fork(2, "a")
+    main = [block.address for block in chain.blocks]
+    other = _fork(3, "b")
+    events = []
+
+    def subscriber(event, block):
+        events.append(event)
+        if len(events) == 2:
+            raise RuntimeError("Subscriber failed")
+
+    chain.subscribe(subscriber)
+    chain.add_block(other.blocks[1])
+    chain.add_block(other.blocks[2])
+    with pytest.raises(RuntimeError):
+        chain.add_block(other.blocks[3])
+    # The first disconnected block was connected again.
+    assert [block.address for block in chain.blocks] == main
+    assert events == ["disconnected", "disconnected", "connected"]
+    assert chain.work == _fork(2, "c").work
+
+
+def test_add_block_reorganize_connect_fails():
+    from pynunzen.ledger.utxo import UTXOSet
+    chain = _fork(2, "a")
+    main = [block.address for block in chain.blocks]
+    utxo = UTXOSet()
+    for block in chain.blocks:
+        utxo.connect(block)
+    before = sorted(utxo.outputs.items())
+    other = _fork(3, "b")
+    events = []
+
+    def apply(event, block):
+        if event == "connected":
+            utxo.connect(block)
+        else:
+            utxo.disconnect(block)
+
+    def subscriber(event, block):
+        events.append(event)
+        if events.count("connected") == 1:
+            raise RuntimeError("Subscriber failed")
+
+    chain.subscribe(apply)
+    chain.subscribe(subscriber)
+    chain.add_block(other.blocks[1])
+    chain.add_block(other.blocks[2])
+    with pytest.raises(RuntimeError):
+        chain.add_block(other.blocks[3])
+    # The block whose connect failed is not disconnected again.
+    assert [block.address for block in chain.blocks] == main
+    assert events == ["disconnected", "disconnected", "connected", "connected", "connected"]
+    assert sorted(utxo.outputs.items()) == before
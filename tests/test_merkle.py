@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_merkle
+----------------------------------
+
+Tests for `merkle` module.
+"""
+
+import pytest
+from pynunzen.helpers import double_sha256_digest
+
+HASHES = [double_sha256_digest(str(x).encode("utf-8")).hex() for x in range(5)]
+
+
+def test_merkle_root_single():
+    from pynunzen.ledger.merkle import merkle_root
+    assert merkle_root(HASHES[:1]) == HASHES[0]
+
+
+def test_merkle_root_pair():
+    from pynunzen.ledger.merkle import merkle_root
+    expected = double_sha256_digest(bytes.fromhex(HASHES[0]) + bytes.fromhex(HASHES[1])).hex()
+    assert merkle_root(HASHES[:2]) == expected
+
+
+def test_merkle_root_odd():
+    from pynunzen.ledger.merkle import merkle_root
+    # The last hash of an odd level is paired with itself.
+    assert merkle_root(HASHES[:3]) == merkle_root(HASHES[:3] + HASHES[2:3])
+
+
+def test_merkle_root_order():
+    from pynunzen.ledger.merkle import merkle_root
+    assert merkle_root(HASHES) != merkle_root(list(reversed(HASHES)))
+
+
+def test_merkle_tree_empty():
+    from pynunzen.ledger.merkle import MerkleTree
+    with pytest.raises(ValueError):
+        MerkleTree([])
+
+
+def test_merkle_proof():
+    from pynunzen.ledger.merkle import MerkleTree, verify_proof
+    for count in range(1, len(HASHES) + 1):
+        tree = MerkleTree(HASHES[:count])
+        for index, tx_hash in enumerate(HASHES[:count]):
+            proof = tree.proof(index)
+            assert verify_proof(tx_hash, index, proof, tree.root, count) is True
+
+
+def test_merkle_proof_fail():
+    from pynunzen.ledger.merkle import MerkleTree, verify_proof
+    tree = MerkleTree(HASHES)
+    proof = tree.proof(1)
+    assert verify_proof(HASHES[2], 1, proof, tree.root, len(HASHES)) is False
+    assert verify_proof(HASHES[1], 0, proof, tree.root, len(HASHES)) is False
+    with pytest.raises(IndexError):
+        tree.proof(len(HASHES))
+
+
+def test_merkle_proof_bounds():
+    from pynunzen.ledger.merkle import MerkleTree, verify_proof
+    tree = MerkleTree(HASHES[:3])
+    # The duplicated last leaf of the odd level is not a transaction.
+    assert verify_proof(HASHES[2], 3, tree.proof(2), tree.root, 3) is False
+    # The root itself is not a transaction.
+    assert verify_proof(tree.root, 0, [], tree.root, 3) is False
+    # An inner node is not a transaction.
+    inner = tree.levels[1][0].hex()
+    assert verify_proof(inner, 0, tree.proof(0)[1:], tree.root, 3) is False
+    assert verify_proof(HASHES[0], 0, tree.proof(0), tree.root, 5) is False
+
+
+def test_merkle_tree_depth():
+    from pynunzen.ledger.merkle import MerkleTree, tree_depth
+    for count in range(1, 10):
+        assert tree_depth(count) == len(MerkleTree(HASHES[:1] * count).levels) - 1
+
+
+def test_merkle_index():
+    from pynunzen.ledger.merkle import MerkleTree
+    tree = MerkleTree(HASHES)
+    assert tree.index(HASHES[3]) == 3
+    assert tree.index("00" * 32) is None
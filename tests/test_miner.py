@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_miner
+----------------------------------
+
+Tests for `miner` module.
+"""
+
+import time
+import asyncio
+import collections
+import concurrent.futures
+import pytest
+
+from pynunzen.ledger.blockchain import Blockchain, generate_new_block
+from pynunzen.ledger.pow import generate_hash, verify_target, difficulty_to_target
+from pynunzen.ledger.transaction import Transaction, CoinbaseInput, Output, Data, UnlockScript, LockScript
+from pynunzen.node.miner import MiningJob
+
+Template = collections.namedtuple("Template", ["header", "target"])
+
+
+def easy_template(blockchain):
+    return Template(blockchain.end.address, difficulty_to_target(8))
+
+
+def impossible_template(blockchain):
+    return Template(blockchain.end.address, 0)
+
+
+def new_block(blockchain):
+    tx_in = CoinbaseInput(Data("xxx"), UnlockScript(None), UnlockScript(None))
+    tx_out = Output(Data(""), LockScript(None))
+    return generate_new_block(blockchain, [Transaction([tx_in], [tx_out])])
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError("Condition not met within {} seconds".format(timeout))
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def blockchain():
+    return Blockchain()
+
+
+def test_mining_job(blockchain):
+    job = MiningJob(blockchain, easy_template, chunk_size=100)
+    job.start()
+    result = job.result(timeout=10)
+    assert result.template.header == blockchain.end.address
+    assert verify_target(generate_hash(result.template.header, result.nonce), result.template.target)
+    assert result.hashes == job.progress["hashes"]
+    assert job.progress["done"] is True
+
+
+def test_mining_job_executor(blockchain):
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        job = MiningJob(blockchain, easy_template, executor, workers=2, chunk_size=100)
+        job.start()
+        result = job.result(timeout=10)
+    assert verify_target(generate_hash(result.template.header, result.nonce), result.template.target)
+
+
+def test_mining_job_cancel(blockchain):
+    job = MiningJob(blockchain, impossible_template, chunk_size=100)
+    job.start()
+    wait_for(lambda: job.hashes > 0)
+    assert job.cancel() is True
+    job._thread.join(5)
+    assert not job._thread.is_alive()
+    assert job.future.cancelled()
+
+
+def test_mining_job_start_twice(blockchain):
+    job = MiningJob(blockchain, impossible_template, chunk_size=100)
+    job.start()
+    with pytest.raises(RuntimeError):
+        job.start()
+    job.cancel()
+
+
+def test_mining_job_restart(blockchain):
+    job = MiningJob(blockchain, impossible_template, chunk_size=100)
+    job.start()
+    wait_for(lambda: job.template is not None)
+    blockchain.append(new_block(blockchain))
+    wait_for(lambda: job.restarts == 1)
+    assert job.template.header == blockchain.end.address
+    job.cancel()
+
+
+def test_mining_job_restart_disconnected(blockchain):
+    blockchain.append(new_block(blockchain))
+    job = MiningJob(blockchain, impossible_template, chunk_size=100)
+    job.start()
+    wait_for(lambda: job.template is not None)
+    blockchain.pop()
+    wait_for(lambda: job.restarts == 1)
+    assert job.template.header == blockchain.end.address
+    job.cancel()
+
+
+def test_mining_job_await(blockchain):
+    job = MiningJob(blockchain, easy_template, chunk_size=100)
+
+    async def mine():
+        job.start()
+        return await job
+
+    loop = asyncio.new_event_loop()
+    try:
+        result = loop.run_until_complete(mine())
+    finally:
+        loop.close()
+    assert result.nonce is not None
+
+
+@pytest.fixture
+def miner(blockchain):
+    from pynunzen.node.miner import Miner
+    return Miner(blockchain, "minersaddress", chunk_size=100)
+
+
+def test_miner_mine_block(blockchain, miner):
+    from pynunzen.ledger.pow import verify_target
+    from pynunzen.node.miner import BLOCK_REWARD
+    block = miner.mine_block(timeout=10)
+    assert blockchain.end is block
+    assert block.nonce is not None
+    assert verify_target(block.address, block.target)
+    coinbase = block.data[0]
+    assert coinbase.outputs[0].data.value == BLOCK_REWARD
+    assert coinbase.outputs[0].script._script == "minersaddress"
+
+
+def test_miner_pending_transaction(blockchain, miner):
+    from pynunzen.ledger.transaction import Input, Coin
+    block = miner.mine_block(timeout=10)
+    coinbase = block.data[0]
+    tx_in = Input(Coin(50), UnlockScript("minersaddress"), coinbase.hash, 0)
+    tx_out = Output(Coin(50), LockScript("receiver"))
+    transaction = Transaction([tx_in], [tx_out])
+    assert miner.add_transaction(transaction) is True
+    block = miner.mine_block(timeout=10)
+    assert block.data[1] is transaction
+    assert len(miner.pending) == 0
+
+
+def test_miner_invalid_transaction(miner):
+    from pynunzen.ledger.transaction import Input, Coin
+    tx_in = Input(Coin(50), UnlockScript("minersaddress"), "unknown", 0)
+    transaction = Transaction([tx_in], [Output(Coin(50), LockScript("receiver"))])
+    assert miner.add_transaction(transaction) is False
+    assert len(miner.pending) == 0
+
+
+def test_miner_start_stop(blockchain, miner):
+    miner.start()
+    wait_for(lambda: blockchain.length >= 3)
+    miner.stop()
+    assert miner.job.future.done()
+
+
+def test_miner_subscriber_fails(blockchain, miner):
+    failed = []
+
+    def fail(event, block):
+        if not failed:
+            failed.append(block)
+            raise RuntimeError("Subscriber failed")
+
+    blockchain.subscribe(fail)
+    miner.start()
+    wait_for(lambda: blockchain.length >= 3)
+    miner.stop()
+    assert len(failed) == 1
@@ -23,3 +23,166 @@ def test_find_nonce():
 def test_verify_nonce():
     from pynunzen.ledger.pow import verify_hash
     assert verify_hash(TEST_HASH, 2) is True
+
+
+def test_search_range():
+    from pynunzen.ledger.pow import search_range, generate_hash, verify_hash
+    nonce, hashes = search_range(TEST_VALUE, 4, 0, 10000)
+    assert verify_hash(generate_hash(TEST_VALUE, nonce), 4) is True
+    assert hashes == int(nonce, 16) + 1
+
+
+def test_search_range_exhausted():
+    from pynunzen.ledger.pow import search_range
+    nonce, hashes = search_range(TEST_VALUE, 256, 100, 150)
+    assert nonce is None
+    assert hashes == 50
+
+
+def test_find_nonce_parallel():
+    from pynunzen.ledger.pow import find_nonce_parallel, generate_hash, verify_hash
+    nonce, hashes = find_nonce_parallel(TEST_VALUE, 8, workers=2, chunk_size=100)
+    assert verify_hash(generate_hash(TEST_VALUE, nonce), 8) is True
+    assert hashes >= 1
+
+
+def test_find_nonce_workers():
+    from pynunzen.ledger.pow import find_nonce, generate_hash, verify_hash
+    nonce = find_nonce(TEST_VALUE, 4, workers=2)
+    assert verify_hash(generate_hash(TEST_VALUE, nonce), 4) is True
+
+
+def test_find_nonce_deterministic():
+    from pynunzen.ledger.pow import find_nonce, search_range
+    nonce = find_nonce(TEST_VALUE, 6, chunk_size=10)
+    assert nonce == search_range(TEST_VALUE, 6, 0, 10000)[0]
+
+
+def test_find_nonce_start():
+    from pynunzen.ledger.pow import find_nonce
+    nonce = find_nonce(TEST_VALUE, 6)
+    resumed = find_nonce(TEST_VALUE, 6, start=int(nonce, 16) + 1)
+    assert int(resumed, 16) > int(nonce, 16)
+
+
+def test_verify_nonce_fail():
+    from pynunzen.ledger.pow import verify_hash
+    assert verify_hash(TEST_HASH, 3) is False
+
+
+def test_bits_to_target():
+    from pynunzen.ledger.pow import bits_to_target
+    assert bits_to_target(0x1d00ffff) == 0xffff << 208
+    assert bits_to_target(0x03123456) == 0x123456
+    assert bits_to_target(0x02123400) == 0x1234
+
+
+def test_bits_to_target_negative():
+    from pynunzen.ledger.pow import bits_to_target
+    with pytest.raises(ValueError):
+        bits_to_target(0x1d80ffff)
+
+
+def test_target_to_bits():
+    from pynunzen.ledger.pow import target_to_bits, bits_to_target, MAX_BITS
+    assert target_to_bits(0xffff << 208) == 0x1d00ffff
+    assert target_to_bits(0x80) == 0x02008000
+    assert target_to_bits(bits_to_target(MAX_BITS)) == MAX_BITS
+
+
+def test_difficulty_to_target():
+    from pynunzen.ledger.pow import difficulty_to_target, target_to_difficulty
+    assert difficulty_to_target(8) == (1 << 248) - 1
+    assert difficulty_to_target(8) > difficulty_to_target(8.5) > difficulty_to_target(9)
+    assert round(target_to_difficulty(difficulty_to_target(12)), 6) == 12
+
+
+def test_verify_target():
+    from pynunzen.ledger.pow import verify_target
+    target = int(TEST_HASH, 16)
+    assert verify_target(TEST_HASH, target) is True
+    assert verify_target(TEST_HASH, target - 1) is False
+    assert verify_target(bytes.fromhex(TEST_HASH), target) is True
+    assert verify_target(bytes.fromhex(TEST_HASH), target - 1) is False
+
+
+def test_find_nonce_target():
+    from pynunzen.ledger.pow import find_nonce, generate_hash, verify_target, difficulty_to_target
+    target = difficulty_to_target(10)
+    nonce = find_nonce(TEST_VALUE, target=target)
+    assert verify_target(generate_hash(TEST_VALUE, nonce), target) is True
+
+
+def test_retarget():
+    from pynunzen.ledger.pow import retarget, bits_to_target
+    bits = 0x1d00ffff
+    assert retarget(bits, 600, 600) == bits
+    assert bits_to_target(retarget(bits, 300, 600)) == bits_to_target(bits) // 2
+    # Adjustment is limited to a factor of 4
+    assert retarget(bits, 1, 600) == retarget(bits, 150, 600)
+
+
+def test_retarget_max_target():
+    from pynunzen.ledger.pow import retarget, MAX_BITS
+    assert retarget(MAX_BITS, 2400, 600) == MAX_BITS
+
+
+def test_verify_batch():
+    from pynunzen.ledger.pow import verify_batch, find_nonce, generate_hash, MAX_BITS, MAX_TARGET
+    headers = []
+    for x in range(10):
+        value = "{}{}".format(TEST_VALUE, x)
+        nonce = find_nonce(value, target=MAX_TARGET)
+        headers.append((value, nonce, generate_hash(value, nonce), MAX_BITS))
+    assert verify_batch(headers) is None
+    assert verify_batch(headers, workers=2, chunk_size=3) is None
+    headers[7] = (headers[7][0], headers[7][1], headers[6][2], MAX_BITS)
+    headers[8] = (headers[8][0], None, headers[8][2], MAX_BITS)
+    assert verify_batch(headers) == 7
+    assert verify_batch(headers, workers=2, chunk_size=3) == 7
+
+
+def test_search_range_header():
+    from pynunzen.ledger.pow import search_range, generate_hash, verify_target, difficulty_to_target
+    header = bytes(80)
+    target = difficulty_to_target(8)
+    nonce, hashes = search_range(header, None, 0, 100000, target)
+    assert isinstance(nonce, int)
+    assert hashes == nonce + 1
+    assert verify_target(generate_hash(header, nonce), target)
+    for counter in range(nonce):
+        assert not verify_target(generate_hash(header, counter), target)
+
+
+def test_find_nonce_header():
+    from pynunzen.ledger.pow import find_nonce, generate_hash, verify_hash
+    header = b"\x01" * 80
+    nonce = find_nonce(header, 6, chunk_size=100)
+    assert verify_hash(generate_hash(header, nonce), 6)
+
+
+def test_generate_hash_header():
+    import hashlib
+    from pynunzen.ledger.pow import generate_hash
+    header = bytes(80)
+    expected = hashlib.sha256(hashlib.sha256(header + b"\x05" + bytes(7)).digest()).hexdigest()
+    assert generate_hash(header, 5) == expected
+
+
+def test_find_nonce_pool_deprecated():
+    from pynunzen.ledger.pow import find_nonce
+    with pytest.deprecated_call():
+        nonce = find_nonce(TEST_VALUE, 4, "0123456789ABCDEF")
+    assert nonce == find_nonce(TEST_VALUE, 4)
+
+
+def test_find_nonce_requirement_missing():
+    from pynunzen.ledger.pow import find_nonce, search_range, find_nonce_parallel
+    with pytest.raises(ValueError):
+        search_range(TEST_VALUE, None, 0, 10)
+    with pytest.raises(ValueError):
+        search_range(b"\x00" * 80, None, 0, 10)
+    with pytest.raises(ValueError):
+        find_nonce(TEST_VALUE)
+    with pytest.raises(ValueError):
+        find_nonce_parallel(TEST_VALUE, workers=2)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_serialization
+----------------------------------
+
+Tests for `serialization` module.
+"""
+
+import pytest
+
+
+def test_encode_varint():
+    from pynunzen.ledger.serialization import encode_varint
+    assert encode_varint(0) == b"\x00"
+    assert encode_varint(252) == b"\xfc"
+    assert encode_varint(253) == b"\xfd\xfd\x00"
+    assert encode_varint(0x10000) == b"\xfe\x00\x00\x01\x00"
+    assert encode_varint(0x100000000) == b"\xff\x00\x00\x00\x00\x01\x00\x00\x00"
+
+
+def test_encode_varint_negative():
+    from pynunzen.ledger.serialization import encode_varint
+    with pytest.raises(ValueError):
+        encode_varint(-1)
+
+
+def test_encode_string():
+    from pynunzen.ledger.serialization import encode_string
+    assert encode_string(None) == b"\x00"
+    assert encode_string("") == b"\x01\x00"
+    assert encode_string("Foo") == b"\x01\x03Foo"
+
+
+def test_encode_value():
+    from pynunzen.ledger.serialization import encode_value
+    assert encode_value(None) == b"\x00"
+    assert encode_value("Foo") == b"\x01\x03Foo"
+    assert encode_value(b"Foo") == b"\x02\x03Foo"
+    assert encode_value(1) == b"\x03\x01\x00\x00\x00\x00\x00\x00\x00"
+
+
+def test_encode_value_fail():
+    from pynunzen.ledger.serialization import encode_value
+    with pytest.raises(ValueError):
+        encode_value(1.5)
+
+
+def test_decode_varint():
+    from pynunzen.ledger.serialization import encode_varint, decode_varint
+    for value in (0, 252, 253, 0xffff, 0x10000, 0x100000000):
+        data = encode_varint(value)
+        assert decode_varint(memoryview(data), 0) == (value, len(data))
+
+
+def test_decode_string():
+    from pynunzen.ledger.serialization import encode_string, decode_string
+    data = encode_string(None) + encode_string("") + encode_string("Hällo")
+    buf = memoryview(data)
+    value, offset = decode_string(buf, 0)
+    assert value is None
+    value, offset = decode_string(buf, offset)
+    assert value == ""
+    value, offset = decode_string(buf, offset)
+    assert value == "Hällo"
+    assert offset == len(data)
+
+
+def test_decode_value():
+    from pynunzen.ledger.serialization import encode_value, decode_value
+    for value in (None, "foo", b"\x00\x01", -5, 2**40):
+        data = encode_value(value)
+        assert decode_value(memoryview(data), 0) == (value, len(data))
+
+
+def test_decode_truncated():
+    from pynunzen.ledger.serialization import encode_string, decode_string
+    data = encode_string("foobar")[:-1]
+    with pytest.raises(ValueError):
+        decode_string(memoryview(data), 0)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_store
+----------------------------------
+
+Tests for `store` module.
+"""
+
+import os
+import pytest
+from pynunzen.ledger.blockchain import Blockchain
+from .test_ledger import blockchain
+from .test_wallet import alice_wallet, bob_wallet
+
+
+@pytest.fixture
+def store(tmpdir):
+    from pynunzen.ledger.store import BlockStore
+    store = BlockStore(str(tmpdir.join("blocks")))
+    yield store
+    store.close()
+
+
+def test_store_append(store, blockchain):
+    for block in blockchain.blocks:
+        store.append(block)
+    assert len(store) == blockchain.length
+    for height, block in enumerate(blockchain.blocks):
+        assert store[height].address == block.address
+        assert store.address(height) == block.address
+        assert store.timestamp(height) == block.timestamp
+    assert store[-1].address == blockchain.end.address
+    assert list(store.headers(8)) == [(b.address, b.timestamp) for b in blockchain.blocks[8:]]
+    with pytest.raises(IndexError):
+        store[blockchain.length]
+
+
+def test_store_reopen(store, blockchain):
+    from pynunzen.ledger.store import BlockStore
+    for block in blockchain.blocks:
+        store.append(block)
+    store.close()
+    reopened = BlockStore(store.path)
+    try:
+        assert len(reopened) == blockchain.length
+        assert [block.address for block in reopened] == [block.address for block in blockchain.blocks]
+    finally:
+        reopened.close()
+
+
+def test_store_segments(tmpdir, blockchain):
+    from pynunzen.ledger.store import BlockStore, SEGMENT_NAME
+    path = str(tmpdir.join("blocks"))
+    store = BlockStore(path, segment_size=1024)
+    try:
+        for block in blockchain.blocks:
+            store.append(block)
+        assert os.path.exists(os.path.join(path, SEGMENT_NAME.format(1)))
+        assert [block.address for block in store] == [block.address for block in blockchain.blocks]
+    finally:
+        store.close()
+
+
+def test_store_pop(store, blockchain):
+    for block in blockchain.blocks:
+        store.append(block)
+    assert store.pop().address == blockchain.end.address
+    assert len(store) == blockchain.length - 1
+    store.append(blockchain.end)
+    assert store[-1].address == blockchain.end.address
+    assert len(store) == blockchain.length
+
+
+def test_blockchain_store(store, blockchain):
+    from pynunzen.ledger.blockchain import GENESIS_BLOCK_ADDRESS
+    from pynunzen.ledger.store import BlockStore
+    chain = Blockchain(store)
+    assert len(store) == 1
+    assert store.address(0) == GENESIS_BLOCK_ADDRESS
+    chain.extend(blockchain.blocks[1:])
+    store.close()
+
+    reopened = BlockStore(store.path)
+    try:
+        chain = Blockchain(reopened)
+        assert chain.length == blockchain.length
+        assert chain.end.address == blockchain.end.address
+        assert chain.median_time_past == blockchain.median_time_past
+        assert chain.next_difficulty == blockchain.next_difficulty
+        tx = blockchain.blocks[3].data[0]
+        assert chain.get_transaction(tx.hash).hash == tx.hash
+        assert chain.get_block(blockchain.blocks[2].address).index == 2
+        chain.pop()
+        assert len(reopened) == blockchain.length - 1
+        assert chain.get_block(blockchain.end.address) is None
+    finally:
+        reopened.close()
+
+
+def test_block_sequence_cache(store, blockchain):
+    from pynunzen.ledger.store import BlockSequence
+    for block in blockchain.blocks:
+        store.append(block)
+    blocks = BlockSequence(store, cache_size=2)
+    first = blocks[1]
+    assert blocks.stats == {"size": 1, "hits": 0, "misses": 1}
+    assert blocks[1] is first
+    assert blocks.hits == 1
+    blocks[2]
+    blocks[3]
+    # Block 1 is the least recently used block and was evicted
+    assert blocks[1] is not first
+    assert blocks.stats == {"size": 2, "hits": 1, "misses": 4}
+    assert blocks[-1].address == blockchain.end.address
+    assert [block.index for block in blocks[2:5]] == [2, 3, 4]
+
+
+def test_block_sequence_iter(store, blockchain):
+    from pynunzen.ledger.store import BlockSequence
+    for block in blockchain.blocks:
+        store.append(block)
+    blocks = BlockSequence(store, cache_size=2)
+    assert [block.address for block in blocks] == [block.address for block in blockchain.blocks]
+    assert blocks.stats["size"] == 0
+
+
+def test_block_sequence_append_pop(store, blockchain):
+    from pynunzen.ledger.store import BlockSequence
+    blocks = BlockSequence(store)
+    for block in blockchain.blocks:
+        blocks.append(block)
+    assert blocks[-1] is blockchain.end
+    assert blocks.pop() is blockchain.end
+    assert len(blocks) == len(store) == blockchain.length - 1
+    assert blocks[-1] is blockchain.blocks[-2]
+
+
+def test_store_torn_segment_write(store, blockchain):
+    from pynunzen.ledger.store import BlockStore, SEGMENT_NAME
+    for block in blockchain.blocks[:-1]:
+        store.append(block)
+    store.close()
+    # The process crashed after writing the block to the segment but
+    # before writing the index record.
+    with open(os.path.join(store.path, SEGMENT_NAME.format(0)), "ab") as segment:
+        segment.write(blockchain.end.to_bytes()[:20])
+    reopened = BlockStore(store.path)
+    try:
+        assert len(reopened) == blockchain.length - 1
+        reopened.append(blockchain.end)
+        assert reopened[-1].address == blockchain.end.address
+    finally:
+        reopened.close()
+
+
+def test_store_torn_index_write(store, blockchain):
+    from pynunzen.ledger.store import BlockStore, INDEX_NAME, INDEX_HEADER, INDEX_RECORD
+    for block in blockchain.blocks:
+        store.append(block)
+    store.close()
+    with open(os.path.join(store.path, INDEX_NAME), "r+b") as index:
+        index.truncate(INDEX_HEADER.size + (blockchain.length - 1) * INDEX_RECORD.size + 7)
+    reopened = BlockStore(store.path)
+    try:
+        assert len(reopened) == blockchain.length - 1
+        reopened.append(blockchain.end)
+        assert [block.address for block in reopened] == [block.address for block in blockchain.blocks]
+    finally:
+        reopened.close()
+
+
+def test_store_index_version(store, blockchain):
+    from pynunzen.ledger.store import BlockStore, INDEX_NAME, INDEX_HEADER, INDEX_MAGIC, INDEX_VERSION
+    for block in blockchain.blocks:
+        store.append(block)
+    store.close()
+    path = os.path.join(store.path, INDEX_NAME)
+    with open(path, "r+b") as index:
+        assert index.read(INDEX_HEADER.size) == INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION)
+        index.seek(0)
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION + 1))
+    with pytest.raises(ValueError):
+        BlockStore(store.path)
+    # The index is left untouched.
+    assert os.path.getsize(path) > INDEX_HEADER.size
+
+
+def test_store_torn_index_header(tmpdir, blockchain):
+    from pynunzen.ledger.store import BlockStore, INDEX_NAME, INDEX_HEADER, INDEX_MAGIC, INDEX_VERSION
+    path = str(tmpdir.join("blocks"))
+    os.makedirs(path)
+    with open(os.path.join(path, INDEX_NAME), "wb") as index:
+        index.write(INDEX_MAGIC[:2])
+    store = BlockStore(path)
+    try:
+        assert len(store) == 0
+        store.append(blockchain.end)
+        assert store[0].address == blockchain.end.address
+    finally:
+        store.close()
+    with open(os.path.join(path, INDEX_NAME), "rb") as index:
+        assert index.read(INDEX_HEADER.size) == INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION)
+
+
+def test_store_torn_pop(tmpdir, blockchain):
+    from pynunzen.ledger.store import BlockStore, SEGMENT_NAME
+    path = str(tmpdir.join("blocks"))
+    store = BlockStore(path, segment_size=1024)
+    for block in blockchain.blocks:
+        store.append(block)
+    number, offset = store._record(-1)[:2]
+    store.close()
+    # The process crashed after the block was removed from its segment
+    # but before its index record was removed.
+    with open(os.path.join(path, SEGMENT_NAME.format(number)), "r+b") as segment:
+        segment.truncate(offset)
+    reopened = BlockStore(path, segment_size=1024)
+    try:
+        assert len(reopened) == blockchain.length - 1
+        reopened.append(blockchain.end)
+        assert reopened[-1].address == blockchain.end.address
+    finally:
+        reopened.close()
+
+
+def test_blockchain_store_work(store, blockchain):
+    from pynunzen.ledger.store import BlockStore
+    for block in blockchain.blocks:
+        store.append(block)
+    store.close()
+    reopened = BlockStore(store.path)
+    try:
+        chain = Blockchain(reopened)
+        misses = chain.blocks.misses
+        # The work is calculated from the index without reading blocks.
+        assert chain.work == blockchain.work
+        assert chain.blocks.misses == misses
+    finally:
+        reopened.close()
@@ -54,11 +54,40 @@ def coin_container():
 
 
 def test_generate_hash(transaction_wrong_ref):
-    from pynunzen.ledger.transaction import generate_transaction_hash
+    from pynunzen.ledger.transaction import generate_transaction_hash, __legacy_transaction_version__
+    transaction_wrong_ref.version = __legacy_transaction_version__
     transaction_wrong_ref.time = 1495142866
     assert generate_transaction_hash(transaction_wrong_ref) == "1511ce04090e426033a2ea906bc5e383a8c325ec806310fcf6023fca4552fa18"
 
 
+def test_generate_hash_binary(transaction_wrong_ref):
+    from pynunzen.helpers import double_sha256_digest
+    from pynunzen.ledger.transaction import generate_transaction_hash, encode_transaction
+    transaction_wrong_ref.time = "2017-05-18 21:27:46.000000"
+    tx_hash = generate_transaction_hash(transaction_wrong_ref)
+    assert tx_hash == double_sha256_digest(encode_transaction(transaction_wrong_ref)).hex()
+    transaction_wrong_ref.outputs[1].data.value += 1
+    assert generate_transaction_hash(transaction_wrong_ref) != tx_hash
+
+
+def test_encode_transaction(transaction_wrong_ref):
+    from pynunzen.ledger.transaction import encode_transaction
+    transaction_wrong_ref.time = "2017-05-18 21:27:46.000000"
+    encoded = encode_transaction(transaction_wrong_ref)
+    assert encoded.startswith(b"\x01\x032.0\x01\x1a2017-05-18 21:27:46.000000\x01")
+    # Coins are encoded as integer number of base units
+    assert (99900000000).to_bytes(8, "little") in encoded
+    assert (50000000).to_bytes(8, "little") in encoded
+
+
+def test_legacy_transaction(transaction_wrong_ref):
+    from pynunzen.ledger.transaction import Transaction, __legacy_transaction_version__, _check_hash
+    tx = Transaction(transaction_wrong_ref.inputs, transaction_wrong_ref.outputs,
+                     version=__legacy_transaction_version__)
+    assert tx.version == __legacy_transaction_version__
+    assert _check_hash(tx) is True
+
+
 def test_validate_transaction(transaction, blockchain):
     from pynunzen.ledger.transaction import validate_transaction
     assert validate_transaction(transaction, blockchain) is True
@@ -71,7 +100,7 @@ def test_validate_transaction_fails_ref(transaction_wrong_ref, blockchain):
 
 def test_validate_transaction_fails_syn(transaction, blockchain):
     from pynunzen.ledger.transaction import validate_transaction
-    transaction.foo = False
+    del transaction.time
     assert validate_transaction(transaction, blockchain) is False
 
 
@@ -82,7 +111,10 @@ def test_check_syntax(transaction):
 
 def test_check_syntax_fail(transaction):
     from pynunzen.ledger.transaction import _check_syntax
-    transaction.foo = False
+    # A transaction has no other attributes than its slots.
+    with pytest.raises(AttributeError):
+        transaction.foo = False
+    del transaction.hash
     assert _check_syntax(transaction) is False
 
 
@@ -105,6 +137,24 @@ def test_check_hash_fail(transaction):
     transaction.hash = transaction.hash + "x"
     assert _check_hash(transaction) is False
 
+def test_check_hash_cached(transaction, monkeypatch):
+    from pynunzen.ledger import transaction as module
+    calls = []
+    generate = module.generate_transaction_hash
+    monkeypatch.setattr(module, "generate_transaction_hash",
+                        lambda tx: calls.append(tx) or generate(tx))
+    assert module._check_hash(transaction) is True
+    assert calls == []
+
+
+def test_content_hash_invalidated(transaction):
+    from pynunzen.ledger.transaction import _check_hash
+    tx_hash = transaction.content_hash
+    transaction.outputs = transaction.outputs[:1]
+    assert transaction.content_hash != tx_hash
+    assert _check_hash(transaction) is False
+
+
 def test_data_container_check(data_container):
     with pytest.raises(NotImplementedError):
         data_container.check("XXX")
@@ -117,3 +167,75 @@ def test_coin_container_check(coin_container):
 def test_coin_container_check_fail_type(coin_container):
     with pytest.raises(ValueError):
         coin_container.check("XXX")
+
+
+def test_coin_container_amount(coin_container):
+    from decimal import Decimal
+    from pynunzen.ledger.transaction import Coin
+    assert coin_container.amount == 10000
+    assert coin_container.value == Decimal("0.0001")
+    assert Coin(1000).amount == 100000000000
+    assert str(Coin("0.5").value) == "0.5"
+    assert str(Coin(1000).value) == "1000"
+    assert Coin.from_units(12345).value == Decimal("0.00012345")
+    # Fractions of a base unit can not be converted exactly.
+    with pytest.raises(ValueError):
+        Coin("0.000000015")
+    assert Coin("0.000000010").amount == 1
+
+
+def test_coin_container_legacy_value():
+    import pickle
+    from pynunzen.ledger.transaction import Coin
+    # The value keeps the exponent of the amount the coin was created
+    # with, as legacy transactions are hashed over its string.
+    assert str(Coin("1.50").value) == "1.50"
+    assert str(Coin(0.5).value) == "0.5"
+    assert str(pickle.loads(pickle.dumps(Coin("1.50"))).value) == "1.50"
+
+
+def test_coin_container_value_setter(coin_container):
+    coin_container.value += 1
+    assert coin_container.amount == 100010000
+
+
+def test_decimal_context_untouched():
+    import decimal
+    import pynunzen.ledger.transaction  # noqa
+    assert decimal.getcontext().prec == decimal.DefaultContext.prec
+
+
+def test_transaction_from_bytes(transaction):
+    from pynunzen.ledger.transaction import Transaction
+    decoded = Transaction.from_bytes(transaction.to_bytes())
+    assert decoded.hash == transaction.hash
+    assert decoded.time == transaction.time
+    assert decoded.outputs[1].data.value == transaction.outputs[1].data.value
+    assert decoded.to_bytes() == transaction.to_bytes()
+
+
+def test_transaction_from_bytes_legacy(transaction):
+    from pynunzen.ledger.transaction import Transaction, __legacy_transaction_version__
+    transaction.version = __legacy_transaction_version__
+    transaction.hash = transaction.content_hash
+    decoded = Transaction.from_bytes(transaction.to_bytes())
+    assert decoded.version == __legacy_transaction_version__
+    assert decoded.hash == transaction.hash
+
+
+def test_transaction_from_bytes_fail(transaction):
+    from pynunzen.ledger.transaction import Transaction
+    data = transaction.to_bytes()
+    with pytest.raises(ValueError):
+        Transaction.from_bytes(data[:-3])
+    with pytest.raises(ValueError):
+        Transaction.from_bytes(data + b"\x00")
+
+
+def test_coin_container_slots(coin_container):
+    from pynunzen.ledger.transaction import Data, Coin
+    assert isinstance(coin_container, Data)
+    assert not hasattr(coin_container, "__dict__")
+    # The amount is stored in the slot of Data.
+    assert Coin.__slots__ == ("_exponent",)
+    assert isinstance(Coin.value, property)
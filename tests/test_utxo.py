@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_utxo
+----------------------------------
+
+Tests for `utxo` module.
+"""
+
+import pytest
+from .test_ledger import blockchain
+from .test_wallet import alice_wallet, bob_wallet
+
+
+@pytest.fixture
+def spending_block(blockchain, alice_wallet, bob_wallet):
+    """Fixture for a block which spends the output of the first block."""
+    from pynunzen.ledger.blockchain import generate_new_block
+    from pynunzen.ledger.transaction import (
+        Transaction, Input, Output, Coin, Data,
+        LockScript, UnlockScript, CoinbaseInput
+    )
+    alice = list(alice_wallet.addresses)[0]
+    bob = list(bob_wallet.addresses)[0]
+    funding = blockchain.blocks[1].data[0]
+    cb_tx = Transaction([CoinbaseInput(Data("cb"), UnlockScript(None), UnlockScript(None))],
+                        [Output(Coin(50), LockScript(bob))])
+    tx = Transaction([Input(Coin(1000), UnlockScript(alice), funding.hash, 0)],
+                     [Output(Coin(600), LockScript(bob)), Output(Coin(400), LockScript(alice))])
+    return generate_new_block(blockchain, [cb_tx, tx])
+
+
+@pytest.fixture
+def chained_block(blockchain, alice_wallet, bob_wallet):
+    """Fixture for a block with a transaction which spends an output
+    created earlier in the same block."""
+    from pynunzen.ledger.blockchain import generate_new_block
+    from pynunzen.ledger.transaction import (
+        Transaction, Input, Output, Coin, Data,
+        LockScript, UnlockScript, CoinbaseInput
+    )
+    alice = list(alice_wallet.addresses)[0]
+    bob = list(bob_wallet.addresses)[0]
+    funding = blockchain.blocks[1].data[0]
+    cb_tx = Transaction([CoinbaseInput(Data("cb"), UnlockScript(None), UnlockScript(None))],
+                        [Output(Coin(50), LockScript(bob))])
+    tx = Transaction([Input(Coin(1000), UnlockScript(alice), funding.hash, 0)],
+                     [Output(Coin(600), LockScript(bob)), Output(Coin(400), LockScript(alice))])
+    tx2 = Transaction([Input(Coin(400), UnlockScript(alice), tx.hash, 1)],
+                      [Output(Coin(400), LockScript(bob))])
+    return generate_new_block(blockchain, [cb_tx, tx, tx2])
+
+
+def test_utxo_connect(blockchain, spending_block):
+    from pynunzen.ledger.utxo import UTXOSet, utxo_reference
+    utxo = UTXOSet()
+    for block in blockchain.blocks:
+        utxo.connect(block)
+    assert len(utxo) == blockchain.length
+    funding = utxo_reference(blockchain.blocks[1].data[0].hash, 0)
+    assert funding in utxo
+
+    spent, created = utxo.connect(spending_block)
+    assert [reference for reference, _ in spent] == [funding]
+    assert len(created) == 3
+    assert funding not in utxo
+    assert utxo.get(utxo_reference(spending_block.data[1].hash, 1)).data.amount == 40000000000
+    assert utxo.undo[spending_block.address] == spent
+
+
+def test_utxo_disconnect(blockchain, spending_block):
+    from pynunzen.ledger.utxo import UTXOSet
+    utxo = UTXOSet()
+    for block in blockchain.blocks:
+        utxo.connect(block)
+    before = dict(utxo.outputs)
+    utxo.connect(spending_block)
+    restored, removed = utxo.disconnect(spending_block)
+    assert len(restored) == 1
+    assert len(removed) == 3
+    assert utxo.outputs == before
+    assert spending_block.address not in utxo.undo
+    with pytest.raises(ValueError):
+        utxo.disconnect(spending_block)
+
+
+def test_utxo_undo_depth(blockchain):
+    from pynunzen.ledger.utxo import UTXOSet
+    utxo = UTXOSet(undo_depth=3)
+    for block in blockchain.blocks:
+        utxo.connect(block)
+    # Undo data is only kept for the last three blocks.
+    assert list(utxo.undo) == [block.address for block in blockchain.blocks[-3:]]
+    for block in reversed(blockchain.blocks[-3:]):
+        utxo.disconnect(block)
+    with pytest.raises(ValueError):
+        utxo.disconnect(blockchain.blocks[-4])
+
+
+def test_core_utxo_incremental(blockchain, alice_wallet, bob_wallet, spending_block):
+    from pynunzen.core import Core
+    alice = Core(blockchain, alice_wallet)
+    bob = Core(blockchain, bob_wallet)
+    blockchain.append(spending_block)
+    assert alice.balance == 3400
+    assert bob.balance == 6650
+    assert len(alice.global_utxo) == blockchain.length + 1
+    address = list(bob_wallet.addresses)[0]
+    assert bob.get_address_balance(address) == 6650
+    assert bob.balance_units == sum(coin.amount for coin in bob.utxo.values())
+    blockchain.pop()
+    assert alice.balance == 4000
+    assert bob.balance == 6000
+    assert bob.get_address_balance(address) == 6000
+
+
+@pytest.fixture
+def utxo_db(tmpdir):
+    from pynunzen.ledger.utxo import SQLiteUTXOSet
+    utxo = SQLiteUTXOSet(str(tmpdir.join("utxo.db")), cache_size=4)
+    yield utxo
+    utxo.close()
+
+
+def test_sqlite_utxo(blockchain, spending_block, utxo_db):
+    from pynunzen.ledger.utxo import UTXOSet, utxo_reference
+    utxo = UTXOSet()
+    for block in blockchain.blocks:
+        utxo.connect(block)
+        utxo_db.connect(block)
+    # The cache was written in batches
+    assert utxo_db.flushes > 1
+    assert len(utxo_db) == len(utxo)
+    assert sorted(r for r, _ in utxo_db.items()) == sorted(r for r, _ in utxo.items())
+    assert utxo_db.best_block == blockchain.end.address
+
+    funding = utxo_reference(blockchain.blocks[1].data[0].hash, 0)
+    utxo_db.connect(spending_block)
+    assert funding not in utxo_db
+    utxo_db.flush()
+    restored, removed = utxo_db.disconnect(spending_block)
+    assert restored[0][0] == funding
+    assert restored[0][1].data.amount == 100000000000
+    assert len(removed) == 3
+    assert funding in utxo_db
+    assert utxo_db.best_block == blockchain.end.address
+
+
+def test_sqlite_utxo_schema_version(tmpdir, blockchain):
+    import sqlite3
+    from pynunzen.ledger.utxo import SQLiteUTXOSet
+    path = str(tmpdir.join("utxo.db"))
+    utxo = SQLiteUTXOSet(path)
+    utxo.connect(blockchain.blocks[0])
+    utxo.clear()
+    utxo.close()
+    # The version is kept when the set is cleared.
+    SQLiteUTXOSet(path).close()
+    db = sqlite3.connect(path)
+    with db:
+        db.execute("UPDATE meta SET value = '0' WHERE key = 'schema_version'")
+    db.close()
+    with pytest.raises(ValueError):
+        SQLiteUTXOSet(path)
+    # A database without version but with data is of an older version.
+    path = str(tmpdir.join("old.db"))
+    db = sqlite3.connect(path)
+    with db:
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute("INSERT INTO meta VALUES ('best_block', 'x')")
+    db.close()
+    with pytest.raises(ValueError):
+        SQLiteUTXOSet(path)
+
+
+def test_sqlite_utxo_undo_pruned(tmpdir, blockchain):
+    from pynunzen.ledger.utxo import SQLiteUTXOSet
+    utxo = SQLiteUTXOSet(str(tmpdir.join("utxo.db")), cache_size=4, undo_depth=3)
+    try:
+        for block in blockchain.blocks:
+            utxo.connect(block)
+        utxo.flush()
+        rows = utxo._db.execute("SELECT height FROM undo ORDER BY height").fetchall()
+        assert [height for height, in rows] == [block.index for block in blockchain.blocks[-3:]]
+        for block in reversed(blockchain.blocks[-3:]):
+            utxo.disconnect(block)
+        with pytest.raises(ValueError):
+            utxo.disconnect(blockchain.blocks[-4])
+    finally:
+        utxo.close()
+
+
+def test_core_build_utxo_streams_blocks(tmpdir, blockchain, alice_wallet):
+    from pynunzen.core import Core
+    from pynunzen.ledger.blockchain import Blockchain
+    from pynunzen.ledger.store import BlockStore
+    store = BlockStore(str(tmpdir.join("blocks")))
+    try:
+        chain = Blockchain(store, cache_size=2)
+        chain.extend(blockchain.blocks[1:])
+        cached = list(chain.blocks._cache)
+        core = Core(chain, alice_wallet)
+        assert core.balance == 4000
+        # Building the UTXO set did not evict the blocks at the end.
+        assert list(chain.blocks._cache) == cached
+        assert chain.blocks.misses == 0
+    finally:
+        store.close()
+
+
+def test_sqlite_utxo_recover(tmpdir, blockchain, alice_wallet, spending_block):
+    from pynunzen.core import Core
+    from pynunzen.ledger.utxo import SQLiteUTXOSet
+    path = str(tmpdir.join("utxo.db"))
+    utxo = SQLiteUTXOSet(path)
+    core = Core(blockchain, alice_wallet, utxo)
+    blockchain.unsubscribe(core._on_change)
+    utxo.close()
+
+    # Changes which are not flushed are lost on a crash
+    utxo = SQLiteUTXOSet(path, cache_size=1000)
+    core = Core(blockchain, alice_wallet, utxo)
+    blockchain.append(spending_block)
+    assert core.balance == 3400
+    blockchain.unsubscribe(core._on_change)
+    utxo._db.close()
+
+    utxo = SQLiteUTXOSet(path)
+    try:
+        assert utxo.best_block == blockchain.blocks[-2].address
+        core = Core(blockchain, alice_wallet, utxo)
+        assert utxo.best_block == blockchain.end.address
+        assert core.balance == 3400
+    finally:
+        utxo.close()
+
+
+def test_utxo_snapshot(tmpdir, blockchain, alice_wallet, spending_block):
+    from pynunzen.core import Core
+    from pynunzen.ledger.utxo import load_snapshot
+    path = str(tmpdir.join("utxo.snapshot"))
+    core = Core(blockchain, alice_wallet)
+    snapshot_hash = core.write_utxo_snapshot(path)
+    # The hash only depends on the content of the set
+    assert core.write_utxo_snapshot(path) == snapshot_hash
+    blockchain.append(spending_block)
+
+    utxo, address, height = load_snapshot(path, snapshot_hash=snapshot_hash)
+    assert address == blockchain.blocks[-2].address
+    assert height == blockchain.length - 2
+    assert len(utxo) == blockchain.length - 1
+    loaded = Core(blockchain, alice_wallet, utxo)
+    assert loaded.balance == core.balance == 3400
+    assert sorted(r for r, _ in utxo.items()) == sorted(r for r, _ in core.global_utxo.items())
+
+
+def test_utxo_snapshot_sqlite(tmpdir, blockchain, alice_wallet, utxo_db):
+    from pynunzen.core import Core
+    from pynunzen.ledger.utxo import load_snapshot
+    path = str(tmpdir.join("utxo.snapshot"))
+    snapshot_hash = Core(blockchain, alice_wallet).write_utxo_snapshot(path)
+    load_snapshot(path, utxo_db, snapshot_hash)
+    assert utxo_db.best_block == blockchain.end.address
+    core = Core(blockchain, alice_wallet, utxo_db)
+    assert core.balance == 4000
+    assert core.write_utxo_snapshot(str(tmpdir.join("copy.snapshot"))) == snapshot_hash
+
+
+def test_utxo_snapshot_fail(tmpdir, blockchain, alice_wallet):
+    from pynunzen.core import Core
+    from pynunzen.ledger.utxo import load_snapshot
+    path = tmpdir.join("utxo.snapshot")
+    snapshot_hash = Core(blockchain, alice_wallet).write_utxo_snapshot(str(path))
+    with pytest.raises(ValueError):
+        load_snapshot(str(path), snapshot_hash="00" * 32)
+    data = bytearray(path.read_binary())
+    data[20] ^= 0xff
+    path.write_binary(bytes(data))
+    with pytest.raises(ValueError):
+        load_snapshot(str(path))
+
+
+def test_utxo_snapshot_disconnect(tmpdir, blockchain, alice_wallet, spending_block):
+    from pynunzen.core import Core
+    from pynunzen.ledger.utxo import load_snapshot
+    path = str(tmpdir.join("utxo.snapshot"))
+    blockchain.append(spending_block)
+    core = Core(blockchain, alice_wallet)
+    core.write_utxo_snapshot(path)
+    blockchain.unsubscribe(core._on_change)
+
+    # A set loaded from a snapshot can disconnect the end of the
+    # blockchain.
+    utxo = load_snapshot(path)[0]
+    loaded = Core(blockchain, alice_wallet, utxo)
+    assert loaded.balance == 3400
+    blockchain.pop()
+    assert utxo.best_block == blockchain.end.address
+    assert loaded.balance == 4000
+
+
+def test_blockchain_pop_subscriber_fails(blockchain, alice_wallet):
+    from pynunzen.core import Core
+    from pynunzen.ledger.utxo import UTXOSet
+    core = Core(blockchain, alice_wallet, UTXOSet(undo_depth=1))
+    end = blockchain.end
+    blockchain.pop()
+    # The undo data of the next block was dropped, so the subscriber
+    # fails and the blockchain is left unchanged.
+    with pytest.raises(ValueError):
+        blockchain.pop()
+    assert blockchain.end is blockchain.blocks[-1]
+    assert blockchain.length == 10
+    assert core.global_utxo.best_block == blockchain.end.address
+    assert end.address != blockchain.end.address
+
+
+def test_utxo_snapshot_chunked(tmpdir, blockchain, alice_wallet, monkeypatch):
+    import pynunzen.ledger.utxo
+    from pynunzen.core import Core
+    from pynunzen.ledger.utxo import load_snapshot
+    path = str(tmpdir.join("utxo.snapshot"))
+    core = Core(blockchain, alice_wallet)
+    core.write_utxo_snapshot(path)
+    # Records are split over many chunks.
+    monkeypatch.setattr(pynunzen.ledger.utxo, "SNAPSHOT_CHUNK_SIZE", 7)
+    utxo = load_snapshot(path)[0]
+    assert sorted(r for r, _ in utxo.items()) == sorted(r for r, _ in core.global_utxo.items())
+    assert utxo.undo_items() == core.global_utxo.undo_items()
+
+
+def _check_spend_within_block(utxo, blockchain, chained_block):
+    from pynunzen.ledger.utxo import utxo_reference
+    for block in blockchain.blocks:
+        utxo.connect(block)
+    before = sorted(r for r, _ in utxo.items())
+    inner = utxo_reference(chained_block.data[1].hash, 1)
+    spent, created = utxo.connect(chained_block)
+    assert inner not in [reference for reference, _ in spent + created]
+    assert inner not in utxo
+    restored, removed = utxo.disconnect(chained_block)
+    assert inner not in [reference for reference, _ in restored + removed]
+    assert inner not in utxo
+    assert sorted(r for r, _ in utxo.items()) == before
+
+
+def test_utxo_spend_within_block(blockchain, chained_block):
+    from pynunzen.ledger.utxo import UTXOSet
+    _check_spend_within_block(UTXOSet(), blockchain, chained_block)
+
+
+def test_sqlite_utxo_spend_within_block(blockchain, chained_block, utxo_db):
+    _check_spend_within_block(utxo_db, blockchain, chained_block)
+
+
+def test_core_spend_within_block(blockchain, alice_wallet, chained_block):
+    from pynunzen.core import Core
+    core = Core(blockchain, alice_wallet)
+    blockchain.append(chained_block)
+    assert core.balance == 3000
+    blockchain.pop()
+    assert core.balance == 4000
+    assert len(core.utxo) == 4
@@ -107,3 +107,21 @@ def test_wallet_newaddress(newwallet):
     new_address = newwallet.get_new_address()
     assert len(addresses.keys()) < len(newwallet.addresses.keys())
     assert new_address in newwallet.addresses.keys()
+
+
+def test_wallet_addresses_cached(wallet, monkeypatch):
+    import pynunzen.node.wallet
+    addresses = wallet.addresses
+    calls = []
+    monkeypatch.setattr(pynunzen.node.wallet, "pubtoaddr", lambda key: calls.append(key))
+    assert wallet.addresses is addresses
+    assert wallet.address_set == frozenset(["1Bv2uUhZCTFUsARCH812qwCBx8fKCJ88Du"])
+    assert calls == []
+
+
+def test_wallet_address_set_invalidated(newwallet):
+    address_set = newwallet.address_set
+    new_address = newwallet.get_new_address()
+    assert new_address not in address_set
+    assert new_address in newwallet.address_set
+    assert len(newwallet.address_set) == 2